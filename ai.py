@@ -1,74 +1,407 @@
 import functools
+import heapq
 import itertools
 import logging
 from queue import PriorityQueue
+import time
 
+import assignment
 import gameboard
+import parallel
 import pathfinding
 from client import AntMove
-from gridutils import Coordinate as C
+from metrics import NULL_METRICS
 
 _gamestate = None
 
 def surrounding_tiles(tile, radius):
+    tile_at = _gamestate.get_gameboard().tile_at
+    center = tile.coordinate
     for x in range(-1 * radius, radius + 1):
         for y in range(-1 * radius, radius + 1):
             if x == 0 and y == 0:
                 continue
-            coordinate = C(tile.coordinate.x + x, tile.coordinate.y + y)
-            yield _gamestate.get_gameboard().get_tile(coordinate)
+            yield tile_at(center.x + x, center.y + y)
 
 def nearby_enemy_ants(coordinate, radius):
     gb = _gamestate.get_gameboard()
-    tile = gb.get_tile(coordinate)
-    enemy_ant_count = 0
-    for nearby_tile in surrounding_tiles(tile, radius):
-        entity = nearby_tile.get_entity()
-        if isinstance(entity, gameboard.Ant) and \
-                not gb.tile_is_friendly(tile):
-            enemy_ant_count += 1
-    return enemy_ant_count
+    return gb.enemy_ant_counts().count_within(gb.index_of(coordinate), radius)
 
 def is_food(tile):
     return isinstance(tile.get_entity(), gameboard.Food)
 
+def deadline_passed(deadline):
+    return deadline is not None and time.monotonic() >= deadline
+
+def resolve_moves(plans, occupied):
+    """
+    Picks a destination for the ant of every MovePlan in plans, so that no
+    two ants end up on the same tile and no two ants swap tiles. occupied
+    holds the tile indexes of all friendly ants, planned or not; ants
+    without a plan stay where they are.
+
+    Every ant starts out wanting its first step. Where several ants want
+    the same tile, the one with the fewest steps left to its target gets
+    it and the others fall back to their next step, until no ant is in
+    another's way. Returns a dict mapping ant IDs to tile indexes.
+    """
+    choices = dict((plan.ant_id, 0) for plan in plans)
+    planned_at = dict((plan.frm, plan) for plan in plans)
+
+    def destination(plan):
+        choice = choices[plan.ant_id]
+        if choice < len(plan.steps):
+            return plan.steps[choice]
+        return plan.frm
+
+    def precedence(plan):
+        return (choices[plan.ant_id], len(plan.path), plan.ant_id)
+
+    while True:
+        destinations = dict((plan.ant_id, destination(plan)) for plan in plans)
+        claims = dict()
+        for plan in plans:
+            claims.setdefault(destinations[plan.ant_id], []).append(plan)
+        # The IDs of the ants that give way. Both tiles of a swap find the
+        # same one, which still only falls back one step.
+        losers = set()
+        for index, claimants in claims.items():
+            occupant = planned_at.get(index)
+            if index in occupied and (
+                    occupant is None or
+                    destinations[occupant.ant_id] == index):
+                # The ant on this tile is staying there.
+                losers.update(
+                    p.ant_id for p in claimants if p is not occupant
+                )
+                continue
+            claimants.sort(key=precedence)
+            losers.update(p.ant_id for p in claimants[1:])
+            winner = claimants[0]
+            if occupant is not None and \
+                    destinations[occupant.ant_id] == winner.frm:
+                losers.add(max(winner, occupant, key=precedence).ant_id)
+        if not losers:
+            return destinations
+        for ant_id in losers:
+            choices[ant_id] += 1
+
 
 class JohnAI(object):
-    def __init__(self, renderer=None):
+    # Landmark distances are recomputed at most this often once new walls
+    # have been revealed.
+    LANDMARK_REFRESH_TURNS = 20
+    # Tunable weights of the objective priorities; lower priorities are
+    # handled first. Any of them can be overridden through __init__.
+    DEFAULT_WEIGHTS = {
+        # Added per tile of distance between our hill and the food.
+        'food_distance': 100,
+        # Subtracted for the first food near a food objective; doubles for
+        # every further one.
+        'food_cluster': 100,
+        'ant_hill_base': 500,
+        # Added per enemy ant near an enemy hill.
+        'ant_hill_enemy': 200,
+        # Subtracted when no enemy ants are near an enemy hill.
+        'ant_hill_undefended': 2000,
+        # Friendly ant counts up to which we keep the first, second, ...
+        # number of defenders at our hill; beyond them we keep the last.
+        'defender_thresholds': (5, 10),
+        'defender_counts': (1, 3, 5),
+        # Added to every explore objective, so that food up to a thousand
+        # tiles further from our hill than the frontier is taken first.
+        'explore_base': 100000,
+        # Added per tile of distance between our hill and the frontier.
+        'explore_distance': 100,
+    }
+
+    # How ants are assigned to objectives: all at once with the least total
+    # distance, or objective by objective, each taking the closest ants.
+    # Matching is experimental: it has not yet won more games than greedy
+    # assignment, which is the default.
+    ASSIGNMENT_STRATEGIES = ('matching', 'greedy')
+    # The number of nearest objectives every ant may be matched to.
+    ASSIGNMENT_CANDIDATES = 8
+
+    def __init__(self, renderer=None, landmark_count=0, weights=None,
+                 metrics=None, assignment='greedy', workers=0):
         self.logger = logging.getLogger('ants.ai.JohnAI')
+        assert assignment in self.ASSIGNMENT_STRATEGIES, \
+            'Unknown assignment strategy: {0}'.format(assignment)
+        self.assignment = assignment
+        # The number of processes to plan moves in; 0 plans them in this
+        # one.
+        self.workers = workers
+        self.planner = None
+        if metrics is None:
+            metrics = NULL_METRICS
+        self.metrics = metrics
+        self.weights = dict(self.DEFAULT_WEIGHTS)
+        if weights:
+            unknown = set(weights) - set(self.DEFAULT_WEIGHTS)
+            assert not unknown, 'Unknown weights: {0}'.format(unknown)
+            self.weights.update(weights)
         self.ant_manager = AntManager()
         self.objective_manager = ObjectiveManager()
         self.renderer = renderer
+        self.landmark_count = landmark_count
+        self.landmarks = None
+        self._landmarks_turn = None
 
     def initialize(self, gamestate):
         global _gamestate
         _gamestate = gamestate
         self.gamestate = gamestate
         self.gameboard = self.gamestate.get_gameboard()
-        self.pathfinder = pathfinding.Pathfinder(self.gameboard)
+        heuristic = None
+        if self.landmark_count > 0:
+            self.landmarks = pathfinding.LandmarkHeuristic(
+                self.gameboard, self.landmark_count
+            )
+            # Prepared on the first turn, once the server has shown us walls.
+            self._landmarks_turn = None
+            heuristic = self.landmarks
+        self.pathfinder = pathfinding.Pathfinder(
+            self.gameboard, heuristic=heuristic
+        )
+        if self.workers > 0:
+            self.planner = parallel.ParallelPlanner(
+                self.gameboard, self.workers, landmarks=self.landmarks
+            )
+
+    def close(self):
+        """
+        Stops the planner processes, if any.
+        """
+        if self.planner is not None:
+            self.planner.close()
+
+    def execute(self, gamestate, deadline=None):
+        """
+        Returns the list of AntMoves to make this turn.
 
-    def execute(self, gamestate):
+        If deadline, a time.monotonic() value, is given, ants that have not
+        been planned by then take a cheap greedy step toward their objective
+        instead of searching for a path, and searches and the assignment of
+        ants to objectives stop where they are when it passes.
+        """
+        global _gamestate
+        # Several AIs may take turns within one process.
+        _gamestate = gamestate
         self.logger.info('Executing for turn %d', gamestate.turn_number)
-        self.ant_manager.update_ants()
-        self.disband_obsolete_squads()
-        self.update_objectives()
-        prioritized_objectives = self.objective_manager.prioritize_by(
-            self.objective_priority
+        metrics = self.metrics
+        path_cache = self.pathfinder.path_cache
+        if metrics.enabled:
+            counters = (
+                self.pathfinder.searches, self.pathfinder.expanded_nodes,
+                path_cache.hits, path_cache.misses
+            )
+        with metrics.phase('ai.update_ants'):
+            self.refresh_landmarks(deadline)
+            self.ant_manager.update_ants()
+            path_cache.prune(self.ant_manager.all_ants)
+            self.disband_obsolete_squads()
+        with metrics.phase('ai.prioritize_objectives'):
+            self.update_objectives()
+            prioritized_objectives = self.objective_manager.prioritize_by(
+                self.objective_priority
+            )
+        with metrics.phase('ai.assign_squads'):
+            if self.assignment == 'greedy':
+                self.assign_squads_greedily(prioritized_objectives)
+            else:
+                self.assign_squads(prioritized_objectives, deadline)
+        with metrics.phase('ai.ant_moves'):
+            ai_moves = self.calculate_ant_moves(deadline)
+        self.logger.debug(
+            'Path cache: %d hits, %d misses',
+            path_cache.hits, path_cache.misses
+        )
+        self.logger.debug(
+            'Pathfinder: %d searches, %d nodes expanded',
+            self.pathfinder.searches, self.pathfinder.expanded_nodes
         )
+        if metrics.enabled:
+            self.count_metrics(counters)
+        return [move.as_antmove() for move in ai_moves]
+
+    def count_metrics(self, counters):
+        """
+        Records the counts of this turn. counters are the pathfinder's
+        search and path cache counters from before the turn.
+        """
+        metrics = self.metrics
+        gameboard = self.gameboard
+        path_cache = self.pathfinder.path_cache
+        metrics.count('friendly_ants', len(gameboard.friendly_ants))
+        metrics.count('enemy_ants', len(gameboard.enemy_ants))
+        metrics.count('visible_food', len(gameboard.food))
+        metrics.count(
+            'objectives', len(list(self.objective_manager.iterobjectives()))
+        )
+        metrics.count('squads', len(list(self.ant_manager.itersquads())))
+        searches, expanded_nodes, hits, misses = counters
+        metrics.count('astar_searches', self.pathfinder.searches - searches)
+        metrics.count(
+            'astar_expanded_nodes',
+            self.pathfinder.expanded_nodes - expanded_nodes
+        )
+        metrics.count('path_cache_hits', path_cache.hits - hits)
+        metrics.count('path_cache_misses', path_cache.misses - misses)
+
+    def refresh_landmarks(self, deadline=None):
+        """
+        Prepares the landmarks on the first turn and then again as walls are
+        found, at most every LANDMARK_REFRESH_TURNS turns.
+        """
+        if self.landmarks is None or not self.landmarks.stale or \
+                deadline_passed(deadline):
+            return
+        turn = self.gamestate.turn_number
+        if self._landmarks_turn is not None and \
+                turn - self._landmarks_turn < self.LANDMARK_REFRESH_TURNS:
+            return
+        self.landmarks.prepare()
+        self._landmarks_turn = turn
+
+    def assign_squads_greedily(self, prioritized_objectives):
+        """
+        Creates squads for objectives in order of priority, each taking the
+        ants closest to it, until no ants are left.
+
+        This is cheap enough to always finish, so that every ant has an
+        objective to step toward however little time the turn has left.
+        """
         while self.ant_manager.ants_available() and \
                 prioritized_objectives.qsize() > 0:
+            self.assign_nearest_ants(prioritized_objectives.get())
+
+    def assign_nearest_ants(self, objective):
+        """
+        Creates a squad for objective of the ants closest to it.
+        """
+        ant_prioritizer = self.make_ant_prioritizer(objective)
+        use_assigned_ants = False
+        if isinstance(objective, AntHillObjective):
+            use_assigned_ants = True
+        squad = self.ant_manager.create_squad(
+            ant_prioritizer, self.objective_needed_ants(objective),
+            use_assigned_ants, near=objective.coordinate
+        )
+        self.assign_objective(objective, squad)
+
+    def assign_squads(self, prioritized_objectives, deadline=None):
+        """
+        Creates squads for as many objectives, in order of priority, as
+        there are ants to go around, choosing the ants for all of them at
+        once so that they have the least distance to cover in total, as
+        match_ants() does.
+
+        Ant hill objectives may take ants from other squads, so they take
+        the ants closest to them first, as assign_squads_greedily() does.
+        """
+        ant_manager = self.ant_manager
+        slots = []
+        available = len(ant_manager.unassigned_ants)
+        while len(slots) < available and prioritized_objectives.qsize() > 0:
             objective = prioritized_objectives.get()
-            ant_prioritizer = self.make_ant_prioritizer(objective)
-            use_assigned_ants = False
             if isinstance(objective, AntHillObjective):
-                use_assigned_ants = True
-            squad = self.ant_manager.create_squad(
-                ant_prioritizer, self.objective_needed_ants(objective),
-                use_assigned_ants
+                squad = ant_manager.create_squad(
+                    self.make_ant_prioritizer(objective),
+                    self.objective_needed_ants(objective), True,
+                    near=objective.coordinate
+                )
+                self.assign_objective(objective, squad)
+                available = len(ant_manager.unassigned_ants)
+                continue
+            slots.extend(
+                (objective, ) * self.objective_needed_ants(objective)
             )
-            self.assign_objective(objective, squad)
-        ai_moves = self.calculate_ant_moves()
-        return [move.as_antmove() for move in ai_moves]
+        ant_ids = sorted(ant_manager.unassigned_ants)
+        if not slots or not ant_ids:
+            return
+        columns = self.match_ants(
+            slots, [self.gameboard.get_ant(a).index for a in ant_ids],
+            deadline
+        )
+        # Ant IDs by objective ID.
+        members = dict()
+        for objective, column in zip(slots, columns):
+            if column is not None:
+                members.setdefault(objective.objective_id, []).append(
+                    ant_ids[column]
+                )
+        for objective in slots:
+            squad_members = members.pop(objective.objective_id, None)
+            if squad_members is not None:
+                squad = ant_manager.form_squad(squad_members)
+                self.assign_objective(objective, squad)
+
+    def match_ants(self, slots, ant_indexes, deadline=None):
+        """
+        Returns the column of the ant in ant_indexes, or None, to fill every
+        one of slots, a list of objectives in order of priority.
+
+        Every ant is only matched to its ASSIGNMENT_CANDIDATES nearest
+        objectives; if deadline passes first, the slots take the closest of
+        those ants greedily instead. The slots left over take the closest
+        ants left, in order of priority.
+        """
+        gb = self.gameboard
+        goals = sorted(set(gb.index_of(o.coordinate) for o in slots))
+        goal_columns = dict((goal, g) for g, goal in enumerate(goals))
+        slot_goals = [goal_columns[gb.index_of(o.coordinate)] for o in slots]
+        # Rows of slots by goal.
+        goal_slots = dict()
+        for row, g in enumerate(slot_goals):
+            goal_slots.setdefault(g, []).append(row)
+        distances = assignment.torus_distances(
+            ant_indexes, goals, gb.width, gb.height
+        )
+        # With landmarks, the costs account for walls.
+        estimates = dict()
+        costs = [dict() for _ in slots]
+        for column, ant_distances in enumerate(distances):
+            nearest = heapq.nsmallest(
+                self.ASSIGNMENT_CANDIDATES, range(len(goals)),
+                key=ant_distances.__getitem__
+            )
+            for g in nearest:
+                cost = ant_distances[g]
+                if self.landmarks is not None:
+                    if g not in estimates:
+                        estimates[g] = self.pathfinder.index_heuristic(
+                            goals[g]
+                        )
+                    cost = estimates[g](ant_indexes[column])
+                for row in goal_slots[g]:
+                    costs[row][column] = cost
+        columns = assignment.solve_sparse(costs, len(ant_indexes), deadline)
+        if columns is None:
+            self.logger.warning(
+                'Out of time matching %d ants to %d objectives; taking the '
+                'nearest ants instead', len(ant_indexes), len(slots)
+            )
+            columns = assignment.solve_greedily(costs)
+        rows_left = [row for row, c in enumerate(columns) if c is None]
+        taken = set(columns)
+        columns_left = [
+            c for c in range(len(ant_indexes)) if c not in taken
+        ]
+        if not rows_left or not columns_left:
+            return columns
+        goals_left = sorted(set(slot_goals[row] for row in rows_left))
+        distances_left = dict(zip(goals_left, assignment.torus_distances(
+            [goals[g] for g in goals_left],
+            [ant_indexes[c] for c in columns_left], gb.width, gb.height
+        )))
+        greedy_columns = assignment.solve_greedily(
+            [distances_left[slot_goals[row]] for row in rows_left]
+        )
+        for row, c in zip(rows_left, greedy_columns):
+            if c is not None:
+                columns[row] = columns_left[c]
+        return columns
 
     def assign_objective(self, objective, squad):
         self.objective_manager.assign_objective(
@@ -118,6 +451,90 @@ class JohnAI(object):
                 continue
             tile = self.gameboard.get_tile(o.coordinate)
             self.objective_manager.make_objective(tile)
+        self.update_explore_objectives()
+
+    def update_explore_objectives(self):
+        """
+        Keeps an explore objective for as many cells of the board with
+        tiles on the exploration frontier as there are idle ants, besides
+        the cells squads are exploring already.
+
+        The cells closest to our ants or hill are kept; cells with neither
+        within EXPLORE_REACH cells are too far to reach while the frontier
+        there is current, and are dropped.
+        """
+        gb = self.gameboard
+        fog = gb.fog
+        objective_manager = self.objective_manager
+        explored_ids = set(
+            squad.objective.objective_id
+            for squad in self.ant_manager.itersquads()
+            if squad.objective is not None
+        )
+        explored_cells = set()
+        for o in list(objective_manager.iterobjectives()):
+            if not isinstance(o, ExploreObjective):
+                continue
+            if o.objective_id in explored_ids:
+                explored_cells.add(
+                    fog.cell_of(gb.index_of(o.coordinate), EXPLORE_CELL_SIZE)
+                )
+            else:
+                objective_manager.remove_objective(o.objective_id)
+        idle_ants = len(self.ant_manager.unassigned_ants)
+        if idle_ants == 0:
+            return
+        width = gb.width
+        hill = gb.friendly_ant_hill
+        sources = [tile.index for tile in gb.friendly_ants]
+        if hill is not None:
+            hill = gb.index_of(hill.coordinate)
+            sources.append(hill)
+
+        def hill_distance(index):
+            # The number of steps along either axis to our hill.
+            if hill is None:
+                return 0
+            dx = abs(index % width - hill % width)
+            dy = abs(index // width - hill // width)
+            return max(min(dx, width - dx), min(dy, gb.height - dy))
+
+        reach = self.explore_reach(sources)
+        candidates = [
+            (reach[cell], hill_distance(index), index)
+            for cell, index in fog.frontier_cells(EXPLORE_CELL_SIZE).items()
+            if cell in reach and cell not in explored_cells
+        ]
+        coordinate_at = gb.coordinate_at
+        for _, _, index in heapq.nsmallest(idle_ants, candidates):
+            objective_manager.make_explore_objective(coordinate_at(index))
+
+    def explore_reach(self, sources):
+        """
+        Returns a dict with the number of cells, along either axis, between
+        every cell of the board within EXPLORE_REACH cells of a tile index in
+        sources and the nearest of them, keyed by FogMemory.cell_of().
+        """
+        gb = self.gameboard
+        columns = -(-gb.width // EXPLORE_CELL_SIZE)
+        rows = -(-gb.height // EXPLORE_CELL_SIZE)
+        reach = dict(
+            (gb.fog.cell_of(index, EXPLORE_CELL_SIZE), 0) for index in sources
+        )
+        ring = list(reach)
+        for distance in range(1, EXPLORE_REACH + 1):
+            next_ring = []
+            for cell in ring:
+                row, column = divmod(cell, columns)
+                for dy in (-1, 0, 1):
+                    row_start = (row + dy) % rows * columns
+                    for dx in (-1, 0, 1):
+                        neighbor = row_start + (column + dx) % columns
+                        if neighbor not in reach:
+                            reach[neighbor] = distance
+                            next_ring.append(neighbor)
+            ring = next_ring
+        return reach
 
     def objective_priority(self, objective):
         if isinstance(objective, FoodObjective):
@@ -126,30 +543,34 @@ class JohnAI(object):
             return self.ant_hill_objective_priority(objective)
         elif isinstance(objective, DefendObjective):
             return self.defend_objective_priority(objective)
+        elif isinstance(objective, ExploreObjective):
+            return self.explore_objective_priority(objective)
 
     def food_objective_priority(self, objective):
         objective_priority = objective.DEFAULT_PRIORITY
         objective_priority += self.pathfinder.heuristic_cost(
             self.gameboard.friendly_ant_hill.coordinate,
             objective.coordinate
-        ) * 100
-        tile = self.gameboard.get_tile(objective.coordinate)
-        multiplier = 1
-        # Examine the tiles surrounding food. Food that is close to other
-        # food is more important, since we can grab a lot of it quickly.
-        for tile in surrounding_tiles(tile, 4):
-            if isinstance(tile.get_entity(), gameboard.Food):
-                objective_priority -= (100 * multiplier)
-                multiplier *= 2
+        ) * self.weights['food_distance']
+        # Count the food surrounding this food. Food that is close to other
+        # food is more important, since we can grab a lot of it quickly:
+        # every piece nearby is worth twice as much as the one before.
+        nearby_food = self.gameboard.food_counts().count_within(
+            self.gameboard.index_of(objective.coordinate), 4
+        )
+        objective_priority -= \
+            self.weights['food_cluster'] * (2 ** nearby_food - 1)
         return objective_priority
 
     def ant_hill_objective_priority(self, objective):
         objective_priority = objective.DEFAULT_PRIORITY
-        objective_priority += 500
+        objective_priority += self.weights['ant_hill_base']
         nearby_enemy_count = nearby_enemy_ants(objective.coordinate, 3)
-        objective_priority += (nearby_enemy_count * 200)
+        objective_priority += (
+            nearby_enemy_count * self.weights['ant_hill_enemy']
+        )
         if nearby_enemy_count == 0:
-            objective_priority -= 2000
+            objective_priority -= self.weights['ant_hill_undefended']
         return objective_priority
 
     def defend_objective_priority(self, objective):
@@ -166,33 +587,91 @@ class JohnAI(object):
         self.logger.debug('Defense priority %d', defense_priority)
         return defense_priority
 
+    def explore_objective_priority(self, objective):
+        objective_priority = objective.DEFAULT_PRIORITY
+        objective_priority += self.weights['explore_base']
+        objective_priority += self.home_distance(
+            objective.coordinate
+        ) * self.weights['explore_distance']
+        return objective_priority
+
+    def home_distance(self, coordinate):
+        """
+        Returns the estimated distance to coordinate from our hill or, if we
+        have none, from the nearest of our ants.
+        """
+        gb = self.gameboard
+        heuristic_cost = self.pathfinder.heuristic_cost
+        if gb.friendly_ant_hill is not None:
+            return heuristic_cost(gb.friendly_ant_hill.coordinate, coordinate)
+        return min(
+            (heuristic_cost(tile.coordinate, coordinate)
+             for tile in gb.friendly_ants),
+            default=0
+        )
+
     def desired_defenders(self):
         friendly_ant_count = len(self.gameboard.friendly_ants)
-        num_defenders = 0
-        if friendly_ant_count <= 5:
-            num_defenders = 1
-        elif 5 < friendly_ant_count <= 10:
-            num_defenders = 3
-        else:
-            num_defenders = 5
-        return num_defenders
+        thresholds = self.weights['defender_thresholds']
+        counts = self.weights['defender_counts']
+        assert len(counts) == len(thresholds) + 1
+        for threshold, num_defenders in zip(thresholds, counts):
+            if friendly_ant_count <= threshold:
+                return num_defenders
+        return counts[-1]
 
     def objective_needed_ants(self, objective):
         # TODO: Implement objective_needed_ants().
         return 1
 
-    def calculate_ant_moves(self):
-        gameboard = _gamestate.get_gameboard()
-        nontraversable_coordinates = set((
-            self.gameboard.get_ant(ant_id).coordinate \
+    def calculate_ant_moves(self, deadline=None):
+        """
+        Plans a move for every ant in a squad, then settles which ants get
+        the tiles that several of them want, all at once.
+        """
+        gameboard = self.gameboard
+        occupied = set(
+            gameboard.get_ant(ant_id).index
             for ant_id in self.ant_manager.all_ants
-        ))
+        )
+        squads = list(self.ant_manager.itersquads())
+        # A greedy step for every ant comes first, so that every ant has a
+        # move however little time there is to search for paths.
+        fallbacks = dict()
+        for squad in squads:
+            fallbacks.update(squad.greedy_plans(gameboard, self.pathfinder))
+        plans = None
+        if self.planner is not None and \
+                self.planner.worthwhile(len(occupied)):
+            plans = self.planner.plan_moves(squads, occupied, deadline)
+            if plans is not None and self.metrics.enabled:
+                self.metrics.count(
+                    'parallel_speedup', self.planner.last_speedup
+                )
+        if plans is None:
+            plans = []
+            for squad in squads:
+                plans.extend(squad.plan_moves(
+                    gameboard, self.pathfinder, occupied, deadline, fallbacks
+                ))
+        destinations = resolve_moves(plans, occupied)
         moves = []
-        for squad in self.ant_manager.itersquads():
-            squad_moves = squad.report_moves(
-                self.gameboard, self.pathfinder, nontraversable_coordinates
-            )
-            moves.extend(squad_moves)
+        diverted = 0
+        for plan in plans:
+            to = destinations[plan.ant_id]
+            if to == plan.frm:
+                continue
+            move = AIMove(plan.ant_id, gameboard.coordinate_at(to))
+            if to == plan.steps[0]:
+                move.path = plan.path
+            else:
+                move.path = [move.to]
+                diverted += 1
+            moves.append(move)
+        self.logger.debug(
+            '%d ants planned, %d moved, %d diverted from their path',
+            len(plans), len(moves), diverted
+        )
         if self.renderer is not None:
             self.renderer.register_overlay(
                 self.renderer_path_overlay([x.path for x in moves])
@@ -200,16 +679,123 @@ class JohnAI(object):
         return moves
 
     def renderer_path_overlay(self, paths):
+        """
+        Returns an overlay mapping the Coordinates of paths to characters.
+        Where paths cross, the first one is drawn.
+        """
         path_chars = 'ov+=&!?%'
-        def overlay(tile, gamestate):
-            for index, path in enumerate(paths):
-                if tile.coordinate in path:
-                    return path_chars[index % len(path_chars)]
-            return None
+        overlay = dict()
+        for index, path in enumerate(paths):
+            char = path_chars[index % len(path_chars)]
+            for coordinate in path:
+                overlay.setdefault(coordinate, char)
         return overlay
 
 
 
+# Ants go for food fewer than this many steps away before their objective.
+MAX_FOOD_DISTANCE = 3
+# Explore objectives are made for at most one frontier tile in every square
+# of this many tiles a side.
+EXPLORE_CELL_SIZE = 8
+# Explore objectives are only made in cells at most this many cells, along
+# either axis, from one holding our ants or hill: about as far as an ant
+# gets before the frontier it set out for has gone stale.
+EXPLORE_REACH = 4
+
+
+def ranked_steps(gameboard, frm, distance, first=None):
+    """
+    Returns the tile indexes next to frm that distance, a function of a
+    tile index, rates closer to the target than frm, closest first. first,
+    if given, comes first regardless.
+    """
+    own_distance = distance(frm)
+    if own_distance is None:
+        return [first] if first is not None else []
+    rated = []
+    for index in gameboard.neighbor_indexes(frm):
+        if index == first:
+            continue
+        d = distance(index)
+        if d is not None and d < own_distance:
+            rated.append((d, index))
+    rated.sort()
+    steps = [index for _, index in rated]
+    if first is not None:
+        steps.insert(0, first)
+    return steps
+
+
+def plan_ant_move(pathfinder, ant_id, frm, food, objective, use_field,
+                  deadline=None):
+    """
+    Returns a MovePlan for the ant ant_id on the tile index frm, toward the
+    first tile index in food it can reach in fewer than MAX_FOOD_DISTANCE
+    steps, or else toward the tile index objective. Returns None if it can
+    reach neither. Raises pathfinding.DeadlineExceeded if deadline passes
+    first.
+
+    Other friendly ants are left for resolve_moves() to work around, so
+    only walls are searched around. If use_field, several ants share the
+    objective and it is reached through its distance field rather than by
+    a search from every ant; a single ant is better off with A*, which
+    needs not visit the whole board.
+
+    Needs nothing of pathfinder's gameboard but its walls, so that it can
+    run in a worker process of parallel.ParallelPlanner.
+    """
+    gb = pathfinder.gameboard
+    coordinate_at = gb.coordinate_at
+    start = coordinate_at(frm)
+    targets = list(food)
+    if objective is not None:
+        targets.append(objective)
+    for target in targets:
+        end = coordinate_at(target)
+        if target == objective and use_field:
+            path = pathfinder.field_path(start, end, deadline=deadline)
+            distance = pathfinder.distance_field(end).distance
+        else:
+            path = pathfinder.find_ant_path(
+                ant_id, start, end, deadline=deadline
+            )
+            distance = pathfinder.index_heuristic(target)
+        if path is None:
+            continue
+        if target == objective or len(path) < MAX_FOOD_DISTANCE:
+            first = gb.index_of(path[0])
+            return MovePlan(
+                ant_id, frm, ranked_steps(gb, frm, distance, first), path
+            )
+    return None
+
+
+def greedy_ant_plan(pathfinder, ant_id, frm, objective):
+    """
+    Steps toward the tile index objective without searching for a path, if
+    that brings the ant closer to it. Used when there is no time left.
+    """
+    gb = pathfinder.gameboard
+    steps = ranked_steps(gb, frm, pathfinder.index_heuristic(objective))
+    if len(steps) == 0:
+        return None
+    return MovePlan(ant_id, frm, steps, [gb.coordinate_at(steps[0])])
+
+
+class MovePlan(object):
+    """
+    The tile indexes of the steps an ant could take this turn, best first,
+    and the path of Coordinates to its target that starts with the first
+    of them. Staying on frm is always possible and is not one of the steps.
+    """
+    def __init__(self, ant_id, frm, steps, path):
+        self.ant_id = ant_id
+        self.frm = frm
+        self.steps = steps
+        self.path = path
+
+
 class AIMove(object):
     def __init__(self, ant_id, to):
         self.ant_id = ant_id
@@ -228,11 +814,12 @@ class AIMove(object):
             self.to
         )
         gb = _gamestate.get_gameboard()
+        frm = self.frm
         direction_map = {
-            gb.get_tile(C(self.frm.x - 1, self.frm.y)).coordinate: AntMove.LEFT,
-            gb.get_tile(C(self.frm.x + 1, self.frm.y)).coordinate: AntMove.RIGHT,
-            gb.get_tile(C(self.frm.x, self.frm.y - 1)).coordinate: AntMove.UP,
-            gb.get_tile(C(self.frm.x, self.frm.y + 1)).coordinate: AntMove.DOWN,
+            gb.tile_at(frm.x - 1, frm.y).coordinate: AntMove.LEFT,
+            gb.tile_at(frm.x + 1, frm.y).coordinate: AntMove.RIGHT,
+            gb.tile_at(frm.x, frm.y - 1).coordinate: AntMove.UP,
+            gb.tile_at(frm.x, frm.y + 1).coordinate: AntMove.DOWN,
         }
         direction = direction_map[self.to]
         self.logger.debug('Direction is %s', direction)
@@ -276,11 +863,49 @@ class AntManager(object):
             ants = ants[0:count]
         return ants
 
-    def create_squad(self, measure, count, use_assigned_ants=False):
+    def select_nearest_ants(self, coordinate, count=1,
+                            use_assigned_ants=False):
+        """
+        Selects the count ants from the list of unassigned ants that are
+        closest to coordinate in a straight line.
+        """
+        potential_ants = self.unassigned_ants
+        if use_assigned_ants:
+            potential_ants = self.all_ants
+        gb = _gamestate.get_gameboard()
+        ant_id_at = gb.ant_id_at
+        ants = [
+            ant_id_at(index) for index in gb.friendly_ant_index.nearest(
+                gb.index_of(coordinate), count,
+                lambda index: ant_id_at(index) in potential_ants
+            )
+        ]
+        if len(ants) == 0:
+            return None
+        return ants
+
+    def create_squad(self, measure, count, use_assigned_ants=False,
+                     near=None):
+        """
+        Creates a squad of count ants selected by measure, or of the count
+        ants nearest to the Coordinate near if it is given.
+        """
+        if near is not None:
+            squad_members = self.select_nearest_ants(
+                near, count, use_assigned_ants
+            )
+        else:
+            squad_members = self.select_ideal_ants(
+                measure, count, use_assigned_ants
+            )
+        return self.form_squad(squad_members)
+
+    def form_squad(self, squad_members):
+        """
+        Creates a squad of the ants with the IDs in squad_members, taking
+        them from any squads they were in.
+        """
         self.next_squad_id += 1
-        squad_members = self.select_ideal_ants(
-            measure, count, use_assigned_ants
-        )
         squad = AntSquad(self.next_squad_id, squad_members)
         self.logger.debug(
             'Created squad %d with members: %s', squad.squad_id,
@@ -364,6 +989,13 @@ class ObjectiveManager(object):
             )
         self._objectives[objective_id] = o
 
+    def make_explore_objective(self, coordinate):
+        self.logger.debug('Creating explore objective for %s', coordinate)
+        objective_id = self._objective_id()
+        self._objectives[objective_id] = ExploreObjective(
+            objective_id, coordinate
+        )
+
     def remove_objective(self, objective_id):
         del self._objectives[objective_id]
 
@@ -401,55 +1033,65 @@ class AntSquad(object):
     def remove_members(self, members):
         self.members -= set(members)
 
-    def report_moves(self, gameboard, pathfinder, nontraversable):
-        self.logger.info('Reporting moves for squad %d', self.squad_id)
+    def greedy_plans(self, gameboard, pathfinder):
+        """
+        Returns a dict mapping the IDs of the members that can step toward
+        the objective to a greedy MovePlan doing so, for when there is no
+        time left to search.
+        """
+        plans = dict()
+        if self.objective is None:
+            return plans
+        target = gameboard.index_of(self.objective.coordinate)
+        for ant_id in self.members:
+            plan = greedy_ant_plan(
+                pathfinder, ant_id, gameboard.get_ant(ant_id).index, target
+            )
+            if plan is not None:
+                plans[ant_id] = plan
+        return plans
+
+    def plan_moves(self, gameboard, pathfinder, occupied, deadline=None,
+                   fallbacks=None):
+        """
+        Returns a MovePlan for every member that can move. occupied holds
+        the tile indexes of all friendly ants.
+
+        Once deadline has passed, members take the greedy step in
+        fallbacks, as returned by greedy_plans(), instead.
+        """
+        self.logger.info('Planning moves for squad %d', self.squad_id)
         if self.objective is None:
-            self.logger.debug('No objective; no moves to report')
+            self.logger.debug('No objective; no moves to plan')
             return ()
-        moves = []
+        if fallbacks is None:
+            fallbacks = self.greedy_plans(gameboard, pathfinder)
+        plans = []
         self.logger.info(str(self.objective))
+        target = gameboard.index_of(self.objective.coordinate)
+        objective = None if target in occupied else target
+        use_field = len(self.members) > 1
         for ant_id in self.members:
-            move = self.ant_move(ant_id, gameboard, pathfinder, nontraversable)
-            if move is not None:
-                moves.append(move)
-        return moves
-
-    def ant_move(self, ant_id, gameboard, pathfinder, nontraversable):
-        ant = gameboard.get_ant(ant_id)
-        max_food_dist = 3
-        nearby_food = filter(is_food, surrounding_tiles(ant, max_food_dist))
-        targets = filter(
-            lambda x: x.coordinate not in nontraversable,
-            itertools.chain(nearby_food, (self.objective ,))
-        )
-        # If the actual distance to our food is too far away, check the next
-        # potential target.
-        while True:
-            try:
-                target = next(targets)
-            except StopIteration:
-                return None
-            path = pathfinder.find_path(
-                ant.coordinate, target.coordinate, nontraversable
-            )
-            if path is None:
-                continue
-            if (target.coordinate == self.objective.coordinate or
-                    len(path) < max_food_dist):
-                break
-        if path is None:
-            return None
-        move = AIMove(ant_id, path[0])
-        move.path = path
-        self.logger.debug(
-            'Moving ant %d %s -> %s (%s)', ant_id, str(move.frm),
-            str(move.to), str(move.direction)
-        )
-        # Update the list of coordinates we aren't allowed to move to
-        # We don't want to be killing our own ants!
-        nontraversable.remove(move.frm)
-        nontraversable.add(move.to)
-        return move
+            frm = gameboard.get_ant(ant_id).index
+            if deadline_passed(deadline):
+                plan = fallbacks.get(ant_id)
+            else:
+                food = [
+                    index for index in gameboard.food_index.within(
+                        frm, MAX_FOOD_DISTANCE
+                    )
+                    if index not in occupied
+                ]
+                try:
+                    plan = plan_ant_move(
+                        pathfinder, ant_id, frm, food, objective, use_field,
+                        deadline
+                    )
+                except pathfinding.DeadlineExceeded:
+                    plan = fallbacks.get(ant_id)
+            if plan is not None:
+                plans.append(plan)
+        return plans
 
 
 @functools.total_ordering
@@ -530,3 +1172,18 @@ class DefendObjective(Objective):
     @property
     def obsolete(self):
         return True
+
+
+class ExploreObjective(Objective):
+    """
+    Sends ants to a tile on the exploration frontier, to see what lies
+    beyond it.
+    """
+    def __init__(self, objective_id, coordinate):
+        super().__init__(objective_id)
+        self.coordinate = coordinate
+
+    @property
+    def obsolete(self):
+        gb = _gamestate.get_gameboard()
+        return not gb.fog.on_frontier(gb.index_of(self.coordinate))
@@ -0,0 +1,205 @@
+import asyncio
+import functools
+import logging
+import logging.handlers
+import queue
+import time
+
+import client
+import ui
+
+
+class AsyncAntAIClient(object):
+    """
+    Wraps an AntAIClient so its requests can be awaited.
+
+    Requests run on an executor thread, so several of them can be in flight
+    while the event loop does other work. Every request has to finish by
+    the deadline it is given, if any, rather than by client.deadline, which
+    is shared between the threads.
+    """
+
+    def __init__(self, client, executor=None):
+        self.client = client
+        self.name = client.name
+        self.executor = executor
+
+    async def _call(self, func, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self.executor, functools.partial(func, *args)
+        )
+
+    async def login(self, game_id=None):
+        return await self._call(self.client.login, game_id)
+
+    async def get_game_info(self, deadline=None):
+        return await self._call(self.client.get_game_info, deadline)
+
+    async def get_turn_info(self, deadline=None):
+        return await self._call(self.client.get_turn_info, deadline)
+
+    async def submit_move_list(self, moves, deadline=None):
+        return await self._call(
+            self.client.submit_move_list, moves, deadline
+        )
+
+
+class AsyncAntGameController(client.AntGameController):
+    """
+    An AntGameController that overlaps network I/O with the rest of a turn.
+
+    Once the AI has produced its moves, the move submission is sent while
+    the next turn is awaited. The board is rendered by a BackgroundRenderer.
+    Work that is still pending when the next turn starts is cancelled;
+    see cancel_pending().
+
+    AIs are driven exactly like by AntGameController, through
+    ai.initialize() and ai.execute(gamestate), which is given the deadline
+    too if it takes one.
+    """
+
+    def __init__(self, client, ai, renderer=None, incremental_updates=True,
+                 executor=None, metrics=None, recorder=None):
+        if renderer is not None and \
+                not isinstance(renderer, ui.BackgroundRenderer):
+            renderer = ui.BackgroundRenderer(renderer)
+        super().__init__(
+            client, ai, renderer, incremental_updates, metrics, recorder
+        )
+        self.async_client = AsyncAntAIClient(client, executor)
+        self._pending = set()
+        # The time.monotonic() value the current turn ends at, if known.
+        self._deadline = None
+        self.logger = logging.getLogger(
+            'ants.aioclient.AsyncAntGameController'
+        )
+
+    def start(self):
+        asyncio.run(self.run())
+
+    async def run(self):
+        game_info = await self.async_client.get_game_info()
+        self.initialize_gamestate(game_info)
+        if self.recorder:
+            self.recorder.record_start(self.client.name, game_info)
+        self.ai.initialize(self.gamestate)
+        await self.wait_for_next_turn()
+        metrics = self.metrics
+        while True:
+            self.cancel_pending()
+            self.start_turn_metrics()
+            try:
+                with metrics.phase('get_game_info'):
+                    game_info = await self.async_client.get_game_info(
+                        self._deadline
+                    )
+            except client.NETWORK_ERRORS as e:
+                self.miss_turn(e)
+                self.end_turn_metrics([], None)
+                await self.wait_for_next_turn()
+                continue
+            with metrics.phase('update_gamestate'):
+                self.update_gamestate(game_info)
+            if self.gamestate.game_over:
+                break
+            movelist, slack = self.run_ai()
+            submission = self._spawn(
+                self.async_client.submit_move_list(movelist, self._deadline)
+            )
+            if self.renderer:
+                with metrics.phase('render'):
+                    self.renderer.display(self.gamestate)
+            if self.recorder:
+                self.recorder.record_turn(game_info, movelist)
+            # The submission is still in flight, so only the time until
+            # here counts toward the turn.
+            self.end_turn_metrics(movelist, slack)
+            await self.wait_for_next_turn(submission)
+            if not submission.done():
+                self.logger.warning(
+                    'Move submission for turn %d was late; cancelling it',
+                    self.gamestate.turn_number
+                )
+            elif not submission.cancelled() and \
+                    submission.exception() is not None:
+                error = submission.exception()
+                if not isinstance(error, client.NETWORK_ERRORS):
+                    raise error
+                # The turn's metrics are done; this counts toward the next.
+                self.miss_turn(error)
+        self.cancel_pending()
+        if self.renderer:
+            self.renderer.display(self.gamestate)
+            self.renderer.close()
+        self.logger.info(
+            'Connection stats: %s', self.client.connection_stats()
+        )
+
+    async def wait_for_next_turn(self, submission=None):
+        """
+        Waits until the server has moved past the current turn.
+
+        Polling starts right away, while submission, the task sending this
+        turn's moves, may still be in flight. The server may start the next
+        turn as soon as it has every player's moves, so an answer sent
+        before the submission was done is out of date as soon as it is:
+        the server is polled again once the submission is done, rather than
+        only once the current turn is due to end.
+        """
+        while True:
+            submitted = submission is None or submission.done()
+            turn_info = await self.async_client.get_turn_info()
+            self._polled_turn = turn_info['Turn']
+            if turn_info['Turn'] > self.last_turn():
+                break
+            if turn_info['MillisecondsUntilNextTurn'] < 0:
+                # XXX: Ran into a bug (?) where this value is negative
+                return
+            wait = turn_info['MillisecondsUntilNextTurn']/1000
+            if submitted:
+                await asyncio.sleep(wait)
+            else:
+                await asyncio.wait((submission, ), timeout=wait)
+        # Requests for this turn have to be done before the next one starts.
+        self._turn_length = turn_info['MillisecondsUntilNextTurn']/1000
+        self._deadline = time.monotonic() + self._turn_length
+
+    def turn_deadline(self):
+        return self._deadline
+
+    def cancel_pending(self):
+        """
+        Cancels the tasks still pending.
+
+        A request already being sent cannot be stopped; it goes on in its
+        executor thread, but stops once the timeout it was sent with, which
+        ends with its turn, runs out.
+        """
+        for task in self._pending:
+            task.cancel()
+        self._pending = set()
+
+    def _spawn(self, awaitable):
+        task = asyncio.ensure_future(awaitable)
+        self._pending.add(task)
+        task.add_done_callback(self._pending.discard)
+        return task
+
+
+def start_background_logging(logger):
+    """
+    Moves the handlers of logger onto a background thread, so that logging
+    does not block the event loop.
+
+    Returns the started QueueListener; call its stop() method to flush and
+    stop it.
+    """
+    log_queue = queue.Queue()
+    handlers = logger.handlers
+    logger.handlers = [logging.handlers.QueueHandler(log_queue)]
+    listener = logging.handlers.QueueListener(
+        log_queue, *handlers, respect_handler_level=True
+    )
+    listener.start()
+    return listener
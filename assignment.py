@@ -0,0 +1,253 @@
+"""
+Assignment of ants to objectives.
+
+The cost of sending every ant to every objective is laid out in a matrix,
+one row per objective and one column per ant, and solve() finds the
+assignment with the least total cost using the Hungarian algorithm.
+
+When every row only has a few candidate columns worth considering,
+solve_sparse() takes just those and is much quicker.
+"""
+
+import heapq
+import math
+from operator import add
+import time
+
+
+def torus_distances(goals, indexes, width, height):
+    """
+    Returns a matrix with a row for every tile index in goals and a column
+    for every tile index in indexes, holding the straight line distance
+    between them on a width x height board that wraps around its edges, as
+    Pathfinder.heuristic_cost() measures it.
+    """
+    # The squared distance along each axis for every offset, wrapped.
+    dx2 = [min(d, width - d) ** 2 for d in range(width)]
+    dy2 = [min(d, height - d) ** 2 for d in range(height)]
+    xs = [index % width for index in indexes]
+    ys = [index // width for index in indexes]
+    matrix = []
+    for goal in goals:
+        goal_x = goal % width
+        goal_y = goal // width
+        # Rotated so that they are indexed by x and y rather than by the
+        # offset from the goal.
+        x_distances = dx2[width - goal_x:] + dx2[:width - goal_x]
+        y_distances = dy2[height - goal_y:] + dy2[:height - goal_y]
+        matrix.append(list(map(math.sqrt, map(
+            add, map(x_distances.__getitem__, xs),
+            map(y_distances.__getitem__, ys)
+        ))))
+    return matrix
+
+
+def solve(costs, deadline=None):
+    """
+    Given a matrix of costs as a list of rows, returns a list with the
+    column assigned to every row, so that no column is assigned twice and
+    the total cost is as low as possible.
+
+    If there are more rows than columns, some rows get None. Returns None
+    if deadline, a time.monotonic() value, passes first.
+    """
+    row_count = len(costs)
+    if row_count == 0:
+        return []
+    column_count = len(costs[0])
+    if row_count > column_count:
+        columns = _solve(
+            [[row[j] for row in costs] for j in range(column_count)],
+            row_count, deadline
+        )
+        if columns is None:
+            return None
+        assigned = [None] * row_count
+        for column, row in enumerate(columns):
+            assigned[row] = column
+        return assigned
+    if row_count * row_count < column_count:
+        # In a best assignment, every row gets one of its row_count cheapest
+        # columns: at least one of those is left over by the other rows,
+        # and would do no worse. Columns that are none of those can go.
+        candidates = sorted(set(
+            j for row in costs
+            for j in heapq.nsmallest(row_count, range(column_count),
+                                     key=row.__getitem__)
+        ))
+        columns = _solve(
+            [[row[j] for j in candidates] for row in costs],
+            len(candidates), deadline
+        )
+        if columns is None:
+            return None
+        return [candidates[j] for j in columns]
+    return _solve(costs, column_count, deadline)
+
+
+def solve_greedily(costs):
+    """
+    Like solve(), but every row in turn takes the cheapest column left,
+    which is quick but may cost more in total.
+
+    Rows may also be dicts of the costs of their candidate columns, as for
+    solve_sparse().
+    """
+    if len(costs) == 0:
+        return []
+    if isinstance(costs[0], dict):
+        taken = set()
+        assigned = []
+        for row in costs:
+            columns_left = [j for j in row if j not in taken]
+            if not columns_left:
+                assigned.append(None)
+                continue
+            column = min(columns_left, key=row.__getitem__)
+            taken.add(column)
+            assigned.append(column)
+        return assigned
+    columns_left = list(range(len(costs[0])))
+    assigned = []
+    for row in costs:
+        if not columns_left:
+            assigned.append(None)
+            continue
+        column = min(columns_left, key=row.__getitem__)
+        columns_left.remove(column)
+        assigned.append(column)
+    return assigned
+
+
+def solve_sparse(costs, column_count, deadline=None):
+    """
+    Like solve(), but every row of costs is a dict of the costs of just the
+    columns it may be assigned, of column_count in all. Rows that cannot
+    get a column without taking one from a row that has no other get None.
+
+    Rows are added one at a time along the cheapest augmenting path, which
+    is found with Dijkstra's algorithm over the candidate columns only.
+    Returns None if deadline, a time.monotonic() value, passes first.
+    """
+    infinity = float('inf')
+    row_count = len(costs)
+    # Potentials, which keep the reduced cost of every candidate column of
+    # an assigned row, cost - row potential - column potential, at zero or
+    # more, and at zero for the column it is assigned.
+    row_potentials = [0] * row_count
+    column_potentials = [0] * column_count
+    column_rows = [None] * column_count
+    row_columns = [None] * row_count
+    for i in range(row_count):
+        if deadline is not None and time.monotonic() >= deadline:
+            return None
+        # The shortest distance found to every column, and the row it was
+        # reached from.
+        distances = dict()
+        previous_rows = dict()
+        heap = []
+        for j, cost in costs[i].items():
+            distance = cost - column_potentials[j]
+            if distance < distances.get(j, infinity):
+                distances[j] = distance
+                previous_rows[j] = i
+                heapq.heappush(heap, (distance, j))
+        finished = dict()
+        free_column = None
+        while heap:
+            distance, j = heapq.heappop(heap)
+            if j in finished:
+                continue
+            finished[j] = distance
+            row = column_rows[j]
+            if row is None:
+                free_column = j
+                break
+            base = distance - row_potentials[row]
+            for j2, cost in costs[row].items():
+                if j2 in finished:
+                    continue
+                distance2 = base + cost - column_potentials[j2]
+                if distance2 < distances.get(j2, infinity):
+                    distances[j2] = distance2
+                    previous_rows[j2] = row
+                    heapq.heappush(heap, (distance2, j2))
+        if free_column is None:
+            continue
+        longest = finished[free_column]
+        for j, distance in finished.items():
+            column_potentials[j] += distance - longest
+            if column_rows[j] is not None:
+                row_potentials[column_rows[j]] += longest - distance
+        row_potentials[i] = longest
+        # Shift every row along the path over to the column it reached.
+        j = free_column
+        while True:
+            row = previous_rows[j]
+            previous_column = row_columns[row]
+            column_rows[j] = row
+            row_columns[row] = j
+            if row == i:
+                break
+            j = previous_column
+    return row_columns
+
+
+def _solve(costs, column_count, deadline=None):
+    """
+    The Hungarian algorithm, with potentials, for at most as many rows as
+    columns. Returns the column assigned to every row, or None if deadline
+    passes first.
+
+    Rows and columns are numbered from 1 internally; column 0 holds the row
+    being added.
+    """
+    infinity = float('inf')
+    row_count = len(costs)
+    row_potentials = [0] * (row_count + 1)
+    column_potentials = [0] * (column_count + 1)
+    # The row assigned to every column, or 0.
+    column_rows = [0] * (column_count + 1)
+    previous_columns = [0] * (column_count + 1)
+    for i in range(1, row_count + 1):
+        column_rows[0] = i
+        j0 = 0
+        slack = [infinity] * (column_count + 1)
+        used = [0]
+        unused = list(range(1, column_count + 1))
+        while True:
+            if deadline is not None and time.monotonic() >= deadline:
+                return None
+            i0 = column_rows[j0]
+            row = costs[i0 - 1]
+            row_potential = row_potentials[i0]
+            delta = infinity
+            j1 = 0
+            for j in unused:
+                reduced = row[j - 1] - row_potential - column_potentials[j]
+                if reduced < slack[j]:
+                    slack[j] = reduced
+                    previous_columns[j] = j0
+                if slack[j] < delta:
+                    delta = slack[j]
+                    j1 = j
+            for j in used:
+                row_potentials[column_rows[j]] += delta
+                column_potentials[j] -= delta
+            for j in unused:
+                slack[j] -= delta
+            j0 = j1
+            if column_rows[j0] == 0:
+                break
+            used.append(j0)
+            unused.remove(j0)
+        # Follow the augmenting path back to column 0.
+        while j0 != 0:
+            j1 = previous_columns[j0]
+            column_rows[j0] = column_rows[j1]
+            j0 = j1
+    assigned = [None] * row_count
+    for j in range(1, column_count + 1):
+        if column_rows[j] != 0:
+            assigned[column_rows[j] - 1] = j - 1
+    return assigned
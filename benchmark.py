@@ -0,0 +1,407 @@
+#!/usr/bin/env python3
+"""
+Benchmarks the parts of a turn on synthetic boards.
+
+Every board size gets a SyntheticGame with random walls, ants and food, whose
+ants wander around from turn to turn. For each component, a number of turns
+is timed and the median and 99th percentile are reported. One more run under
+tracemalloc reports the memory blocks it left allocated and its peak traced
+memory.
+
+Results can be saved as a baseline and later runs compared against it:
+
+    ./benchmark.py --sizes 30x30,100x100 --save-baseline baseline.json
+    ./benchmark.py --sizes 30x30,100x100 --baseline baseline.json
+"""
+
+import argparse
+import json
+import logging
+import random
+import sys
+import time
+import tracemalloc
+
+import ai
+import client
+import pathfinding
+import ui
+
+
+class BoardSpec(object):
+    """
+    Describes a synthetic board.
+
+    Unless given, ant, enemy and food counts scale with the board's area.
+    """
+
+    def __init__(self, width, height, wall_density=0.1, ants=None,
+                 enemies=None, food=None, seed=0):
+        area = width * height
+        self.width = width
+        self.height = height
+        self.wall_density = wall_density
+        self.ants = ants if ants is not None else max(5, area // 400)
+        self.enemies = enemies if enemies is not None else max(3, area // 1000)
+        self.food = food if food is not None else max(5, area // 300)
+        self.seed = seed
+
+    @property
+    def name(self):
+        return '{0}x{1}'.format(self.width, self.height)
+
+    @classmethod
+    def parse(cls, text, **kwargs):
+        width, _, height = text.partition('x')
+        return cls(int(width), int(height or width), **kwargs)
+
+
+class SyntheticGame(object):
+    """
+    Produces game_info payloads, as returned by the game server, for a
+    random board described by a BoardSpec.
+    """
+    _STEPS = ((0, -1), (0, 1), (-1, 0), (1, 0))
+    FRIENDLY = 'benchmark'
+    ENEMY = 'enemy'
+
+    def __init__(self, spec):
+        self.spec = spec
+        self.width = spec.width
+        self.height = spec.height
+        self.random = random.Random(spec.seed)
+        self.turn = 0
+        self.hill = (self.width // 4, self.height // 4)
+        self.enemy_hill = (3 * self.width // 4, 3 * self.height // 4)
+        keep_clear = set()
+        for x, y in (self.hill, self.enemy_hill):
+            for dx in range(-1, 2):
+                for dy in range(-1, 2):
+                    keep_clear.add(self._wrap(x + dx, y + dy))
+        tiles = [
+            (x, y) for y in range(self.height) for x in range(self.width)
+            if (x, y) not in keep_clear
+        ]
+        wall_count = int(len(tiles) * spec.wall_density)
+        self.walls = self.random.sample(tiles, wall_count)
+        self._walls = set(self.walls)
+        self.open_tiles = [t for t in tiles if t not in self._walls]
+        positions = self.random.sample(
+            self.open_tiles, spec.ants + spec.enemies + spec.food
+        )
+        self.ants = dict(enumerate(positions[:spec.ants]))
+        self.enemy_ants = dict(
+            (spec.ants + i, p)
+            for i, p in enumerate(positions[spec.ants:-spec.food or None])
+        )
+        self.food = set(positions[len(positions) - spec.food:])
+
+    def _wrap(self, x, y):
+        return (x % self.width, y % self.height)
+
+    def game_info(self):
+        def entities(ants, owner):
+            return [
+                {'X': x, 'Y': y, 'Id': ant_id, 'Owner': owner}
+                for ant_id, (x, y) in ants.items()
+            ]
+        return {
+            'Width': self.width,
+            'Height': self.height,
+            'FogOfWar': 8,
+            'Turn': self.turn,
+            'TotalFood': 0,
+            'IsGameOver': False,
+            'FriendlyAnts': entities(self.ants, self.FRIENDLY),
+            'EnemyAnts': entities(self.enemy_ants, self.ENEMY),
+            'VisibleFood': [{'X': x, 'Y': y} for x, y in self.food],
+            'Walls': [{'X': x, 'Y': y} for x, y in self.walls],
+            'Hill': {'X': self.hill[0], 'Y': self.hill[1],
+                     'Owner': self.FRIENDLY},
+            'EnemyHills': [{'X': self.enemy_hill[0], 'Y': self.enemy_hill[1],
+                            'Owner': self.ENEMY}],
+        }
+
+    def advance(self):
+        """
+        Moves every ant one random step and replaces eaten food.
+        """
+        occupied = set(self.ants.values()) | set(self.enemy_ants.values())
+        for ants in (self.ants, self.enemy_ants):
+            for ant_id, (x, y) in ants.items():
+                dx, dy = self.random.choice(self._STEPS)
+                position = self._wrap(x + dx, y + dy)
+                if position in self._walls or position in occupied:
+                    continue
+                occupied.discard((x, y))
+                occupied.add(position)
+                ants[ant_id] = position
+        eaten = self.food & occupied
+        self.food -= eaten
+        while len(self.food) < self.spec.food:
+            position = self.random.choice(self.open_tiles)
+            if position not in occupied:
+                self.food.add(position)
+        self.turn += 1
+
+
+class _BenchmarkClient(object):
+    name = SyntheticGame.FRIENDLY
+    deadline = None
+
+
+def measure(func, samples, prepare=None):
+    """
+    Calls func samples times and returns a dict of timing statistics, in
+    milliseconds, and memory statistics of one more call.
+
+    If given, prepare is called, untimed, before every call to func, and its
+    return value is passed to func.
+    """
+    durations = []
+    for _ in range(samples + 1):
+        arg = prepare() if prepare else None
+        start = time.perf_counter()
+        func(arg)
+        durations.append(time.perf_counter() - start)
+    arg = prepare() if prepare else None
+    tracemalloc.start()
+    try:
+        before = tracemalloc.take_snapshot()
+        func(arg)
+        after = tracemalloc.take_snapshot()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    blocks = sum(
+        max(stat.count_diff, 0)
+        for stat in after.compare_to(before, 'lineno')
+    )
+    # The first call warms up caches and is not counted.
+    durations = sorted(durations[1:])
+    return {
+        'samples': len(durations),
+        'mean_ms': 1000 * sum(durations) / len(durations),
+        'p50_ms': 1000 * percentile(durations, 0.5),
+        'p99_ms': 1000 * percentile(durations, 0.99),
+        'retained_blocks': blocks,
+        'peak_kib': peak / 1024,
+    }
+
+
+def percentile(sorted_values, fraction):
+    index = min(int(len(sorted_values) * fraction), len(sorted_values) - 1)
+    return sorted_values[index]
+
+
+class Benchmark(object):
+    """
+    Times the components of a turn on one synthetic board.
+    """
+    COMPONENTS = (
+        'find_path', 'update_gamestate', 'calculate_visible_coordinates',
+        'remember_visible', 'execute', 'render', 'turn'
+    )
+
+    def __init__(self, spec, samples=10):
+        self.spec = spec
+        self.samples = samples
+        self.game = SyntheticGame(spec)
+        self.ai = ai.JohnAI()
+        self.renderer = ui.GameTextRenderer()
+        self.controller = client.AntGameController(
+            _BenchmarkClient(), self.ai, self.renderer
+        )
+        self.controller.initialize_gamestate(self.game.game_info())
+        self.ai.initialize(self.controller.gamestate)
+        self.controller.update_gamestate(self.game.game_info())
+        self.gamestate = self.controller.gamestate
+        self.logger = logging.getLogger('ants.benchmark.Benchmark')
+
+    def run(self, components=COMPONENTS):
+        results = dict()
+        for component in components:
+            self.logger.info('Running %s on %s', component, self.spec.name)
+            results[component] = getattr(self, 'bench_' + component)()
+        return results
+
+    def next_game_info(self):
+        self.game.advance()
+        return self.game.game_info()
+
+    def bench_find_path(self):
+        gameboard = self.gamestate.get_gameboard()
+        pathfinder = pathfinding.Pathfinder(gameboard)
+        rnd = random.Random(self.spec.seed)
+        coordinate_at = gameboard.coordinates.get
+        def endpoints(_=None):
+            (x1, y1), (x2, y2) = rnd.sample(self.game.open_tiles, 2)
+            return coordinate_at(x1, y1), coordinate_at(x2, y2)
+        return measure(
+            lambda ends: pathfinder.find_path(*ends), self.samples, endpoints
+        )
+
+    def bench_update_gamestate(self):
+        return measure(
+            self.controller.update_gamestate, self.samples,
+            self.next_game_info
+        )
+
+    def bench_calculate_visible_coordinates(self):
+        gameboard = self.gamestate.get_gameboard()
+        return measure(
+            lambda _: gameboard.calculate_visible_coordinates(),
+            self.samples, self._update
+        )
+
+    def bench_remember_visible(self):
+        gameboard = self.gamestate.get_gameboard()
+        return measure(
+            lambda _: gameboard.remember_visible(self.gamestate.turn_number),
+            self.samples, self._update
+        )
+
+    def bench_execute(self):
+        return measure(
+            lambda _: self.ai.execute(self.gamestate), self.samples,
+            self._update
+        )
+
+    def bench_render(self):
+        return measure(
+            lambda _: self.renderer.render(self.gamestate), self.samples,
+            self._update
+        )
+
+    def bench_turn(self):
+        def turn(game_info):
+            self.controller.update_gamestate(game_info)
+            self.ai.execute(self.gamestate)
+            self.renderer.render(self.gamestate)
+        return measure(turn, self.samples, self.next_game_info)
+
+    def _update(self):
+        self.controller.update_gamestate(self.next_game_info())
+
+
+def compare(results, baseline, tolerance):
+    """
+    Returns a list of (board, component, baseline p50, p50) for every
+    component whose median got slower than its baseline by more than the
+    tolerated fraction.
+    """
+    regressions = []
+    for board, components in sorted(results.items()):
+        for component, stats in sorted(components.items()):
+            base = baseline.get(board, {}).get(component)
+            if base is None:
+                continue
+            if stats['p50_ms'] > base['p50_ms'] * (1 + tolerance):
+                regressions.append(
+                    (board, component, base['p50_ms'], stats['p50_ms'])
+                )
+    return regressions
+
+
+def format_results(results, baseline=None):
+    baseline = baseline or dict()
+    rows = [(
+        'board', 'component', 'p50 ms', 'p99 ms', 'blocks', 'peak KiB',
+        'vs baseline'
+    )]
+    for board, components in results.items():
+        for component, stats in components.items():
+            base = baseline.get(board, {}).get(component)
+            change = ''
+            if base is not None and base['p50_ms'] > 0:
+                change = '{0:+.1%}'.format(
+                    stats['p50_ms'] / base['p50_ms'] - 1
+                )
+            rows.append((
+                board, component, '{0:.3f}'.format(stats['p50_ms']),
+                '{0:.3f}'.format(stats['p99_ms']),
+                str(stats['retained_blocks']),
+                '{0:.1f}'.format(stats['peak_kib']), change
+            ))
+    widths = [max(len(row[i]) for row in rows) for i in range(len(rows[0]))]
+    return '\n'.join(
+        '  '.join(cell.ljust(width) for cell, width in zip(row, widths))
+        for row in rows
+    )
+
+
+def main(argv):
+    a = argparse.ArgumentParser(
+        description='Benchmarks the turn pipeline on synthetic boards.'
+    )
+    a.add_argument(
+        '--sizes', default='30x30,100x100,250x250,500x500',
+        help=('Comma separated board sizes, as WIDTHxHEIGHT. Defaults to '
+              '%(default)s.')
+    )
+    a.add_argument(
+        '--components', default=','.join(Benchmark.COMPONENTS),
+        help='Comma separated components to time. Defaults to all of them.'
+    )
+    a.add_argument('--samples', type=int, default=10,
+                   help='Timed runs per component. Defaults to %(default)s.')
+    a.add_argument('--wall-density', dest='wall_density', type=float,
+                   default=0.1)
+    a.add_argument('--ants', type=int, default=None,
+                   help='Friendly ants; scales with the board by default.')
+    a.add_argument('--enemies', type=int, default=None,
+                   help='Enemy ants; scales with the board by default.')
+    a.add_argument('--food', type=int, default=None,
+                   help='Food items; scales with the board by default.')
+    a.add_argument('--seed', type=int, default=0)
+    a.add_argument(
+        '--baseline', default=None,
+        help='Compares the results against a baseline saved earlier.'
+    )
+    a.add_argument(
+        '--tolerance', type=float, default=0.2,
+        help=('The fraction by which a median may exceed its baseline '
+              'before it counts as a regression. Defaults to %(default)s.')
+    )
+    a.add_argument('--save-baseline', dest='save_baseline', default=None,
+                   help='Writes the results to this file as JSON.')
+    a.add_argument(
+        '--log-level', dest='log_level', default='error',
+        choices=('debug', 'info', 'warning', 'error', 'critical')
+    )
+    args = a.parse_args(argv)
+    logging.basicConfig()
+    log_level = getattr(logging, args.log_level.upper())
+    logging.getLogger('ants').setLevel(log_level)
+
+    components = args.components.split(',')
+    for component in components:
+        if component not in Benchmark.COMPONENTS:
+            a.error('Unknown component: ' + component)
+    results = dict()
+    for size in args.sizes.split(','):
+        spec = BoardSpec.parse(
+            size, wall_density=args.wall_density, ants=args.ants,
+            enemies=args.enemies, food=args.food, seed=args.seed
+        )
+        results[spec.name] = Benchmark(spec, args.samples).run(components)
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    print(format_results(results, baseline))
+    if args.save_baseline:
+        with open(args.save_baseline, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+    if baseline is not None:
+        regressions = compare(results, baseline, args.tolerance)
+        for board, component, before, after in regressions:
+            print('REGRESSION {0} {1}: {2:.3f} ms -> {3:.3f} ms'.format(
+                board, component, before, after
+            ))
+        if regressions:
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
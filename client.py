@@ -1,12 +1,20 @@
 #!/usr/bin/env python3
 
+import inspect
 import logging
 import json
 import requests
+import requests.adapters
+import threading
 import time
 
+import decoding
 import gameboard as gb
 import gamestate
+from metrics import NULL_METRICS
+
+# Errors from requests that the game server may answer next time.
+NETWORK_ERRORS = (requests.ConnectionError, requests.Timeout)
 
 
 class AntAIClient(object):
@@ -16,14 +24,67 @@ class AntAIClient(object):
     }
     _METHOD_GET = 'get'
     _METHOD_POST = 'post'
+    # Timeouts, in seconds, for requests made with and without a deadline.
+    DEFAULT_TIMEOUT = 10.0
+    MIN_TIMEOUT = 0.25
+    # Seconds to wait before the first retry; doubles with every retry.
+    RETRY_BACKOFF = 0.05
 
-    def __init__(self, name, web_service_url):
+    def __init__(self, name, web_service_url, max_retries=2, pool_size=4,
+                 session=None):
         self.name = name
         self.web_service_url = web_service_url
         self.game_id = None
         self.auth_token = None
+        self.max_retries = max_retries
+        self.pool_size = pool_size
+        # A session given here is shared by every thread; otherwise every
+        # thread gets a session of its own, since requests.Session is not
+        # safe to share between threads.
+        self._shared_session = session
+        self._local = threading.local()
+        self._sessions = []
+        self._lock = threading.Lock()
+        # When set, the time.monotonic() value requests made without a
+        # deadline of their own have to finish by.
+        self.deadline = None
+        self.requests_sent = 0
+        self.retries = 0
         self.logger = logging.getLogger('ants.client.AntAIClient')
 
+    @property
+    def session(self):
+        """
+        The session requests from the calling thread are sent through.
+        """
+        if self._shared_session is not None:
+            return self._shared_session
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(
+                pool_connections=1, pool_maxsize=self.pool_size
+            )
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            self._local.session = session
+            with self._lock:
+                self._sessions.append(session)
+        return session
+
+    def _all_sessions(self):
+        if self._shared_session is not None:
+            return [self._shared_session]
+        with self._lock:
+            return list(self._sessions)
+
+    def close(self):
+        for session in self._all_sessions():
+            session.close()
+
+    def set_deadline(self, deadline):
+        self.deadline = deadline
+
     def login(self, game_id=None):
         login_data = {
             'GameId': game_id,
@@ -34,39 +95,110 @@ class AntAIClient(object):
         self.game_id = data['GameId']
         self.auth_token = data['AuthToken']
 
-    def get_game_info(self):
+    def get_game_info(self, deadline=None):
         url = self._format_url(
             'api/game/{0}/status/{1}',
             self.game_id, self.auth_token
         )
-        json = self.request(url, None, self._METHOD_POST)
+        json = self.request(
+            url, None, self._METHOD_POST, idempotent=True, deadline=deadline
+        )
         self.logger.debug(json)
         return json
 
-    def get_turn_info(self):
+    def get_turn_info(self, deadline=None):
         url = self._format_url(
             'api/game/{0}/turn',
             self.game_id
         )
-        json = self.request(url, None, self._METHOD_GET)
+        json = self.request(
+            url, None, self._METHOD_GET, idempotent=True, deadline=deadline
+        )
         self.logger.debug(json)
         return json
 
-    def request(self, url, data, method):
+    def request(self, url, data, method, idempotent=False, deadline=None):
+        """
+        Sends a request to the game server and returns the decoded response.
+
+        The request has to finish by deadline, a time.monotonic() value,
+        or by self.deadline if it is None. Idempotent requests are retried
+        up to max_retries times, with exponential backoff, if the
+        connection fails or times out.
+        """
         assert method in (self._METHOD_GET, self._METHOD_POST)
+        if deadline is None:
+            deadline = self.deadline
         json_data = json.dumps(data)
-        method_func = getattr(requests, method)
-        response = method_func(url, headers=self._HTTP_HEADERS, data=json_data)
-        return response.json()
+        method_func = getattr(self.session, method)
+        attempt = 0
+        while True:
+            with self._lock:
+                self.requests_sent += 1
+            try:
+                response = method_func(
+                    url, headers=self._HTTP_HEADERS, data=json_data,
+                    timeout=self._timeout(deadline)
+                )
+                return decoding.loads(response.content)
+            except NETWORK_ERRORS as e:
+                backoff = self.RETRY_BACKOFF * 2**attempt
+                if not idempotent or attempt >= self.max_retries or \
+                        not self._time_left(
+                            backoff + self.MIN_TIMEOUT, deadline
+                        ):
+                    raise
+                self.logger.warning('Retrying %s after error: %s', url, e)
+                attempt += 1
+                with self._lock:
+                    self.retries += 1
+                time.sleep(backoff)
+
+    def connection_stats(self):
+        """
+        Returns a dict with the number of connections opened and requests
+        sent through the session's connection pools, and how many of those
+        requests reused an already open connection.
+        """
+        opened = 0
+        sent = 0
+        # The same adapter may be mounted for several URL prefixes.
+        adapters = dict(
+            (id(a), a) for session in self._all_sessions()
+            for a in session.adapters.values()
+        )
+        for adapter in adapters.values():
+            pools = getattr(getattr(adapter, 'poolmanager', None), 'pools', {})
+            for key in pools.keys():
+                pool = pools[key]
+                opened += pool.num_connections
+                sent += pool.num_requests
+        return {
+            'connections_opened': opened,
+            'requests': sent,
+            'connections_reused': max(sent - opened, 0),
+            'retries': self.retries,
+        }
 
-    def submit_move_list(self, moves):
+    def _timeout(self, deadline):
+        if deadline is None:
+            return self.DEFAULT_TIMEOUT
+        remaining = deadline - time.monotonic()
+        return min(max(remaining, self.MIN_TIMEOUT), self.DEFAULT_TIMEOUT)
+
+    def _time_left(self, seconds, deadline):
+        return deadline is None or time.monotonic() + seconds < deadline
+
+    def submit_move_list(self, moves, deadline=None):
         url = self._format_url('api/game/update')
         move_list_data = {
             'GameId': self.game_id,
             'AuthToken': self.auth_token,
             'MoveAntRequests': [move.to_dict() for move in moves]
         }
-        self.request(url, move_list_data, self._METHOD_POST)
+        self.request(
+            url, move_list_data, self._METHOD_POST, deadline=deadline
+        )
 
     def _format_url(self, path, *url_vars):
         return '/'.join((
@@ -94,12 +226,54 @@ class AntMove(object):
         }
 
 
+def takes_deadline(execute):
+    """
+    Returns whether execute, the execute() method of an AI, takes a
+    deadline keyword argument; AIs written before deadlines existed only
+    take the gamestate.
+    """
+    try:
+        parameters = inspect.signature(execute).parameters.values()
+    except (TypeError, ValueError):
+        return False
+    return any(
+        p.name == 'deadline' or p.kind == p.VAR_KEYWORD for p in parameters
+    )
+
+
 class AntGameController(object):
-    def __init__(self, client, ai, renderer=None):
+    # Time at the end of a turn kept free for submitting the moves: this
+    # many seconds, but no more than this fraction of the turn.
+    SUBMIT_MARGIN = 0.15
+    SUBMIT_MARGIN_FRACTION = 0.2
+
+    def __init__(self, client, ai, renderer=None, incremental_updates=True,
+                 metrics=None, recorder=None):
         self.client = client
         self.ai = ai
+        self._ai_takes_deadline = takes_deadline(ai.execute)
         self.renderer = renderer
+        self.incremental_updates = incremental_updates
+        if metrics is None:
+            metrics = NULL_METRICS
+        self.metrics = metrics
+        # If set, the recording.GameRecorder every turn is written to.
+        self.recorder = recorder
         self.gamestate = None
+        # The walls of the previous turn, for incremental updates.
+        self._walls = None
+        self._turn_length = None
+        # Turns the server could not be reached for, the turn the server
+        # was last found to be on and the last turn missed.
+        self.missed_turns = 0
+        self._polled_turn = None
+        self._missed_turn = -1
+        # Client counters at the start of the turn, and missed turns at the
+        # end of the previous one, for metrics.
+        self._requests_sent = 0
+        self._retries = 0
+        self._missed_turns = 0
+        self.logger = logging.getLogger('ants.client.AntGameController')
 
     def initialize_gamestate(self, game_info):
         self.gamestate = gamestate.GameState(
@@ -109,64 +283,208 @@ class AntGameController(object):
         )
         self.gamestate.turn_number = game_info['Turn']
         self.gamestate.total_food = game_info['TotalFood']
+        self._walls = None
 
     def update_gamestate(self, game_info):
-        self.gamestate.get_gameboard().clear_tile_entities()
+        if self.incremental_updates:
+            self._apply_game_info_changes(game_info)
+        else:
+            self._apply_game_info(game_info)
         self.gamestate.total_food = game_info['TotalFood']
-        info_types = (
-            'FriendlyAnts', 'EnemyAnts', 'VisibleFood', 'Walls', 'Hill',
-            'EnemyHills'
-        )
-        entity_types = ('FriendlyAnts', 'EnemyAnts', 'VisibleFood')
-        for info_name in info_types:
-            objs = game_info[info_name]
-            # Our hill is the only information we want that isn't iterable,
-            # so let's make it iterable.
-            if info_name == 'Hill':
-                objs = (objs, )
-            for obj in objs:
-                obj_coordinate = gb.Coordinate(obj['X'], obj['Y'])
-                tile = self.gamestate.get_gameboard().get_tile(obj_coordinate)
-                if tile.get_entity() is not None and info_name in entity_types:
-                    # The server has a bug where there can be multiple entities
-                    continue
-                if info_name in ('FriendlyAnts', 'EnemyAnts'):
-                    tile.set_entity(
-                        gb.Ant(ant_id=obj['Id'], owner=obj['Owner'])
-                    )
-                elif info_name == 'Walls':
-                    tile.make_wall()
-                elif info_name == 'VisibleFood':
-                    tile.set_entity(gb.Food())
-                elif info_name in ('Hill', 'EnemyHills'):
-                    tile.make_ant_hill(owner=obj['Owner'])
-        self.gamestate.get_gameboard().calculate_visible_coordinates()
+        gameboard = self.gamestate.get_gameboard()
+        gameboard.calculate_visible_coordinates()
         self.gamestate.turn_number = game_info['Turn']
+        gameboard.remember_visible(self.gamestate.turn_number)
         self.gamestate.game_over = game_info['IsGameOver']
 
+    def _apply_game_info(self, game_info):
+        """
+        Rebuilds every entity, wall and hill of the board from game_info.
+        """
+        gameboard = self.gamestate.get_gameboard()
+        gameboard.clear_tile_entities()
+        columns = decoding.GameInfoColumns(
+            game_info, gameboard.width, gameboard.height
+        )
+        gameboard.apply_entity_columns(columns)
+        gameboard.set_walls(decoding.wall_indexes(
+            game_info['Walls'], gameboard.width, gameboard.height
+        ))
+        self._apply_hills(columns)
+
+    def _apply_game_info_changes(self, game_info):
+        """
+        Applies only what changed on the board since the previous call.
+
+        Entities are diffed against the board, so the cost of changing it
+        scales with the number of ants and food that appeared, moved or
+        vanished.
+        """
+        gameboard = self.gamestate.get_gameboard()
+        columns = decoding.GameInfoColumns(
+            game_info, gameboard.width, gameboard.height
+        )
+        gameboard.apply_entity_columns(columns)
+        self._apply_walls(game_info['Walls'])
+        self._apply_hills(columns)
+
+    def _apply_walls(self, walls):
+        # Walls never go away, so an unchanged list holds nothing new.
+        # Comparing the whole list is cheap next to decoding it, and makes
+        # no assumption about the order the server lists walls in.
+        if walls == self._walls:
+            return
+        gameboard = self.gamestate.get_gameboard()
+        gameboard.set_walls(
+            decoding.wall_indexes(walls, gameboard.width, gameboard.height)
+        )
+        self._walls = walls
+
+    def _apply_hills(self, columns):
+        tile_at_index = self.gamestate.get_gameboard().tile_at_index
+        for index, owner in zip(columns.hills.indexes, columns.hill_owners):
+            tile_at_index(index).make_ant_hill(owner=owner)
+
+    def turn_deadline(self):
+        """
+        Returns the time.monotonic() value the current turn ends at, or
+        None if it is not known.
+        """
+        return self.client.deadline
+
+    def ai_deadline(self):
+        """
+        Returns the time.monotonic() value the AI has to be done by this
+        turn, or None if it is not known.
+        """
+        deadline = self.turn_deadline()
+        if deadline is None:
+            return None
+        return deadline - min(
+            self.SUBMIT_MARGIN,
+            self._turn_length * self.SUBMIT_MARGIN_FRACTION
+        )
+
+    def start_turn_metrics(self):
+        self.metrics.start_turn()
+        self._requests_sent = self.client.requests_sent
+        self._retries = self.client.retries
+
+    def end_turn_metrics(self, movelist, slack):
+        """
+        Records the counts of the turn and ends it. slack is the time that
+        was left until the AI's deadline once it returned, if it had one.
+        """
+        metrics = self.metrics
+        if not metrics.enabled:
+            return
+        metrics.count('moves', len(movelist))
+        metrics.count(
+            'http_requests', self.client.requests_sent - self._requests_sent
+        )
+        metrics.count('http_retries', self.client.retries - self._retries)
+        # Since the end of the previous turn, so that a submission that
+        # fails after its turn ended is counted in the next.
+        metrics.count('missed_turns', self.missed_turns - self._missed_turns)
+        self._missed_turns = self.missed_turns
+        if slack is not None:
+            metrics.count('deadline_slack_seconds', slack)
+        metrics.end_turn(self.gamestate.turn_number)
+
+    def run_ai(self):
+        """
+        Runs the AI for this turn and returns its moves along with the time
+        left until its deadline, or None if it had none. AIs whose execute()
+        takes no deadline are not given one.
+        """
+        deadline = self.ai_deadline()
+        with self.metrics.phase('execute'):
+            if self._ai_takes_deadline:
+                movelist = self.ai.execute(self.gamestate, deadline=deadline)
+            else:
+                movelist = self.ai.execute(self.gamestate)
+        slack = None
+        if deadline is not None:
+            slack = deadline - time.monotonic()
+        return movelist, slack
+
     def sleep_until_next_turn(self):
+        self.client.set_deadline(None)
         turn_info = self.client.get_turn_info()
-        while turn_info['Turn'] <= self.gamestate.turn_number:
+        self._polled_turn = turn_info['Turn']
+        while turn_info['Turn'] <= self.last_turn():
             if turn_info['MillisecondsUntilNextTurn'] < 0:
                 # XXX: Ran into a bug (?) where this value is negative
                 return
             time.sleep(turn_info['MillisecondsUntilNextTurn']/1000)
             turn_info = self.client.get_turn_info()
+            self._polled_turn = turn_info['Turn']
+        # Requests for this turn have to be done before the next one starts.
+        self._turn_length = turn_info['MillisecondsUntilNextTurn']/1000
+        self.client.set_deadline(time.monotonic() + self._turn_length)
+
+    def miss_turn(self, error):
+        """
+        Records that the moves of the current turn were lost to error, a
+        request that failed or timed out.
+        """
+        turn = self.gamestate.turn_number
+        if self._polled_turn is not None and self._polled_turn > turn:
+            turn = self._polled_turn
+        self.logger.warning('Missed turn %d: %s', turn, error)
+        self.missed_turns += 1
+        self._missed_turn = turn
+
+    def last_turn(self):
+        """
+        Returns the last turn played or missed; waiting for the next turn
+        waits for the server to move past it.
+        """
+        return max(self.gamestate.turn_number, self._missed_turn)
+
+    def play_turn(self):
+        """
+        Plays the current turn. Returns False once the game is over.
+        """
+        metrics = self.metrics
+        with metrics.phase('get_game_info'):
+            game_info = self.client.get_game_info()
+        with metrics.phase('update_gamestate'):
+            self.update_gamestate(game_info)
+        if self.gamestate.game_over:
+            return False
+        movelist, slack = self.run_ai()
+        with metrics.phase('submit_move_list'):
+            self.client.submit_move_list(movelist)
+        # The board does not change until the next turn, so it can be
+        # displayed once the moves are on their way.
+        if self.renderer:
+            with metrics.phase('render'):
+                self.renderer.display(self.gamestate)
+        if self.recorder:
+            self.recorder.record_turn(game_info, movelist)
+        self.end_turn_metrics(movelist, slack)
+        return True
 
     def start(self):
         game_info = self.client.get_game_info()
         self.initialize_gamestate(game_info)
+        if self.recorder:
+            self.recorder.record_start(self.client.name, game_info)
         self.ai.initialize(self.gamestate)
         self.sleep_until_next_turn()
         while True:
-            game_info = self.client.get_game_info()
-            self.update_gamestate(game_info)
-            if self.gamestate.game_over:
-                break
-            movelist = self.ai.execute(self.gamestate)
-            if self.renderer:
-                self.renderer.display(self.gamestate)
-            self.client.submit_move_list(movelist)
+            self.start_turn_metrics()
+            try:
+                if not self.play_turn():
+                    break
+            except NETWORK_ERRORS as e:
+                # A slow or failed request costs this turn, not the game.
+                self.miss_turn(e)
+                self.end_turn_metrics([], None)
             self.sleep_until_next_turn()
         if self.renderer:
             self.renderer.display(self.gamestate)
+        self.logger.info(
+            'Connection stats: %s', self.client.connection_stats()
+        )
@@ -0,0 +1,85 @@
+"""
+Decoding of game server responses.
+
+Responses are parsed with orjson when it is installed, and with the standard
+library's json module otherwise. The entities of a game_info payload can
+then be read into columns, one array per field and entity type, which the
+Gameboard applies in bulk.
+"""
+
+from array import array
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def loads(content):
+    """
+    Parses the JSON document in content, a bytes object.
+    """
+    if orjson is not None:
+        return orjson.loads(content)
+    return json.loads(content.decode('utf-8'))
+
+
+class EntityColumns(object):
+    """
+    The x and y coordinates, tile indexes, IDs and owners of a list of
+    entities from a game_info payload. Food has no IDs or owners.
+    """
+    __slots__ = ('x', 'y', 'indexes', 'ids', 'owners')
+
+    def __init__(self, objs, width, height, with_owners=True):
+        self.x = array('l', [o['X'] for o in objs])
+        self.y = array('l', [o['Y'] for o in objs])
+        self.indexes = array('l', [
+            (y % height) * width + x % width for x, y in zip(self.x, self.y)
+        ])
+        if with_owners:
+            self.ids = array('l', [o['Id'] for o in objs])
+            self.owners = [o['Owner'] for o in objs]
+        else:
+            self.ids = None
+            self.owners = None
+
+    def __len__(self):
+        return len(self.indexes)
+
+
+class GameInfoColumns(object):
+    """
+    The entities of a game_info payload, in columns.
+
+    Walls are not included, since the server sends all of them every turn;
+    wall_indexes() reads them when they are needed.
+    """
+
+    def __init__(self, game_info, width, height):
+        self.width = width
+        self.height = height
+        self.friendly_ants = EntityColumns(
+            game_info['FriendlyAnts'], width, height
+        )
+        self.enemy_ants = EntityColumns(game_info['EnemyAnts'], width, height)
+        self.food = EntityColumns(
+            game_info['VisibleFood'], width, height, with_owners=False
+        )
+        self.hills = EntityColumns(
+            [game_info['Hill']] + game_info['EnemyHills'], width, height,
+            with_owners=False
+        )
+        self.hill_owners = [game_info['Hill']['Owner']] + [
+            o['Owner'] for o in game_info['EnemyHills']
+        ]
+
+
+def wall_indexes(walls, width, height):
+    """
+    Returns the tile indexes of the walls of a game_info payload.
+    """
+    return array('l', [
+        (o['Y'] % height) * width + o['X'] % width for o in walls
+    ])
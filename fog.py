@@ -0,0 +1,155 @@
+"""
+Memory of the parts of the board the AI cannot currently see.
+
+Whole-board masks are kept as Python integers with a byte per tile, tile i
+in byte i, each byte 0 or 1. Bitwise operations and shifts by whole bytes
+then work on every tile at once, in C, which keeps the frontier cheap to
+compute even on large boards. The turns tiles were last seen are kept the
+same way, with four bytes per tile.
+"""
+
+from array import array
+from collections import deque
+import logging
+import sys
+
+
+class FogMemory(object):
+    """
+    Remembers the turn every tile of a width x height board, which wraps
+    around its edges, was last seen, and finds the exploration frontier:
+    the open tiles seen within the last stale_turns turns that are next to
+    tiles that were not.
+
+    Walls and ant hills stay on the Gameboard once they have been seen, so
+    they need not be remembered here.
+    """
+    STALE_TURNS = 30
+
+    def __init__(self, width, height, stale_turns=STALE_TURNS):
+        self.width = width
+        self.height = height
+        self.stale_turns = stale_turns
+        size = width * height
+        # The turn every tile was last seen, or -1.
+        self.last_seen = array('i', (-1, )) * size
+        # The same, four bytes per tile, for update().
+        self._last_seen = (1 << (32 * size)) - 1
+        self._full = int.from_bytes(b'\x01' * size, 'little')
+        self._first_column = int.from_bytes(
+            (b'\x01' + b'\x00' * (width - 1)) * height, 'little'
+        )
+        # Masks of the tiles seen on each of the last stale_turns turns.
+        self._recent = deque(maxlen=stale_turns)
+        self._walls = 0
+        self.frontier = 0
+        self._frontier_bytes = bytes(size)
+        self.logger = logging.getLogger('ants.fog.FogMemory')
+
+    def copy(self):
+        memory = FogMemory(self.width, self.height, self.stale_turns)
+        memory.last_seen = self.last_seen[:]
+        memory._last_seen = self._last_seen
+        memory._recent.extend(self._recent)
+        memory._walls = self._walls
+        memory.frontier = self.frontier
+        memory._frontier_bytes = self._frontier_bytes
+        return memory
+
+    def _rotate(self, mask, tiles):
+        """
+        Moves every tile of mask tiles indexes forward, wrapping around the
+        end of the board.
+        """
+        size = self.width * self.height
+        tiles %= size
+        if tiles == 0:
+            return mask
+        return ((mask << (8 * tiles)) | (mask >> (8 * (size - tiles)))) & \
+            self._full
+
+    def neighbors(self, mask):
+        """
+        Returns the mask of the tiles next to a tile of mask.
+        """
+        width = self.width
+        first_column = self._first_column
+        rotate = self._rotate
+        # Left and right neighbors wrap around within each row, rather than
+        # onto the row before or after.
+        left_in_mask = (rotate(mask, 1) & ~first_column) | \
+            (rotate(mask, 1 - width) & first_column)
+        right_in_mask = rotate(mask & ~first_column, -1) | \
+            rotate(mask & first_column, width - 1)
+        return rotate(mask, width) | rotate(mask, -width) | \
+            left_in_mask | right_in_mask
+
+    def update(self, turn, visible, walls=None):
+        """
+        Records the tiles in visible, a bytes-like object with a byte per
+        tile, 1 for visible tiles and 0 otherwise, as seen on turn, and
+        recomputes the frontier.
+
+        walls, if given, is a bytes-like object with a byte per tile, 1 for
+        walls and 0 otherwise; it only needs to be given when it changed.
+        """
+        size = self.width * self.height
+        self._recent.append(int.from_bytes(visible, 'little'))
+        # Four bytes for every tile, holding 1 if it is visible.
+        seen_lanes = bytearray(4 * size)
+        seen_lanes[0::4] = visible
+        seen_lanes = int.from_bytes(seen_lanes, 'little')
+        self._last_seen = \
+            (self._last_seen & ~(seen_lanes * 0xffffffff)) | \
+            (seen_lanes * turn)
+        last_seen = array('i')
+        last_seen.frombytes(self._last_seen.to_bytes(4 * size, 'little'))
+        if sys.byteorder == 'big':
+            last_seen.byteswap()
+        self.last_seen = last_seen
+        if walls is not None:
+            self._walls = int.from_bytes(walls, 'little')
+        recent = 0
+        for mask in self._recent:
+            recent |= mask
+        open_tiles = self._full & ~self._walls
+        unexplored = open_tiles & ~recent
+        self.frontier = recent & open_tiles & self.neighbors(unexplored)
+        self._frontier_bytes = self.frontier.to_bytes(size, 'little')
+
+    def on_frontier(self, index):
+        return self._frontier_bytes[index] == 1
+
+    def frontier_indexes(self):
+        """
+        Yields the tile indexes on the frontier, in order.
+        """
+        frontier = self._frontier_bytes
+        index = frontier.find(1)
+        while index >= 0:
+            yield index
+            index = frontier.find(1, index + 1)
+
+    def cell_of(self, index, cell_size):
+        """
+        Returns the number of the square cell of cell_size tiles a side
+        that holds index.
+        """
+        width = self.width
+        columns = -(-width // cell_size)
+        return (index // width // cell_size) * columns + \
+            (index % width) // cell_size
+
+    def frontier_cells(self, cell_size):
+        """
+        Splits the board into square cells of cell_size tiles a side and
+        returns a dict with the lowest frontier tile index of every cell
+        that has any, keyed by cell_of().
+        """
+        cell_of = self.cell_of
+        cells = dict()
+        for index in self.frontier_indexes():
+            cell = cell_of(index, cell_size)
+            if cell not in cells:
+                cells[cell] = index
+        return cells
@@ -1,85 +1,385 @@
+from array import array
+import copy
 from enum import Enum
 import logging
 
+from fog import FogMemory
 from gridutils import Coordinate
+from spatial import SpatialIndex, SummedAreaTable
+from visibility import VisibilityMap
 import gridutils
 
 
 class Gameboard(object):
+    """
+    Represents the tiles of the game.
+
+    Tile state is kept in flat arrays indexed by y * width + x. Tile objects
+    are lightweight views onto those arrays and are created on demand.
+    """
+
     def __init__(self, width, height):
         self.width = width
         self.height = height
         self.gamestate = None
         self.friendly_ant_hill = None
-        self.friendly_ants = []
         self.enemy_ant_hill = None
-        self.enemy_ants = []
+        # Occupied tiles, keyed by tile index.
+        self._friendly_ants = dict()
+        self._enemy_ants = dict()
+        self._food = dict()
         self._ants_by_id = dict()
-        self.food = []
-        self.tiles = []
-        self.visible_coordinates = set()
+        # The same tiles again, for queries by distance.
+        self.friendly_ant_index = SpatialIndex(width, height)
+        self.enemy_ant_index = SpatialIndex(width, height)
+        self.food_index = SpatialIndex(width, height)
+        # SummedAreaTables of the entities above, built when first asked
+        # for after they change.
+        self._count_tables = dict()
+        self.visibility = None
+        # What was seen on earlier turns; see remember_visible().
+        self.fog = FogMemory(width, height)
+        # Incremented whenever a tile's traversability changes.
+        self.wall_version = 0
+        # The wall_version fog last saw the walls at.
+        self._fog_wall_version = None
         self.logger = logging.getLogger('ants.gameboard.Gameboard')
-        for row_number in range(self.height):
-            row = []
-            self.tiles.append(row)
-            for column_number in range(self.width):
-                coordinate = Coordinate(row_number, column_number)
-                row.append(Tile(coordinate, self))
+        size = width * height
+        self._tile_types = bytearray((TileType.basic.value, )) * size
+        # Owners are stored as indexes into self._owners; -1 means no owner.
+        self._hill_owners = array('h', (-1, )) * size
+        self._entity_kinds = bytearray(size)
+        self._entity_ids = array('l', (0, )) * size
+        self._entity_owners = array('h', (-1, )) * size
+        self._owners = []
+        self._owner_ids = dict()
+        self.coordinates = gridutils.CoordinateCache(width, height)
+
+    @classmethod
+    def with_tile_types(cls, width, height, tile_types):
+        """
+        Returns a board without entities whose tile types are read from
+        tile_types, a writable buffer holding the TileType value of every
+        tile, such as shared memory. Changes to the buffer show through.
+        """
+        board = cls(width, height)
+        board._tile_types = tile_types
+        return board
+
+    def tile_type_bytes(self):
+        """
+        Returns the TileType value of every tile, as bytes.
+        """
+        return bytes(self._tile_types)
+
+    def snapshot(self):
+        """
+        Returns a copy of the board that later changes to this one do not
+        affect, e.g. for reading from another thread. The copy must not be
+        changed itself.
+
+        The copy has no gamestate; GameState.snapshot() sets one.
+        """
+        board = copy.copy(self)
+        board.gamestate = None
+        board._tile_types = self._tile_types[:]
+        board._hill_owners = self._hill_owners[:]
+        board._entity_kinds = self._entity_kinds[:]
+        board._entity_ids = self._entity_ids[:]
+        board._entity_owners = self._entity_owners[:]
+        board._owners = list(self._owners)
+        board._owner_ids = dict(self._owner_ids)
+        tiles = dict()
+        for name in ('_friendly_ants', '_enemy_ants', '_food'):
+            board_tiles = dict(
+                (index, Tile(tile.coordinate, board, index))
+                for index, tile in getattr(self, name).items()
+            )
+            setattr(board, name, board_tiles)
+            tiles.update(board_tiles)
+        board._ants_by_id = dict(
+            (ant_id, tiles[tile.index])
+            for ant_id, tile in self._ants_by_id.items()
+        )
+        board.friendly_ant_index = self.friendly_ant_index.copy()
+        board.enemy_ant_index = self.enemy_ant_index.copy()
+        board.food_index = self.food_index.copy()
+        board._count_tables = dict()
+        for name in ('friendly_ant_hill', 'enemy_ant_hill'):
+            hill = getattr(self, name)
+            if hill is not None:
+                setattr(board, name, Tile(hill.coordinate, board, hill.index))
+        if self.visibility is not None:
+            board.visibility = self.visibility.copy()
+        board.fog = self.fog.copy()
+        return board
 
     def calculate_visible_coordinates(self):
-        self.visible_coordinates = set()
-        for ant_tile in self.friendly_ants:
-            self.visible_coordinates |= \
-                set(gridutils.get_filled_circle_coordinates(
-                    ant_tile.coordinate, self.gamestate.view_distance,
-                    modulo_x=self.width, modulo_y=self.height
-                ))
+        view_distance = self.gamestate.view_distance
+        if self.visibility is None or \
+                self.visibility.view_distance != view_distance:
+            self.visibility = VisibilityMap(
+                self.width, self.height, view_distance
+            )
+        self.visibility.update(self._friendly_ants.keys())
+
+    def remember_visible(self, turn):
+        """
+        Records the tiles visible now as seen on turn, in fog, after
+        calculate_visible_coordinates().
+        """
+        walls = None
+        if self._fog_wall_version != self.wall_version:
+            walls = self.translate_tile_types(_WALL_TABLE)
+            self._fog_wall_version = self.wall_version
+        self.fog.update(turn, self.visible_bytes(), walls)
+
+    @property
+    def friendly_ants(self):
+        return list(self._friendly_ants.values())
+
+    @property
+    def enemy_ants(self):
+        return list(self._enemy_ants.values())
+
+    @property
+    def food(self):
+        return list(self._food.values())
+
+    def _count_table(self, name):
+        table = self._count_tables.get(name)
+        if table is None:
+            table = SummedAreaTable(
+                self.width, self.height, getattr(self, name).keys()
+            )
+            self._count_tables[name] = table
+        return table
+
+    def friendly_ant_counts(self):
+        """
+        Returns a SummedAreaTable of the friendly ants.
+        """
+        return self._count_table('_friendly_ants')
+
+    def enemy_ant_counts(self):
+        """
+        Returns a SummedAreaTable of the enemy ants.
+        """
+        return self._count_table('_enemy_ants')
+
+    def food_counts(self):
+        """
+        Returns a SummedAreaTable of the food.
+        """
+        return self._count_table('_food')
 
     def clear_tile_entities(self):
-        for tile in self.itertiles():
-            tile.set_entity(None)
-        self.friendly_ants = []
-        self.enemy_ants = []
+        # Only tiles holding a registered entity can be occupied, so there
+        # is no need to walk the whole board.
+        kinds = self._entity_kinds
+        for tiles in (self._friendly_ants, self._enemy_ants, self._food):
+            for index in tiles:
+                kinds[index] = ENTITY_NONE
+        self._friendly_ants = dict()
+        self._enemy_ants = dict()
+        self._food = dict()
         self._ants_by_id = dict()
-        self.food = []
+        self.friendly_ant_index.clear()
+        self.enemy_ant_index.clear()
+        self.food_index.clear()
+        self._count_tables.clear()
+
+    def apply_entity_columns(self, columns):
+        """
+        Makes the ants and food in columns, a decoding.GameInfoColumns, the
+        only entities on the board.
+
+        Tiles whose entity did not change are left alone. If several
+        entities share a tile, friendly ants win over enemy ants, and ants
+        over food.
+        """
+        kinds = self._entity_kinds
+        ids = self._entity_ids
+        owners = self._entity_owners
+        entities = dict()
+        for ants in (columns.friendly_ants, columns.enemy_ants):
+            owner_ids = dict((o, self._owner_id(o)) for o in set(ants.owners))
+            for index, ant_id, owner in zip(ants.indexes, ants.ids,
+                                            ants.owners):
+                if index not in entities:
+                    entities[index] = (ENTITY_ANT, ant_id, owner_ids[owner])
+        food = (ENTITY_FOOD, 0, -1)
+        for index in columns.food.indexes:
+            if index not in entities:
+                entities[index] = food
+        for tiles in (self._friendly_ants, self._enemy_ants, self._food):
+            for index in list(tiles):
+                if entities.get(index) != \
+                        (kinds[index], ids[index], owners[index]):
+                    self.unregister_entity_tile(self.tile_at_index(index))
+                    kinds[index] = ENTITY_NONE
+        for index, (kind, ant_id, owner_id) in entities.items():
+            if kinds[index] == kind and ids[index] == ant_id and \
+                    owners[index] == owner_id:
+                continue
+            kinds[index] = kind
+            ids[index] = ant_id
+            owners[index] = owner_id
+            self.register_entity_tile(self.tile_at_index(index))
+
+    def set_walls(self, indexes):
+        """
+        Makes every tile in indexes a wall.
+        """
+        tile_types = self._tile_types
+        changed = False
+        for index in indexes:
+            if tile_types[index] != _WALL:
+                tile_types[index] = _WALL
+                changed = True
+        if changed:
+            self.wall_version += 1
 
     def itertiles(self):
-        for row in self.tiles:
-            for tile in row:
-                yield tile
+        for index in range(self.width * self.height):
+            yield self.tile_at_index(index)
 
     def get_ant(self, ant_id):
         return self._ants_by_id[ant_id]
 
+    def ant_id_at(self, index):
+        """
+        Returns the ID of the ant on the tile at index.
+        """
+        return self._entity_ids[index]
+
     def get_tile(self, coordinate):
         assert isinstance(coordinate, Coordinate)
-        return self.tiles[coordinate.x % self.width][coordinate.y % self.height]
+        return self.tile_at(coordinate.x, coordinate.y)
+
+    def tile_at(self, x, y):
+        """
+        Returns the tile at x, y, wrapping around the edges of the board.
+        """
+        return self.tile_at_index(
+            (y % self.height) * self.width + (x % self.width)
+        )
+
+    def tile_at_index(self, index):
+        return Tile(self.coordinates.at(index), self, index)
+
+    def neighbor_indexes(self, index):
+        """
+        Returns the indexes of the traversable tiles adjacent to index, in
+        right, left, down, up order.
+        """
+        width = self.width
+        size = width * self.height
+        x = index % width
+        row_start = index - x
+        neighbors = (
+            row_start + (x + 1) % width,
+            row_start + (x - 1) % width,
+            (index + width) % size,
+            (index - width) % size
+        )
+        tile_types = self._tile_types
+        return [n for n in neighbors if tile_types[n] != _WALL]
+
+    def index_of(self, coordinate):
+        return coordinate.to_index(self.width, self.height)
+
+    def index_at(self, x, y):
+        return (y % self.height) * self.width + (x % self.width)
+
+    def coordinate_at(self, index):
+        return self.coordinates.at(index)
 
     def tile_is_friendly(self, tile):
-        if tile.type == TileType.ant_hill:
-            return self.gamestate.is_friendly(tile.metadata['owner'])
-        elif isinstance(tile.get_entity(), Ant):
-            return self.gamestate.is_friendly(tile.get_entity().owner)
+        index = tile.index
+        if self._tile_types[index] == _ANT_HILL:
+            owner = self._owners[self._hill_owners[index]]
+        elif self._entity_kinds[index] == ENTITY_ANT:
+            owner = self._owners[self._entity_owners[index]]
         else:
             return False
+        return self.gamestate.is_friendly(owner)
 
     def tile_is_visible(self, tile):
-        return tile.coordinate in self.visible_coordinates
+        if self.visibility is None:
+            return False
+        return self.visibility.is_visible(tile.index)
+
+    def visible_ranges(self):
+        """
+        Yields (start, stop) ranges of tile indexes which together cover
+        every visible tile.
+        """
+        if self.visibility is None:
+            return iter(())
+        return self.visibility.visible_ranges()
+
+    def visible_bytes(self):
+        """
+        Returns a bytes object with a byte for every tile, 1 if it is
+        visible and 0 otherwise.
+        """
+        if self.visibility is None:
+            return bytes(self.width * self.height)
+        return self.visibility.visible_bytes()
+
+    def translate_tile_types(self, table):
+        """
+        Returns a bytearray with a byte for every tile, found by looking up
+        the value of the tile's TileType in table, as for bytes.translate().
+        """
+        return self._tile_types.translate(table)
+
+    def hill_indexes(self):
+        """
+        Yields the indexes of all ant hill tiles.
+        """
+        tile_types = self._tile_types
+        index = tile_types.find(_ANT_HILL)
+        while index >= 0:
+            yield index
+            index = tile_types.find(_ANT_HILL, index + 1)
 
     def register_entity_tile(self, tile):
-        e = tile.get_entity()
-        if e is None:
+        kind = self._entity_kinds[tile.index]
+        if kind == ENTITY_NONE:
             return
-        l = None
-        if isinstance(e, Ant):
+        tiles = None
+        if kind == ENTITY_ANT:
             if self.tile_is_friendly(tile):
-                l = self.friendly_ants
+                tiles = self._friendly_ants
+                spatial_index = self.friendly_ant_index
             else:
-                l = self.enemy_ants
-            self._ants_by_id[tile.get_entity().ant_id] = tile
-        elif isinstance(e, Food):
-            l = self.food
-        l.append(tile)
+                tiles = self._enemy_ants
+                spatial_index = self.enemy_ant_index
+            self._ants_by_id[self._entity_ids[tile.index]] = tile
+        elif kind == ENTITY_FOOD:
+            tiles = self._food
+            spatial_index = self.food_index
+        tiles[tile.index] = tile
+        spatial_index.add(tile.index)
+        self._count_tables.clear()
+
+    def unregister_entity_tile(self, tile):
+        index = tile.index
+        kind = self._entity_kinds[index]
+        if kind == ENTITY_ANT:
+            ant_id = self._entity_ids[index]
+            if self._ants_by_id.get(ant_id) == tile:
+                del self._ants_by_id[ant_id]
+            self._friendly_ants.pop(index, None)
+            self._enemy_ants.pop(index, None)
+            self.friendly_ant_index.discard(index)
+            self.enemy_ant_index.discard(index)
+        elif kind == ENTITY_FOOD:
+            self._food.pop(index, None)
+            self.food_index.discard(index)
+        self._count_tables.clear()
 
     def register_ant_hill(self, tile):
         if self.tile_is_friendly(tile):
@@ -87,40 +387,108 @@ class Gameboard(object):
         else:
             self.enemy_ant_hill = tile
 
+    def _owner_id(self, owner):
+        owner_id = self._owner_ids.get(owner)
+        if owner_id is None:
+            owner_id = len(self._owners)
+            self._owners.append(owner)
+            self._owner_ids[owner] = owner_id
+        return owner_id
+
 
 TileType = Enum('TileType', ('basic', 'wall', 'ant_hill'))
+_TILE_TYPES = dict((t.value, t) for t in TileType)
+_WALL = TileType.wall.value
+_ANT_HILL = TileType.ant_hill.value
+# For translate_tile_types(): 1 for walls, 0 for every other tile.
+_WALL_TABLE = bytes(1 if value == _WALL else 0 for value in range(256))
+
+# Entity kinds stored in Gameboard._entity_kinds.
+ENTITY_NONE = 0
+ENTITY_ANT = 1
+ENTITY_FOOD = 2
 
 
 class Tile(object):
-    def __init__(self, coordinate, gameboard):
+    """
+    A view onto a single tile of a Gameboard.
+
+    Tiles hold no state of their own; two Tile objects for the same
+    coordinate are interchangeable.
+    """
+    __slots__ = ('coordinate', 'gameboard', 'index')
+
+    def __init__(self, coordinate, gameboard, index):
         self.coordinate = coordinate
         self.gameboard = gameboard
-        self._entity = None
-        self.type = TileType.basic
-        self.metadata = dict()
-        self.logger = logging.getLogger('ants.gameboard.Tile')
+        self.index = index
+
+    def __eq__(self, other):
+        return (isinstance(other, Tile) and self.index == other.index and
+                self.gameboard is other.gameboard)
+
+    def __hash__(self):
+        return self.index
+
+    @property
+    def type(self):
+        return _TILE_TYPES[self.gameboard._tile_types[self.index]]
+
+    @property
+    def metadata(self):
+        owner_id = self.gameboard._hill_owners[self.index]
+        if owner_id < 0:
+            return dict()
+        return {'owner': self.gameboard._owners[owner_id]}
 
     def make_wall(self):
-        self.type = TileType.wall
+        gb = self.gameboard
+        if gb._tile_types[self.index] != _WALL:
+            gb._tile_types[self.index] = _WALL
+            gb.wall_version += 1
 
     def make_ant_hill(self, owner):
-        self.type = TileType.ant_hill
-        self.metadata = {'owner': owner}
-        self.gameboard.register_ant_hill(self)
+        gb = self.gameboard
+        if gb._tile_types[self.index] == _WALL:
+            gb.wall_version += 1
+        gb._tile_types[self.index] = _ANT_HILL
+        gb._hill_owners[self.index] = gb._owner_id(owner)
+        gb.register_ant_hill(self)
 
     def get_entity(self):
-        return self._entity
+        gb = self.gameboard
+        kind = gb._entity_kinds[self.index]
+        if kind == ENTITY_ANT:
+            entity = Ant(
+                ant_id=gb._entity_ids[self.index],
+                owner=gb._owners[gb._entity_owners[self.index]]
+            )
+        elif kind == ENTITY_FOOD:
+            entity = Food()
+        else:
+            return None
+        entity.parent_tile = self
+        return entity
 
     def set_entity(self, entity):
         assert isinstance(entity, TileEntity) or entity is None
-        self._entity = entity
-        self.gameboard.register_entity_tile(self)
+        gb = self.gameboard
+        gb.unregister_entity_tile(self)
+        if entity is None:
+            gb._entity_kinds[self.index] = ENTITY_NONE
+        elif isinstance(entity, Ant):
+            gb._entity_kinds[self.index] = ENTITY_ANT
+            gb._entity_ids[self.index] = entity.ant_id
+            gb._entity_owners[self.index] = gb._owner_id(entity.owner)
+        else:
+            gb._entity_kinds[self.index] = ENTITY_FOOD
+        gb.register_entity_tile(self)
         if entity is not None:
             entity.parent_tile = self
 
     @property
     def traversable(self):
-        return self.type != TileType.wall
+        return self.gameboard._tile_types[self.index] != _WALL
 
 
 class TileEntity(object):
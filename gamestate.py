@@ -1,3 +1,5 @@
+import copy
+
 import gameboard as gb
 
 
@@ -27,3 +29,12 @@ class GameState(object):
 
     def is_friendly(self, player):
         return player == self.friendly_player
+
+    def snapshot(self):
+        """
+        Returns a copy of the game state and its board that later changes
+        do not affect. The copy must not be changed itself.
+        """
+        state = copy.copy(self)
+        state.set_gameboard(self._gameboard.snapshot())
+        return state
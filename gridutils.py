@@ -1,29 +1,74 @@
+import functools
 import math
 
 class Coordinate(object):
+    __slots__ = ('x', 'y', '_hash')
+
     def __init__(self, x, y):
         assert isinstance(x, int)
         assert isinstance(y, int)
         super().__setattr__('x', x)
         super().__setattr__('y', y)
+        # Packing both components into one integer keeps the hash unique for
+        # any coordinate whose components fit in 31 bits.
+        super().__setattr__('_hash', (x << 32) + y + (1 << 31))
 
     def __hash__(self):
-        def iabs(i):
-            return int(math.fabs(i))
-        return int(str(iabs(self.x)) + str(iabs(self.y)))
+        return self._hash
 
     def __eq__(self, other):
-        return (self.x == other.x and self.y == other.y)
+        return self is other or (self.x == other.x and self.y == other.y)
 
     def __repr__(self):
         return '({0}, {1})'.format(self.x, self.y)
 
+    def __reduce__(self):
+        return (Coordinate, (self.x, self.y))
+
     def __delattr__(self, name):
         raise TypeError('Instances are immutable.')
 
     def __setattr__(self, name, value):
         raise TypeError('Instances are immutable.')
 
+    def to_index(self, width, height):
+        """
+        Returns the flat index (y * width + x) of this coordinate on a
+        width x height grid, wrapping around the edges.
+        """
+        return (self.y % height) * width + (self.x % width)
+
+    @classmethod
+    def from_index(cls, index, width):
+        return cls(index % width, index // width)
+
+
+class CoordinateCache(object):
+    """
+    Interns the Coordinates of a width x height grid, so that each one is
+    allocated at most once no matter how often it is looked up.
+
+    Coordinates handed out by the cache are always wrapped onto the grid.
+    """
+
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+        self._coordinates = [None] * (width * height)
+
+    def at(self, index):
+        coordinate = self._coordinates[index]
+        if coordinate is None:
+            coordinate = Coordinate(index % self.width, index // self.width)
+            self._coordinates[index] = coordinate
+        return coordinate
+
+    def get(self, x, y):
+        return self.at((y % self.height) * self.width + (x % self.width))
+
+    def intern(self, coordinate):
+        return self.get(coordinate.x, coordinate.y)
+
 def get_straight_line_coordinates(start, end):
     assert isinstance(start, Coordinate)
     assert isinstance(end, Coordinate)
@@ -61,3 +106,20 @@ def get_filled_circle_coordinates(center, radius, modulo_x, modulo_y):
                     (x + center.x) % modulo_x,
                     (y + center.y) % modulo_y
                 )
+
+
+@functools.lru_cache(maxsize=None)
+def get_circle_row_spans(radius):
+    """
+    Returns the shape of a filled circle of radius as a tuple of
+    (y_offset, x_offset_min, x_offset_max) rows, relative to its center.
+
+    The shape matches get_filled_circle_coordinates() and is only computed
+    once per radius.
+    """
+    r2 = radius**2
+    spans = []
+    for y in range(-1 * radius, radius + 1):
+        half_width = math.isqrt(r2 - y**2)
+        spans.append((y, -1 * half_width, half_width))
+    return tuple(spans)
@@ -0,0 +1,595 @@
+#!/usr/bin/env python3
+"""
+A local stand-in for the Ants game web service.
+
+LocalGameServer implements the endpoints used by client.AntAIClient. It
+can be served over HTTP with LocalHTTPServer, or used in-process through
+LocalTransport, which AntAIClient accepts in place of its HTTP session.
+"""
+
+import argparse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import logging
+import random
+import sys
+import threading
+import time
+import uuid
+
+from visibility import VisibilityMap
+
+
+class GameConfig(object):
+    """
+    Settings for a LocalGame.
+
+    width, height: The size of the board.
+    wall_density: The fraction of tiles that are walls.
+    initial_food: The number of food items on the board at the start.
+    food_spawn_rate: The expected number of food items added every turn.
+    fog_radius: How far ants can see.
+    turn_length_ms: The length of a turn, in milliseconds.
+    lockstep: If True, a turn also ends as soon as every agent has submitted
+    its moves, instead of only when turn_length_ms has passed.
+    max_turns: The number of turns after which the game ends.
+    players: The number of players in a game.
+    fill_with_bots: If True, the game starts as soon as one agent logs on,
+    and built-in bots that move randomly take the remaining slots.
+    seed: Seeds the random generator used for the map, food and bots.
+    """
+
+    def __init__(
+        self, width=40, height=40, wall_density=0.1, initial_food=20,
+        food_spawn_rate=0.5, fog_radius=8, turn_length_ms=500,
+        lockstep=False, max_turns=500, players=2, fill_with_bots=True,
+        seed=None
+    ):
+        properties = locals()
+        for p in properties:
+            if p == 'self':
+                continue
+            setattr(self, p, properties[p])
+
+
+class LocalPlayer(object):
+    def __init__(self, name, auth_token, hill, is_bot=False):
+        self.name = name
+        self.auth_token = auth_token
+        self.hill = hill
+        self.is_bot = is_bot
+        self.alive = True
+        self.food = 0
+        self.moves = None
+        self.visibility = None
+        # Walls this player has seen, in the order they were discovered.
+        self.known_walls = []
+        self._known_wall_set = set()
+
+
+class LocalGame(object):
+    """
+    The state and rules of one game.
+
+    Every turn, ants move one tile in the requested direction unless a wall
+    is in the way. Ants that end up on the same tile all die. An ant on an
+    enemy hill razes it, which knocks its owner out of the game. Ants
+    standing on food collect it for their owner, and each collected food
+    spawns a new ant on its owner's hill once the hill is free.
+
+    The game ends when at most one player is left or after max_turns. The
+    winner is the last player standing, or the one with the most ants.
+    """
+    _DIRECTIONS = {
+        'up': (0, -1),
+        'down': (0, 1),
+        'left': (-1, 0),
+        'right': (1, 0),
+    }
+
+    def __init__(self, game_id, config):
+        self.game_id = game_id
+        self.config = config
+        self.width = config.width
+        self.height = config.height
+        self.random = random.Random(config.seed)
+        self.turn = 0
+        self.game_over = False
+        self.winner = None
+        self.started = False
+        self.players = []
+        self.walls = set()
+        self.food = set()
+        # Maps ant IDs to [owner index, tile index]
+        self.ants = dict()
+        self._next_ant_id = 0
+        self._next_turn_time = None
+        self._hills = self._place_hills()
+        self._generate_walls()
+        self.lock = threading.RLock()
+        self.logger = logging.getLogger('ants.localserver.LocalGame')
+
+    def _index(self, x, y):
+        return (y % self.height) * self.width + (x % self.width)
+
+    def _place_hills(self):
+        hills = []
+        count = self.config.players
+        for i in range(count):
+            # Spread the hills along the board's diagonal.
+            x = (self.width * (2 * i + 1)) // (2 * count)
+            y = (self.height * (2 * i + 1)) // (2 * count)
+            hills.append(self._index(x, y))
+        return hills
+
+    def _generate_walls(self):
+        size = self.width * self.height
+        keep_clear = set()
+        for hill in self._hills:
+            x = hill % self.width
+            y = hill // self.width
+            for dx in range(-1, 2):
+                for dy in range(-1, 2):
+                    keep_clear.add(self._index(x + dx, y + dy))
+        wall_count = int(size * self.config.wall_density)
+        candidates = [i for i in range(size) if i not in keep_clear]
+        self.walls = set(self.random.sample(
+            candidates, min(wall_count, len(candidates))
+        ))
+        for _ in range(self.config.initial_food):
+            self._spawn_food()
+
+    def _spawn_food(self):
+        size = self.width * self.height
+        occupied = set(ant[1] for ant in self.ants.values())
+        for _ in range(10):
+            index = self.random.randrange(size)
+            if index not in self.walls and index not in self.food and \
+                    index not in self._hills and index not in occupied:
+                self.food.add(index)
+                return
+
+    def add_player(self, name, is_bot=False):
+        """
+        Adds a player to the game and returns its auth token.
+        """
+        with self.lock:
+            if len(self.players) >= self.config.players:
+                raise ValueError('Game {0} is full'.format(self.game_id))
+            player_number = len(self.players)
+            player = LocalPlayer(
+                name, uuid.uuid4().hex, self._hills[player_number], is_bot
+            )
+            player.visibility = VisibilityMap(
+                self.width, self.height, self.config.fog_radius
+            )
+            self.players.append(player)
+            self._add_ant(player_number, player.hill)
+            if len(self.players) == self.config.players:
+                self._start()
+            elif self.config.fill_with_bots and not is_bot:
+                while len(self.players) < self.config.players:
+                    self.add_player('bot{0}'.format(len(self.players)), True)
+            self._update_visibility()
+            return player.auth_token
+
+    def _start(self):
+        self.started = True
+        self._next_turn_time = \
+            time.monotonic() + self.config.turn_length_ms / 1000
+
+    def _add_ant(self, player_number, index):
+        ant_id = self._next_ant_id
+        self._next_ant_id += 1
+        self.ants[ant_id] = [player_number, index]
+
+    def player(self, auth_token):
+        for player_number, player in enumerate(self.players):
+            if player.auth_token == auth_token:
+                return player_number, player
+        raise KeyError('Unknown auth token')
+
+    def status(self, auth_token):
+        """
+        Returns the game as seen by the player with auth_token, in the
+        format of the status endpoint.
+        """
+        with self.lock:
+            self.advance()
+            player_number, player = self.player(auth_token)
+            is_visible = player.visibility.is_visible
+            friendly_ants = []
+            enemy_ants = []
+            for ant_id, (owner, index) in self.ants.items():
+                entry = {
+                    'Id': ant_id,
+                    'X': index % self.width,
+                    'Y': index // self.width,
+                    'Owner': self.players[owner].name
+                }
+                if owner == player_number:
+                    friendly_ants.append(entry)
+                elif is_visible(index):
+                    enemy_ants.append(entry)
+            enemy_hills = [
+                self._hill_dict(p) for n, p in enumerate(self.players)
+                if n != player_number and p.alive and is_visible(p.hill)
+            ]
+            return {
+                'GameId': self.game_id,
+                'Width': self.width,
+                'Height': self.height,
+                'FogOfWar': self.config.fog_radius,
+                'Turn': self.turn,
+                'TotalFood': player.food,
+                'FriendlyAnts': friendly_ants,
+                'EnemyAnts': enemy_ants,
+                'VisibleFood': [
+                    {'X': i % self.width, 'Y': i // self.width}
+                    for i in sorted(self.food) if is_visible(i)
+                ],
+                'Walls': [
+                    {'X': i % self.width, 'Y': i // self.width}
+                    for i in player.known_walls
+                ],
+                'Hill': self._hill_dict(player),
+                'EnemyHills': enemy_hills,
+                'IsGameOver': self.game_over,
+                'Winner': self.winner,
+            }
+
+    def _hill_dict(self, player):
+        return {
+            'X': player.hill % self.width,
+            'Y': player.hill // self.width,
+            'Owner': player.name
+        }
+
+    def turn_info(self):
+        with self.lock:
+            self.advance()
+            if self._next_turn_time is None:
+                remaining = self.config.turn_length_ms
+            else:
+                remaining = int(
+                    (self._next_turn_time - time.monotonic()) * 1000
+                )
+            return {
+                'Turn': self.turn,
+                'MillisecondsUntilNextTurn': max(remaining, 0),
+            }
+
+    def submit_moves(self, auth_token, move_requests):
+        with self.lock:
+            self.advance()
+            player_number, player = self.player(auth_token)
+            player.moves = dict(
+                (m['AntId'], m['Direction']) for m in move_requests
+            )
+            if self.config.lockstep and self.started and all(
+                    p.moves is not None for p in self.players
+                    if p.alive and not p.is_bot):
+                self.step()
+                self._next_turn_time = \
+                    time.monotonic() + self.config.turn_length_ms / 1000
+
+    def advance(self):
+        """
+        Plays every turn whose time has passed.
+        """
+        if not self.started:
+            return
+        while not self.game_over and time.monotonic() >= self._next_turn_time:
+            self.step()
+            self._next_turn_time += self.config.turn_length_ms / 1000
+
+    def step(self):
+        """
+        Plays one turn with the moves submitted so far.
+        """
+        if self.game_over:
+            return
+        for player_number, player in enumerate(self.players):
+            if player.is_bot:
+                player.moves = self._bot_moves(player_number)
+        self._move_ants()
+        self._resolve_collisions()
+        self._raze_hills()
+        self._collect_food()
+        self._spawn_ants()
+        spawn_rate = self.config.food_spawn_rate
+        while spawn_rate > 0:
+            if self.random.random() < spawn_rate:
+                self._spawn_food()
+            spawn_rate -= 1
+        for player in self.players:
+            player.moves = None
+        self.turn += 1
+        self._update_visibility()
+        self._check_game_over()
+
+    def _bot_moves(self, player_number):
+        directions = sorted(self._DIRECTIONS)
+        return dict(
+            (ant_id, self.random.choice(directions))
+            for ant_id, (owner, _) in sorted(self.ants.items())
+            if owner == player_number
+        )
+
+    def _move_ants(self):
+        for ant_id, ant in self.ants.items():
+            moves = self.players[ant[0]].moves or {}
+            direction = self._DIRECTIONS.get(moves.get(ant_id))
+            if direction is None:
+                continue
+            index = self._index(
+                ant[1] % self.width + direction[0],
+                ant[1] // self.width + direction[1]
+            )
+            if index not in self.walls:
+                ant[1] = index
+
+    def _resolve_collisions(self):
+        ants_by_tile = dict()
+        for ant_id, (_, index) in self.ants.items():
+            ants_by_tile.setdefault(index, []).append(ant_id)
+        for ant_ids in ants_by_tile.values():
+            if len(ant_ids) > 1:
+                for ant_id in ant_ids:
+                    del self.ants[ant_id]
+
+    def _raze_hills(self):
+        for owner, index in self.ants.values():
+            for player_number, player in enumerate(self.players):
+                if player.alive and player.hill == index and \
+                        player_number != owner:
+                    self.logger.info(
+                        'Turn %d: %s razed the hill of %s', self.turn,
+                        self.players[owner].name, player.name
+                    )
+                    player.alive = False
+        # Players knocked out lose their ants.
+        for ant_id in [k for k, v in self.ants.items()
+                       if not self.players[v[0]].alive]:
+            del self.ants[ant_id]
+
+    def _collect_food(self):
+        for owner, index in self.ants.values():
+            if index in self.food:
+                self.food.remove(index)
+                self.players[owner].food += 1
+
+    def _spawn_ants(self):
+        occupied = set(ant[1] for ant in self.ants.values())
+        for player_number, player in enumerate(self.players):
+            if player.alive and player.food > 0 and \
+                    player.hill not in occupied:
+                player.food -= 1
+                self._add_ant(player_number, player.hill)
+
+    def _update_visibility(self):
+        ants_by_player = [[] for _ in self.players]
+        for owner, index in self.ants.values():
+            ants_by_player[owner].append(index)
+        for player, ant_indexes in zip(self.players, ants_by_player):
+            player.visibility.update(ant_indexes)
+            is_visible = player.visibility.is_visible
+            for index in sorted(self.walls - player._known_wall_set):
+                if is_visible(index):
+                    player.known_walls.append(index)
+                    player._known_wall_set.add(index)
+
+    def _check_game_over(self):
+        ant_counts = [0] * len(self.players)
+        for owner, _ in self.ants.values():
+            ant_counts[owner] += 1
+        remaining = [
+            n for n, p in enumerate(self.players)
+            if p.alive and (ant_counts[n] > 0 or p.food > 0)
+        ]
+        if len(remaining) <= 1 or self.turn >= self.config.max_turns:
+            self.game_over = True
+            if len(remaining) == 1:
+                leader = remaining[0]
+            else:
+                leader = max(
+                    range(len(self.players)), key=lambda n: ant_counts[n]
+                )
+                if ant_counts.count(ant_counts[leader]) > 1:
+                    leader = None
+            if leader is not None:
+                self.winner = self.players[leader].name
+            self.logger.info(
+                'Game %s over after %d turns; winner: %s', self.game_id,
+                self.turn, self.winner
+            )
+
+
+class LocalGameServer(object):
+    """
+    Serves the Ants game API for any number of LocalGames.
+
+    handle() takes a request method, URL path and decoded JSON body, and
+    returns an HTTP status code and a JSON-serializable response.
+    """
+
+    def __init__(self, config=None):
+        self.config = config or GameConfig()
+        self.games = dict()
+        self.lock = threading.Lock()
+        self.logger = logging.getLogger('ants.localserver.LocalGameServer')
+
+    def new_game(self, config=None):
+        game = LocalGame(uuid.uuid4().hex, config or self.config)
+        with self.lock:
+            self.games[game.game_id] = game
+        return game
+
+    def handle(self, method, path, body):
+        parts = [p for p in path.split('/') if p]
+        if parts[:2] != ['api', 'game']:
+            return 404, {'Message': 'No such endpoint: ' + path}
+        parts = parts[2:]
+        try:
+            if method == 'post' and parts == ['logon']:
+                return 200, self.logon(body or {})
+            if method == 'post' and parts == ['update']:
+                game = self.games[body['GameId']]
+                game.submit_moves(body['AuthToken'], body['MoveAntRequests'])
+                return 200, {}
+            if method == 'post' and len(parts) == 3 and parts[1] == 'status':
+                return 200, self.games[parts[0]].status(parts[2])
+            if method == 'get' and len(parts) == 2 and parts[1] == 'turn':
+                return 200, self.games[parts[0]].turn_info()
+        except (KeyError, ValueError) as e:
+            self.logger.warning('Bad request %s %s: %s', method, path, e)
+            return 400, {'Message': str(e)}
+        return 404, {'Message': 'No such endpoint: ' + path}
+
+    def logon(self, data):
+        game_id = data.get('GameId')
+        if game_id is None:
+            game = self.new_game()
+        else:
+            game = self.games[game_id]
+        auth_token = game.add_player(data['AgentName'])
+        return {'GameId': game.game_id, 'AuthToken': auth_token}
+
+
+class LocalResponse(object):
+    def __init__(self, status_code, data):
+        self.status_code = status_code
+        self.content = json.dumps(data).encode('utf-8')
+        self._data = data
+
+    def json(self):
+        return self._data
+
+
+class LocalTransport(object):
+    """
+    Sends AntAIClient's requests straight to a LocalGameServer, without
+    going through HTTP. Pass it to AntAIClient as its session.
+    """
+
+    def __init__(self, server):
+        self.server = server
+        self.adapters = dict()
+
+    def get(self, url, headers=None, data=None, timeout=None):
+        return self._request('get', url, data)
+
+    def post(self, url, headers=None, data=None, timeout=None):
+        return self._request('post', url, data)
+
+    def close(self):
+        pass
+
+    def _request(self, method, url, data):
+        path = url.split('://', 1)[-1].partition('/')[2]
+        body = json.loads(data) if data else None
+        return LocalResponse(*self.server.handle(method, path, body))
+
+
+class LocalHTTPServer(ThreadingHTTPServer):
+    """
+    Serves a LocalGameServer over HTTP.
+    """
+    daemon_threads = True
+
+    def __init__(self, game_server, host='127.0.0.1', port=0):
+        super().__init__((host, port), _LocalRequestHandler)
+        self.game_server = game_server
+
+    @property
+    def url(self):
+        return 'http://{0}:{1}'.format(*self.server_address[:2])
+
+    def serve_in_background(self):
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        return thread
+
+
+class _LocalRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        self._handle('get')
+
+    def do_POST(self):
+        self._handle('post')
+
+    def _handle(self, method):
+        length = int(self.headers.get('Content-Length', 0))
+        data = self.rfile.read(length) if length else b''
+        body = json.loads(data.decode('utf-8')) if data else None
+        status, response = self.server.game_server.handle(
+            method, self.path, body
+        )
+        content = json.dumps(response).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args):
+        logging.getLogger('ants.localserver.http').debug(format, *args)
+
+
+def add_game_config_arguments(argparser):
+    """
+    Adds arguments for the fields of GameConfig to argparser.
+    """
+    defaults = GameConfig()
+    a = argparser
+    a.add_argument('--width', type=int, default=defaults.width)
+    a.add_argument('--height', type=int, default=defaults.height)
+    a.add_argument('--wall-density', dest='wall_density', type=float,
+                   default=defaults.wall_density)
+    a.add_argument('--initial-food', dest='initial_food', type=int,
+                   default=defaults.initial_food)
+    a.add_argument('--food-spawn-rate', dest='food_spawn_rate', type=float,
+                   default=defaults.food_spawn_rate)
+    a.add_argument('--fog-radius', dest='fog_radius', type=int,
+                   default=defaults.fog_radius)
+    a.add_argument('--turn-length', dest='turn_length_ms', type=int,
+                   default=defaults.turn_length_ms,
+                   help='The length of a turn in milliseconds.')
+    a.add_argument('--lockstep', action='store_true', default=False,
+                   help=('Also end turns as soon as every agent has '
+                         'submitted its moves.'))
+    a.add_argument('--max-turns', dest='max_turns', type=int,
+                   default=defaults.max_turns)
+    a.add_argument('--players', type=int, default=defaults.players)
+    a.add_argument('--seed', type=int, default=None)
+
+
+def game_config_from_args(args):
+    return GameConfig(
+        width=args.width, height=args.height,
+        wall_density=args.wall_density, initial_food=args.initial_food,
+        food_spawn_rate=args.food_spawn_rate, fog_radius=args.fog_radius,
+        turn_length_ms=args.turn_length_ms, lockstep=args.lockstep,
+        max_turns=args.max_turns, players=args.players, seed=args.seed
+    )
+
+
+def main(argv):
+    a = argparse.ArgumentParser(
+        description='Runs a local Ants game server over HTTP.'
+    )
+    a.add_argument('--host', default='127.0.0.1')
+    a.add_argument('--port', type=int, default=8000)
+    add_game_config_arguments(a)
+    args = a.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+    server = LocalHTTPServer(
+        LocalGameServer(game_config_from_args(args)), args.host, args.port
+    )
+    print('Serving the Ants game on ' + server.url)
+    server.serve_forever()
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,207 @@
+"""
+Per-turn metrics: how long each phase of a turn took, and counts such as
+the number of ants, objectives and A* nodes expanded.
+
+The controller and AI share one TurnMetrics. Each turn's measurements are
+handed to an exporter when the turn ends. When metrics are disabled,
+NULL_METRICS takes its place; its methods do nothing.
+"""
+
+import json
+import logging
+import os
+import time
+
+
+class _Phase(object):
+    """
+    Times a block of code and adds its duration to a phase of a TurnMetrics.
+    """
+    __slots__ = ('metrics', 'name', 'start')
+
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+        self.start = None
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        durations = self.metrics.durations
+        durations[self.name] = durations.get(self.name, 0) + \
+            time.perf_counter() - self.start
+        return False
+
+
+class TurnMetrics(object):
+    """
+    Collects the durations and counts of the current turn and passes them
+    to exporter.export() when the turn ends.
+    """
+    enabled = True
+
+    def __init__(self, exporter):
+        self.exporter = exporter
+        self.turn = None
+        self.durations = dict()
+        self.counts = dict()
+        self._turn_start = None
+        self.logger = logging.getLogger('ants.metrics.TurnMetrics')
+
+    def start_turn(self):
+        self.durations = dict()
+        self.counts = dict()
+        self._turn_start = time.perf_counter()
+
+    def phase(self, name):
+        """
+        Returns a context manager that adds the time spent in it to the
+        duration of phase name.
+        """
+        return _Phase(self, name)
+
+    def count(self, name, value):
+        self.counts[name] = value
+
+    def end_turn(self, turn):
+        self.turn = turn
+        self.durations['turn'] = time.perf_counter() - self._turn_start
+        self.exporter.export({
+            'turn': turn,
+            'time': time.time(),
+            'durations': self.durations,
+            'counts': self.counts,
+        })
+
+    def close(self):
+        self.exporter.close()
+
+
+class _NullPhase(object):
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+class NullMetrics(object):
+    """
+    Stands in for TurnMetrics when metrics are disabled.
+    """
+    enabled = False
+    _PHASE = _NullPhase()
+
+    def start_turn(self):
+        pass
+
+    def phase(self, name):
+        return self._PHASE
+
+    def count(self, name, value):
+        pass
+
+    def end_turn(self, turn):
+        pass
+
+    def close(self):
+        pass
+
+
+NULL_METRICS = NullMetrics()
+
+
+class JSONLinesExporter(object):
+    """
+    Appends every turn's metrics to a file as a line of JSON.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'a')
+
+    def export(self, record):
+        self._file.write(json.dumps(record, sort_keys=True) + '\n')
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+class PrometheusExporter(object):
+    """
+    Keeps a file in the Prometheus text exposition format up to date, e.g.
+    for the node exporter's textfile collector.
+
+    The file holds the durations and counts of the last turn as gauges, and
+    the total time spent in every phase as counters. It is replaced
+    atomically after every turn.
+    """
+    PREFIX = 'ants_'
+
+    def __init__(self, path):
+        self.path = path
+        self.turns = 0
+        self.total_durations = dict()
+
+    def export(self, record):
+        self.turns += 1
+        for name, duration in record['durations'].items():
+            self.total_durations[name] = \
+                self.total_durations.get(name, 0) + duration
+        p = self.PREFIX
+        lines = [
+            '# HELP {0}turn The number of the last turn played.'.format(p),
+            '# TYPE {0}turn gauge'.format(p),
+            '{0}turn {1}'.format(p, record['turn']),
+            '# HELP {0}turns_total Turns played.'.format(p),
+            '# TYPE {0}turns_total counter'.format(p),
+            '{0}turns_total {1}'.format(p, self.turns),
+            '# HELP {0}phase_seconds Time spent in each phase of the last '
+            'turn.'.format(p),
+            '# TYPE {0}phase_seconds gauge'.format(p),
+        ]
+        for name, duration in sorted(record['durations'].items()):
+            lines.append('{0}phase_seconds{{phase="{1}"}} {2!r}'.format(
+                p, name, duration
+            ))
+        lines.extend((
+            '# HELP {0}phase_seconds_total Time spent in each phase over '
+            'all turns.'.format(p),
+            '# TYPE {0}phase_seconds_total counter'.format(p),
+        ))
+        for name, duration in sorted(self.total_durations.items()):
+            lines.append('{0}phase_seconds_total{{phase="{1}"}} {2!r}'.format(
+                p, name, duration
+            ))
+        for name, value in sorted(record['counts'].items()):
+            metric = p + name
+            lines.append('# TYPE {0} gauge'.format(metric))
+            lines.append('{0} {1!r}'.format(metric, value))
+        temporary_path = self.path + '.tmp'
+        with open(temporary_path, 'w') as f:
+            f.write('\n'.join(lines) + '\n')
+        os.replace(temporary_path, self.path)
+
+    def close(self):
+        pass
+
+
+EXPORTERS = {
+    'jsonl': JSONLinesExporter,
+    'prometheus': PrometheusExporter,
+}
+
+
+def open_metrics(path, export_format='jsonl'):
+    """
+    Returns a TurnMetrics exporting to path in export_format, or
+    NULL_METRICS if path is None.
+    """
+    if path is None:
+        return NULL_METRICS
+    return TurnMetrics(EXPORTERS[export_format](path))
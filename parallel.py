@@ -0,0 +1,330 @@
+"""
+Planning of squads' moves in worker processes.
+
+The walls of the gameboard, and which tiles hold friendly ants and food,
+are published in shared memory. Squads are split between the workers by
+squad ID, so that the same worker plans a squad every turn and can reuse
+the paths it found for its ants before. Each worker plans its squads with
+ai.plan_ant_move() on a board backed by the shared walls, and sends the
+MovePlans back. They are merged in squad order, so that the result does
+not depend on which worker finishes first, and ai.resolve_moves() then
+settles conflicts between them just as for plans made in this process.
+
+When the AI uses landmarks, the distances from them are sent to every
+worker whenever they are computed anew, so that workers search with the
+same heuristic as this process.
+
+Workers are started on the first turn that needs them, by which time other
+threads, such as the renderer's, may be running. A process forked from one
+with threads can be left holding locks no thread will release, so workers
+are started from a fresh process with forkserver, or spawn where forkserver
+is not available.
+"""
+
+import logging
+import multiprocessing
+from multiprocessing import shared_memory
+import os
+import time
+
+import ai
+import gameboard
+import pathfinding
+
+
+if 'forkserver' in multiprocessing.get_all_start_methods():
+    _context = multiprocessing.get_context('forkserver')
+else:
+    _context = multiprocessing.get_context('spawn')
+
+# Values of the occupancy published for every tile.
+OCCUPANCY_NONE = 0
+OCCUPANCY_ANT = 1
+OCCUPANCY_FOOD = 2
+
+
+class ParallelPlanner(object):
+    """
+    Plans the moves of squads in a pool of worker processes.
+
+    Sending squads to other processes and their plans back costs time of
+    its own, so plan_moves() is only worthwhile on large boards with many
+    ants; see worthwhile().
+    """
+    # Boards with fewer tiles, or turns with fewer ants, are planned in this
+    # process.
+    MIN_TILES = 100 * 100
+    MIN_ANTS = 50
+
+    def __init__(self, gameboard, workers=None, min_tiles=MIN_TILES,
+                 min_ants=MIN_ANTS, landmarks=None):
+        self.gameboard = gameboard
+        self.workers = workers or os.cpu_count() or 1
+        # The LandmarkHeuristic the AI searches with, if any.
+        self.landmarks = landmarks
+        self.min_tiles = min_tiles
+        self.min_ants = min_ants
+        self._processes = []
+        self._connections = []
+        self._tiles = None
+        self._occupancy = None
+        self._wall_version = None
+        # The wall version of the landmarks every worker was last sent.
+        self._landmark_versions = [None] * self.workers
+        self.broken = False
+        # The speedup of the last turn planned in parallel: the CPU time the
+        # workers spent planning, which is about what planning in this
+        # process would have taken, over the time the turn waited for them.
+        self.last_speedup = None
+        self.parallel_turns = 0
+        self._total_speedup = 0
+        self.logger = logging.getLogger('ants.parallel.ParallelPlanner')
+
+    def worthwhile(self, ant_count):
+        gb = self.gameboard
+        return not self.broken and \
+            gb.width * gb.height >= self.min_tiles and \
+            ant_count >= self.min_ants
+
+    def start(self):
+        gb = self.gameboard
+        size = gb.width * gb.height
+        self._tiles = shared_memory.SharedMemory(create=True, size=size)
+        self._occupancy = shared_memory.SharedMemory(create=True, size=size)
+        for _ in range(self.workers):
+            parent_connection, child_connection = _context.Pipe()
+            process = _context.Process(
+                target=_worker_main, name='ants-planner', daemon=True,
+                args=(child_connection, self._tiles.name,
+                      self._occupancy.name, gb.width, gb.height)
+            )
+            process.start()
+            child_connection.close()
+            self._processes.append(process)
+            self._connections.append(parent_connection)
+        self.logger.info('Started %d planner processes', self.workers)
+
+    def publish(self, occupied):
+        """
+        Copies the walls, if they changed, and the tiles holding friendly
+        ants, occupied, and food to shared memory.
+        """
+        gb = self.gameboard
+        size = gb.width * gb.height
+        if self._wall_version != gb.wall_version:
+            self._tiles.buf[:size] = gb.tile_type_bytes()
+            self._wall_version = gb.wall_version
+        occupancy = bytearray(size)
+        for index in occupied:
+            occupancy[index] = OCCUPANCY_ANT
+        for tile in gb.food:
+            occupancy[tile.index] = OCCUPANCY_FOOD
+        self._occupancy.buf[:size] = occupancy
+
+    def plan_moves(self, squads, occupied, deadline=None):
+        """
+        Returns the MovePlans of the members of squads, in the order
+        AntSquad.plan_moves() would give them, or None if the workers
+        failed, in which case the moves should be planned in this process.
+        """
+        gb = self.gameboard
+        if not self._processes:
+            self.start()
+        self.publish(occupied)
+        jobs = [[] for _ in range(self.workers)]
+        for squad in squads:
+            if squad.objective is None:
+                continue
+            target = gb.index_of(squad.objective.coordinate)
+            objective = None if target in occupied else target
+            members = [
+                (ant_id, gb.get_ant(ant_id).index)
+                for ant_id in squad.members
+            ]
+            jobs[squad.squad_id % self.workers].append((
+                squad.squad_id, target, objective, len(squad.members) > 1,
+                members
+            ))
+        time_left = None
+        if deadline is not None:
+            time_left = max(0, deadline - time.monotonic())
+        start = time.perf_counter()
+        busy = 0
+        results = dict()
+        try:
+            for worker, worker_jobs in enumerate(jobs):
+                if worker_jobs:
+                    self._connections[worker].send((
+                        gb.wall_version, self.landmarks_for(worker),
+                        time_left, worker_jobs
+                    ))
+            for connection, worker_jobs in zip(self._connections, jobs):
+                if worker_jobs:
+                    worker_results, worker_busy = connection.recv()
+                    results.update(worker_results)
+                    busy += worker_busy
+        except (EOFError, OSError):
+            self.logger.exception(
+                'A planner process failed; planning in this process'
+            )
+            self.broken = True
+            self.close()
+            return None
+        elapsed = time.perf_counter() - start
+        self.last_speedup = busy / elapsed if elapsed > 0 else None
+        if self.last_speedup is not None:
+            self.parallel_turns += 1
+            self._total_speedup += self.last_speedup
+        self.logger.info(
+            'Planned %d squads in %d processes in %.1f ms; speedup %.2f',
+            len(results), self.workers, elapsed * 1000,
+            self.last_speedup or 0
+        )
+        coordinate_at = gb.coordinate_at
+        plans = []
+        for squad in squads:
+            for ant_id, frm, steps, path in results.get(squad.squad_id, ()):
+                plans.append(ai.MovePlan(
+                    ant_id, frm, steps, [coordinate_at(i) for i in path]
+                ))
+        return plans
+
+    def landmarks_for(self, worker):
+        """
+        Returns what LandmarkHeuristic.export() gives for worker to load,
+        or None if it has the current landmarks already.
+        """
+        landmarks = self.landmarks
+        if landmarks is None or \
+                self._landmark_versions[worker] == landmarks.wall_version:
+            return None
+        self._landmark_versions[worker] = landmarks.wall_version
+        return landmarks.export()
+
+    @property
+    def mean_speedup(self):
+        if self.parallel_turns == 0:
+            return None
+        return self._total_speedup / self.parallel_turns
+
+    def close(self):
+        for connection in self._connections:
+            try:
+                connection.send(None)
+            except OSError:
+                pass
+        for process in self._processes:
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+        for connection in self._connections:
+            connection.close()
+        self._processes = []
+        self._connections = []
+        for memory in (self._tiles, self._occupancy):
+            if memory is not None:
+                memory.close()
+                memory.unlink()
+        self._tiles = None
+        self._occupancy = None
+        self._wall_version = None
+        self._landmark_versions = [None] * self.workers
+        if self.parallel_turns:
+            self.logger.info(
+                'Planned %d turns in parallel; mean speedup %.2f',
+                self.parallel_turns, self.mean_speedup
+            )
+
+
+def food_within(occupancy, index, radius, width, height):
+    """
+    Returns the tile indexes holding food at most radius steps away from
+    index along either axis, in the order of SpatialIndex.within().
+    """
+    x = index % width
+    y = index // width
+    found = []
+    for dx in range(-radius, radius + 1):
+        column = (x + dx) % width
+        for dy in range(-radius, radius + 1):
+            if dx == 0 and dy == 0:
+                continue
+            i = ((y + dy) % height) * width + column
+            if occupancy[i] == OCCUPANCY_FOOD:
+                found.append(i)
+    return found
+
+
+def plan_squads(pathfinder, occupancy, jobs, deadline):
+    """
+    Plans the moves of the squads in jobs, as sent by
+    ParallelPlanner.plan_moves(). Returns a list of (squad ID, plans), with
+    every plan as a tuple of the ant ID, tile indexes it moves from and
+    may step to, and the tile indexes of its path.
+    """
+    gb = pathfinder.gameboard
+    width = gb.width
+    height = gb.height
+    index_of = gb.index_of
+    results = []
+    for squad_id, target, objective, use_field, members in jobs:
+        plans = []
+        for ant_id, frm in members:
+            if ai.deadline_passed(deadline):
+                plan = ai.greedy_ant_plan(pathfinder, ant_id, frm, target)
+            else:
+                food = food_within(
+                    occupancy, frm, ai.MAX_FOOD_DISTANCE, width, height
+                )
+                try:
+                    plan = ai.plan_ant_move(
+                        pathfinder, ant_id, frm, food, objective, use_field,
+                        deadline
+                    )
+                except pathfinding.DeadlineExceeded:
+                    plan = ai.greedy_ant_plan(
+                        pathfinder, ant_id, frm, target
+                    )
+            if plan is not None:
+                plans.append((
+                    plan.ant_id, plan.frm, plan.steps,
+                    [index_of(c) for c in plan.path]
+                ))
+        results.append((squad_id, plans))
+    return results
+
+
+def _worker_main(connection, tiles_name, occupancy_name, width, height):
+    tiles = shared_memory.SharedMemory(name=tiles_name)
+    occupancy = shared_memory.SharedMemory(name=occupancy_name)
+    board = gameboard.Gameboard.with_tile_types(width, height, tiles.buf)
+    pathfinder = pathfinding.Pathfinder(board)
+    try:
+        while True:
+            message = connection.recv()
+            if message is None:
+                break
+            wall_version, landmarks, time_left, jobs = message
+            start = time.process_time()
+            board.wall_version = wall_version
+            if landmarks is not None:
+                heuristic = pathfinding.LandmarkHeuristic(
+                    board, len(landmarks[0])
+                )
+                heuristic.load(*landmarks)
+                pathfinder.heuristic = heuristic
+            deadline = None
+            if time_left is not None:
+                deadline = time.monotonic() + time_left
+            results = plan_squads(pathfinder, occupancy.buf, jobs, deadline)
+            pathfinder.path_cache.prune(set(
+                ant_id for job in jobs for ant_id, _ in job[4]
+            ))
+            connection.send((results, time.process_time() - start))
+    finally:
+        # The board's view of the shared memory has to go before it can be
+        # closed.
+        del board, pathfinder
+        tiles.close()
+        occupancy.close()
+        connection.close()
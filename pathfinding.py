@@ -1,60 +1,169 @@
-import functools
+from array import array
+from collections import OrderedDict
+import heapq
 import logging
 import math
-from queue import PriorityQueue
+import time
 
-from gameboard import Coordinate as C
+
+class DeadlineExceeded(Exception):
+    """
+    Raised when a search runs past the deadline it was given.
+    """
 
 
 class Pathfinder(object):
-    def __init__(self, gameboard):
+    # Searches look at the clock once every this many expanded nodes.
+    DEADLINE_CHECK_INTERVAL = 256
+
+    def __init__(self, gameboard, max_distance_fields=32, heuristic=None):
         self.gameboard = gameboard
+        self.max_distance_fields = max_distance_fields
+        if heuristic is None:
+            heuristic = EuclideanHeuristic(gameboard)
+        self.heuristic = heuristic
+        # Search statistics, for comparing heuristics.
+        self.searches = 0
+        self.expanded_nodes = 0
+        self.last_expanded_nodes = 0
+        self._distance_fields = OrderedDict()
+        self.path_cache = PathCache(gameboard)
         self.logger = logging.getLogger('ants.pathfinding.Pathfinder')
 
-    # Used http://web.mit.edu/eranki/www/tutorials/search as a reference for
-    # this A* implementation.
-    def find_path(self, start, end, nontraversable=()):
+    def find_path(self, start, end, nontraversable=(), deadline=None):
         """
         Given Coordinates start and end, finds the shortest path between them
         on the gameboard.
+
+        Returns a list of the Coordinates leading from start to end, not
+        including start, or None if there is no such path. end is allowed to
+        be in nontraversable. Raises DeadlineExceeded if deadline, a
+        time.monotonic() value, passes first.
         """
-        open_coords = PriorityQueue()
-        parent_coords = dict()
-        g_score = dict()
-        f_score = dict()
-
-        open_coords.put(QueueCoordinate(coordinate=start, f_score=0))
-        f_score[start] = self.heuristic_cost(start, end)
-        g_score[start] = 0
-
-        while open_coords.qsize() > 0:
-            q = open_coords.get().coordinate
-            successors = self._get_neighboring_coordinates(q)
-            for successor in successors:
-                if successor == end:
-                    parent_coords[successor] = q
-                    return self.build_path(end, parent_coords)
-                if successor in nontraversable:
+        index_of = self.gameboard.index_of
+        blocked = set(index_of(c) for c in nontraversable)
+        path = self.search(index_of(start), index_of(end), blocked, deadline)
+        if path is None:
+            return None
+        coordinate_at = self.gameboard.coordinate_at
+        return [coordinate_at(index) for index in path]
+
+    def find_ant_path(self, ant_id, start, end, nontraversable=(),
+                      deadline=None):
+        """
+        Like find_path(), but reuses the path found for ant_id and end on an
+        earlier turn while it is still valid.
+        """
+        path = self.path_cache.get(ant_id, start, end, nontraversable)
+        if path is None:
+            path = self.find_path(start, end, nontraversable, deadline)
+            if path is not None:
+                self.path_cache.put(ant_id, start, end, path)
+        return path
+
+    # Used http://web.mit.edu/eranki/www/tutorials/search as a reference for
+    # this A* implementation.
+    def search(self, start, goal, blocked=frozenset(), deadline=None):
+        """
+        A* search between the tile indexes start and goal.
+
+        Returns a list of the tile indexes leading from start to goal, not
+        including start, or None if goal cannot be reached without passing
+        through a wall or an index in blocked. Raises DeadlineExceeded if
+        deadline, a time.monotonic() value, passes first.
+        """
+        neighbor_indexes = self.gameboard.neighbor_indexes
+        check_interval = self.DEADLINE_CHECK_INTERVAL
+        heuristic = self.index_heuristic(goal)
+        self.searches += 1
+        self.last_expanded_nodes = 0
+        h = heuristic(start)
+        # Entries are (f, h, insertion order, index). On equal f the node
+        # closest to the goal is expanded first, then the oldest one.
+        open_heap = [(h, h, 0, start)]
+        pushed = 1
+        g_score = {start: 0}
+        parents = dict()
+        closed = set()
+        while open_heap:
+            current = heapq.heappop(open_heap)[3]
+            if current == goal:
+                return self.build_path(goal, parents)
+            if current in closed:
+                continue
+            closed.add(current)
+            self.last_expanded_nodes += 1
+            self.expanded_nodes += 1
+            if deadline is not None and \
+                    self.last_expanded_nodes % check_interval == 0 and \
+                    time.monotonic() >= deadline:
+                raise DeadlineExceeded()
+            # All traversals have equal cost
+            successor_g = g_score[current] + 1
+            for successor in neighbor_indexes(current):
+                if successor in closed or \
+                        (successor in blocked and successor != goal):
                     continue
-                # All traversals have equal cost
-                successor_g = g_score[q] + 1
-                successor_h = self.heuristic_cost(successor, end)
-                successor_f = successor_g + successor_h
-                if f_score.get(successor, successor_f + 1) > successor_f:
-                    f_score[successor] = successor_f
+                if successor_g < g_score.get(successor, successor_g + 1):
                     g_score[successor] = successor_g
-                    open_coords.put(QueueCoordinate(successor, successor_f))
-                    parent_coords[successor] = q
+                    parents[successor] = current
+                    h = heuristic(successor)
+                    heapq.heappush(
+                        open_heap, (successor_g + h, h, pushed, successor)
+                    )
+                    pushed += 1
+        return None
+
+    def distance_field(self, target, deadline=None):
+        """
+        Returns the DistanceField for the Coordinate target.
 
-    def build_path(self, end, parent_coords):
+        Fields are cached per target and only recomputed once the walls of
+        the gameboard have changed. Raises DeadlineExceeded if deadline, a
+        time.monotonic() value, passes while one is computed.
+        """
+        target_index = self.gameboard.index_of(target)
+        field = self._distance_fields.get(target_index)
+        if field is not None and \
+                field.wall_version == self.gameboard.wall_version:
+            self._distance_fields.move_to_end(target_index)
+            return field
+        field = DistanceField(self.gameboard, target_index, deadline)
+        self._distance_fields[target_index] = field
+        self._distance_fields.move_to_end(target_index)
+        if len(self._distance_fields) > self.max_distance_fields:
+            self._distance_fields.popitem(last=False)
+        self.logger.debug('Computed distance field for %s', target)
+        return field
+
+    def field_path(self, start, end, nontraversable=(), deadline=None):
+        """
+        Like find_path(), but descends the distance field of end.
+
+        Only the first step has to avoid nontraversable, since the other
+        ants will have moved by the time the rest of the path is walked. If
+        every step toward end is blocked, falls back to find_path().
+        """
+        gb = self.gameboard
+        field = self.distance_field(end, deadline)
+        start_index = gb.index_of(start)
+        if field.distance(start_index) is None:
+            return None
+        blocked = set(gb.index_of(c) for c in nontraversable)
+        blocked.discard(field.target)
+        path = field.path(start_index, blocked)
+        if path is None:
+            return self.find_path(start, end, nontraversable, deadline)
+        coordinate_at = gb.coordinate_at
+        return [coordinate_at(index) for index in path]
+
+    def build_path(self, end, parents):
+        path = []
         current = end
-        path = list()
-        while True:
-            parent = parent_coords.get(current, None)
-            if parent is None:
-                break
-            path.insert(0, current)
-            current = parent
+        while current in parents:
+            path.append(current)
+            current = parents[current]
+        path.reverse()
         return path
 
     @classmethod
@@ -66,40 +175,306 @@ class Pathfinder(object):
         Given Coordinates start and end, estimates the distance between them.
         """
         # Gameboards allow wrapping around, so we need to account for that.
-        new_end_x = end.x
-        new_end_y = end.y
-        if math.fabs((start.x - end.x)) > (self.gameboard.width / 2):
-            if start.x > end.x:
-                new_end_x = end.x + self.gameboard.width
-            else:
-                new_end_x = end.x - self.gameboard.width
-        if math.fabs((start.y - end.y)) > (self.gameboard.height / 2):
-            if start.y > end.y:
-                new_end_y = end.y + self.gameboard.height
-            else:
-                new_end_y = end.y - self.gameboard.height
-        end = C(new_end_x, new_end_y)
-        return self.cartesian_distance(start, end)
+        dx = math.fabs(start.x - end.x)
+        dy = math.fabs(start.y - end.y)
+        if dx > (self.gameboard.width / 2):
+            dx = self.gameboard.width - dx
+        if dy > (self.gameboard.height / 2):
+            dy = self.gameboard.height - dy
+        return math.sqrt(dx**2 + dy**2)
+
+    def index_heuristic(self, goal):
+        """
+        Returns a function estimating the distance from a tile index to the
+        tile index goal, using this pathfinder's heuristic.
+        """
+        return self.heuristic.for_goal(goal)
 
     def _get_neighboring_coordinates(self, coordinate):
-        gt = self.gameboard.get_tile
-        neighbors = (
-            gt(C(coordinate.x + 1, coordinate.y)),
-            gt(C(coordinate.x - 1, coordinate.y)),
-            gt(C(coordinate.x, coordinate.y + 1)),
-            gt(C(coordinate.x, coordinate.y - 1))
+        gb = self.gameboard
+        return tuple(
+            gb.coordinate_at(index) for index in
+            gb.neighbor_indexes(gb.index_of(coordinate))
         )
-        return tuple((x.coordinate for x in neighbors if x.traversable))
 
 
-@functools.total_ordering
-class QueueCoordinate(object):
-    def __init__(self, coordinate, f_score):
-        self.coordinate = coordinate
-        self.f_score = f_score
+class EuclideanHeuristic(object):
+    """
+    Estimates distances as the straight line distance between two tiles,
+    accounting for the board wrapping around. Ignores walls.
+    """
+
+    def __init__(self, gameboard):
+        self.gameboard = gameboard
+
+    def for_goal(self, goal):
+        """
+        Returns a function estimating the distance from a tile index to the
+        tile index goal, equivalent to Pathfinder.heuristic_cost().
+        """
+        width = self.gameboard.width
+        height = self.gameboard.height
+        goal_x = goal % width
+        goal_y = goal // width
+        half_width = width / 2
+        half_height = height / 2
+
+        def estimate(index):
+            dx = abs(index % width - goal_x)
+            dy = abs(index // width - goal_y)
+            if dx > half_width:
+                dx = width - dx
+            if dy > half_height:
+                dy = height - dy
+            return math.sqrt(dx * dx + dy * dy)
+        return estimate
+
+
+class LandmarkHeuristic(object):
+    """
+    An ALT (A*, landmarks and triangle inequality) heuristic.
 
-    def __lt__(self, other):
-        return (self.f_score < other.f_score)
+    A few landmark tiles are picked, and the wall-aware distance from each
+    of them to every tile is computed once by prepare(). For any landmark L,
+    |d(L, goal) - d(L, n)| never overestimates the distance from n to goal,
+    which is much tighter than a straight line on maze-like boards.
+
+    Walls never disappear, so distances computed before more walls were
+    revealed are still lower bounds and the heuristic stays admissible when
+    it is stale; it just gets less tight.
+    """
+
+    def __init__(self, gameboard, landmark_count=8):
+        self.gameboard = gameboard
+        self.landmark_count = landmark_count
+        self.landmarks = []
+        self.wall_version = None
+        self._fields = []
+        self._fallback = EuclideanHeuristic(gameboard)
+        self.logger = logging.getLogger('ants.pathfinding.LandmarkHeuristic')
 
-    def __eq__(self, other):
-        return (self.f_score == other.f_score)
+    @property
+    def stale(self):
+        return self.wall_version != self.gameboard.wall_version
+
+    def prepare(self):
+        """
+        Picks the landmarks and computes the distances from them.
+
+        Landmarks are chosen by farthest point selection: each new landmark
+        is the reachable tile farthest from the landmarks picked so far.
+        """
+        gb = self.gameboard
+        size = gb.width * gb.height
+        self.wall_version = gb.wall_version
+        self.landmarks = []
+        self._fields = []
+        first = next(
+            (i for i in range(size) if gb.tile_at_index(i).traversable), None
+        )
+        if first is None:
+            return
+        nearest = array('l', (-1, )) * size
+        candidate = first
+        while len(self.landmarks) < self.landmark_count:
+            field = DistanceField(gb, candidate)
+            self.landmarks.append(candidate)
+            self._fields.append(field._distances)
+            for index, distance in enumerate(field._distances):
+                if distance != DistanceField.UNREACHABLE and \
+                        (nearest[index] < 0 or distance < nearest[index]):
+                    nearest[index] = distance
+            # Tiles not reachable from any landmark so far make the best
+            # next landmark, since nothing bounds their distances yet.
+            candidate = max(
+                range(size),
+                key=lambda i: (size if nearest[i] < 0 and
+                               gb.tile_at_index(i).traversable else
+                               nearest[i])
+            )
+            if nearest[candidate] == 0:
+                break
+        self.logger.info(
+            'Prepared %d landmarks: %s', len(self.landmarks),
+            ', '.join(str(gb.coordinate_at(i)) for i in self.landmarks)
+        )
+
+    def export(self):
+        """
+        Returns the landmarks, the distances from them and the wall version
+        they were computed for, for load().
+        """
+        return self.landmarks, self._fields, self.wall_version
+
+    def load(self, landmarks, fields, wall_version):
+        """
+        Uses landmarks and the distances from them, as returned by export()
+        of a heuristic for the same board, instead of computing them.
+        """
+        self.landmarks = landmarks
+        self._fields = fields
+        self.wall_version = wall_version
+
+    def for_goal(self, goal):
+        fallback = self._fallback.for_goal(goal)
+        bounds = [
+            (distances, distances[goal]) for distances in self._fields
+            if distances[goal] != DistanceField.UNREACHABLE
+        ]
+        if not bounds:
+            return fallback
+
+        def estimate(index):
+            best = fallback(index)
+            for distances, goal_distance in bounds:
+                distance = distances[index]
+                if distance != DistanceField.UNREACHABLE:
+                    bound = abs(goal_distance - distance)
+                    if bound > best:
+                        best = bound
+            return best
+        return estimate
+
+
+class PathCache(object):
+    """
+    Remembers the paths found for ants, keyed by ant ID and target.
+
+    An ant that took the first step of its path can keep walking the rest
+    of it on the next turn, as long as the next step is free and no wall has
+    appeared on it.
+    """
+
+    def __init__(self, gameboard):
+        self.gameboard = gameboard
+        self.hits = 0
+        self.misses = 0
+        # Maps (ant ID, target) to (start, path, wall version)
+        self._paths = dict()
+        self.logger = logging.getLogger('ants.pathfinding.PathCache')
+
+    def get(self, ant_id, start, end, nontraversable=()):
+        """
+        Returns the remainder of the cached path from start to end for
+        ant_id, or None if there is no valid cached path.
+        """
+        key = (ant_id, end)
+        path = self._valid_path(key, start, nontraversable)
+        if path is None:
+            self._paths.pop(key, None)
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._paths[key] = (start, path, self.gameboard.wall_version)
+        return path
+
+    def put(self, ant_id, start, end, path):
+        self._paths[(ant_id, end)] = (
+            start, path, self.gameboard.wall_version
+        )
+
+    def prune(self, ant_ids):
+        """
+        Forgets the paths of every ant not in ant_ids.
+        """
+        for key in [k for k in self._paths if k[0] not in ant_ids]:
+            del self._paths[key]
+
+    def _valid_path(self, key, start, nontraversable):
+        entry = self._paths.get(key)
+        if entry is None:
+            return None
+        cached_start, path, wall_version = entry
+        if start != cached_start:
+            # The ant should have taken the first step since.
+            if path[0] != start:
+                return None
+            path = path[1:]
+        if len(path) == 0:
+            return None
+        if path[0] in nontraversable and path[0] != key[1]:
+            return None
+        if wall_version != self.gameboard.wall_version:
+            get_tile = self.gameboard.get_tile
+            if not all(get_tile(c).traversable for c in path):
+                return None
+        return path
+
+
+class DistanceField(object):
+    """
+    The number of steps from every tile of a gameboard to a target tile,
+    found by a single breadth-first search outward from the target.
+
+    Any number of ants can then walk toward the target by repeatedly
+    stepping to a neighbor that is closer to it.
+
+    Raises DeadlineExceeded if deadline, a time.monotonic() value, passes
+    before the search is done.
+    """
+    UNREACHABLE = -1
+
+    def __init__(self, gameboard, target, deadline=None):
+        self.gameboard = gameboard
+        self.target = target
+        self.wall_version = gameboard.wall_version
+        self._distances = self._compute(deadline)
+
+    def _compute(self, deadline):
+        neighbor_indexes = self.gameboard.neighbor_indexes
+        size = self.gameboard.width * self.gameboard.height
+        distances = array('l', (self.UNREACHABLE, )) * size
+        distances[self.target] = 0
+        frontier = [self.target]
+        distance = 0
+        while frontier:
+            if deadline is not None and time.monotonic() >= deadline:
+                raise DeadlineExceeded()
+            distance += 1
+            next_frontier = []
+            for index in frontier:
+                for neighbor in neighbor_indexes(index):
+                    if distances[neighbor] == self.UNREACHABLE:
+                        distances[neighbor] = distance
+                        next_frontier.append(neighbor)
+            frontier = next_frontier
+        return distances
+
+    def distance(self, index):
+        """
+        Returns the number of steps from index to the target, or None if the
+        target cannot be reached from index.
+        """
+        distance = self._distances[index]
+        if distance == self.UNREACHABLE:
+            return None
+        return distance
+
+    def next_step(self, index, blocked=()):
+        """
+        Returns a neighbor of index that is one step closer to the target
+        and not in blocked, or None if there is no such neighbor.
+        """
+        distances = self._distances
+        wanted = distances[index] - 1
+        if wanted < 0:
+            return None
+        for neighbor in self.gameboard.neighbor_indexes(index):
+            if distances[neighbor] == wanted and neighbor not in blocked:
+                return neighbor
+        return None
+
+    def path(self, start, blocked=()):
+        """
+        Returns a shortest path of tile indexes from start to the target,
+        not including start, whose first step avoids blocked. Returns None if
+        there is no such path.
+        """
+        step = self.next_step(start, blocked)
+        if step is None:
+            return None
+        path = [step]
+        while step != self.target:
+            step = self.next_step(step)
+            path.append(step)
+        return path
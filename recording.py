@@ -0,0 +1,169 @@
+"""
+Recording of games, and their offline replay.
+
+A recording is an append-only file with a line of JSON per record: the game
+info the game started with, then the game info and submitted moves of every
+turn. Files whose names end in .gz are gzip compressed.
+
+Replaying a recording feeds the recorded game info through an
+AntGameController and AI again, without a server, and compares the moves
+the AI makes with the recorded ones.
+"""
+
+import gzip
+import json
+import logging
+
+import client
+
+
+FORMAT_VERSION = 1
+
+
+def _open(path, mode):
+    if path.endswith('.gz'):
+        return gzip.open(path, mode + 't')
+    return open(path, mode)
+
+
+def _dumps(record):
+    return json.dumps(record, separators=(',', ':'), sort_keys=True)
+
+
+class GameRecorder(object):
+    """
+    Appends the turns of a game to a recording.
+
+    Walls rarely change from one turn to the next, so they are left out of
+    turns where they are the same as in the turn before.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = _open(path, 'a')
+        self._walls = None
+        self.logger = logging.getLogger('ants.recording.GameRecorder')
+
+    def record_start(self, agent_name, game_info):
+        self._write({
+            'type': 'start',
+            'version': FORMAT_VERSION,
+            'agent_name': agent_name,
+            'game_info': game_info,
+        })
+        self._walls = game_info['Walls']
+
+    def record_turn(self, game_info, moves):
+        record = {
+            'type': 'turn',
+            'moves': [move.to_dict() for move in moves],
+        }
+        if game_info['Walls'] == self._walls:
+            game_info = dict(game_info)
+            del game_info['Walls']
+            record['same_walls'] = True
+        else:
+            self._walls = game_info['Walls']
+        record['game_info'] = game_info
+        self._write(record)
+
+    def _write(self, record):
+        self._file.write(_dumps(record) + '\n')
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+def read_recording(path):
+    """
+    Yields the records of the recording at path, with the walls of every
+    turn restored.
+
+    A file may hold several games one after the other; each starts with a
+    record of type 'start'.
+    """
+    walls = None
+    with _open(path, 'r') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            game_info = record['game_info']
+            if record.get('same_walls'):
+                game_info['Walls'] = walls
+            walls = game_info['Walls']
+            yield record
+
+
+class ReplayClient(object):
+    """
+    Stands in for an AntAIClient during a replay.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.deadline = None
+        self.requests_sent = 0
+        self.retries = 0
+
+    def connection_stats(self):
+        return dict()
+
+
+class ReplayResult(object):
+    def __init__(self):
+        self.turns = 0
+        # (turn number, recorded moves, replayed moves) of every turn whose
+        # moves differ.
+        self.mismatches = []
+
+    @property
+    def identical(self):
+        return len(self.mismatches) == 0
+
+
+def replay_game(path, make_ai, incremental_updates=True, metrics=None,
+                game=0):
+    """
+    Replays a recorded game and returns a ReplayResult.
+
+    make_ai is called with no arguments to create the AI. The AI runs
+    without a deadline, so turns where the recorded game ran out of time
+    may come out differently. game picks a game from a recording that holds
+    several.
+    """
+    logger = logging.getLogger('ants.recording')
+    result = ReplayResult()
+    controller = None
+    games_seen = -1
+    for record in read_recording(path):
+        if record['type'] == 'start':
+            games_seen += 1
+            if games_seen > game:
+                break
+            if games_seen == game:
+                gameai = make_ai()
+                controller = client.AntGameController(
+                    ReplayClient(record['agent_name']), gameai,
+                    incremental_updates=incremental_updates, metrics=metrics
+                )
+                controller.initialize_gamestate(record['game_info'])
+                gameai.initialize(controller.gamestate)
+            continue
+        if games_seen != game:
+            continue
+        controller.start_turn_metrics()
+        with controller.metrics.phase('update_gamestate'):
+            controller.update_gamestate(record['game_info'])
+        movelist, slack = controller.run_ai()
+        moves = [move.to_dict() for move in movelist]
+        controller.end_turn_metrics(movelist, slack)
+        result.turns += 1
+        if _dumps(moves) != _dumps(record['moves']):
+            turn = controller.gamestate.turn_number
+            logger.warning('Moves of turn %d differ from the recording', turn)
+            result.mismatches.append((turn, record['moves'], moves))
+    if controller is None:
+        raise ValueError('{0} has no game {1}'.format(path, game))
+    return result
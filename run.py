@@ -5,7 +5,11 @@ import logging
 import sys
 
 import ai
+import aioclient
 import client
+import localserver
+import metrics
+import recording
 import ui
 
 
@@ -52,6 +56,104 @@ class AntRunApp(object):
             help=('If specified, renders the gameboard after every turn. '
                   'By default, the gameboard is not rendered.')
         )
+        a.add_argument(
+            '--ansi',
+            dest='ansi',
+            action='store_true',
+            default=False,
+            help=('If specified along with --render-gameboard, redraws the '
+                  'gameboard in place, writing only what changed, using '
+                  'ANSI escape codes.')
+        )
+        a.add_argument(
+            '--landmarks',
+            dest='landmarks',
+            type=int,
+            default=0,
+            help=('The number of landmarks to use for the ALT pathfinding '
+                  'heuristic. Defaults to %(default)s, which uses the '
+                  'straight line distance instead.')
+        )
+        a.add_argument(
+            '--assignment',
+            dest='assignment',
+            default='greedy',
+            choices=ai.JohnAI.ASSIGNMENT_STRATEGIES,
+            help=('How ants are assigned to objectives: greedily, one '
+                  'objective at a time, or by matching, all at once with '
+                  'the least total distance to cover. Matching is '
+                  'experimental and has not yet been shown to win more '
+                  'games. Defaults to %(default)s.')
+        )
+        a.add_argument(
+            '--workers',
+            dest='workers',
+            type=int,
+            default=0,
+            help=('The number of processes to plan the moves of squads in '
+                  'on large boards. Defaults to %(default)s, which plans '
+                  'them in this process.')
+        )
+        a.add_argument(
+            '--full-updates',
+            dest='full_updates',
+            action='store_true',
+            default=False,
+            help=('If specified, rebuilds the whole gameboard from the '
+                  'server status every turn instead of applying only what '
+                  'changed.')
+        )
+        a.add_argument(
+            '--async',
+            dest='use_async',
+            action='store_true',
+            default=False,
+            help=('If specified, overlaps network requests, rendering and '
+                  'logging with the AI\'s computation using asyncio.')
+        )
+        a.add_argument(
+            '--local-game',
+            dest='local_game',
+            action='store_true',
+            default=False,
+            help=('If specified, plays against an in-process local game '
+                  'server instead of the web service.')
+        )
+        a.add_argument(
+            '--metrics',
+            dest='metrics_path',
+            default=None,
+            help=('If specified, records how long every phase of a turn '
+                  'took, along with counts such as the number of ants, to '
+                  'this file.')
+        )
+        a.add_argument(
+            '--metrics-format',
+            dest='metrics_format',
+            default='jsonl',
+            choices=sorted(metrics.EXPORTERS),
+            help=('The format of the metrics file: a line of JSON per turn, '
+                  'or the Prometheus text format, rewritten every turn. '
+                  'Defaults to %(default)s.')
+        )
+        a.add_argument(
+            '--record',
+            dest='record_path',
+            default=None,
+            help=('If specified, appends the game info of every turn and the '
+                  'moves submitted to this file. Files ending in .gz are '
+                  'compressed.')
+        )
+        a.add_argument(
+            '--replay',
+            dest='replay_path',
+            default=None,
+            help=('Instead of playing, replays a game recorded with --record '
+                  'through the AI and checks that it makes the same moves.')
+        )
+        localserver.add_game_config_arguments(
+            a.add_argument_group('local game settings')
+        )
         self.argparser = a
 
     def run(self, argv):
@@ -60,14 +162,78 @@ class AntRunApp(object):
         logger = logging.getLogger('ants')
         logging.basicConfig()
         logger.setLevel(log_level)
-        gameclient = client.AntAIClient(args.agent_name, args.web_service_url)
+        turn_metrics = metrics.open_metrics(
+            args.metrics_path, args.metrics_format
+        )
+        if args.replay_path:
+            try:
+                self.replay(args, turn_metrics)
+            finally:
+                turn_metrics.close()
+            return
+        session = None
+        if args.local_game:
+            session = localserver.LocalTransport(localserver.LocalGameServer(
+                localserver.game_config_from_args(args)
+            ))
+        gameclient = client.AntAIClient(
+            args.agent_name, args.web_service_url, session=session
+        )
         renderer = None
-        if args.render_gameboard:
-            renderer = ui.GameTextRenderer()
-        gameai = ai.JohnAI()
-        controller = client.AntGameController(gameclient, gameai, renderer)
+        if args.render_gameboard and args.ansi:
+            renderer = ui.BackgroundRenderer(ui.AnsiGameRenderer())
+        elif args.render_gameboard:
+            renderer = ui.BackgroundRenderer(ui.GameTextRenderer())
+        gameai = ai.JohnAI(
+            landmark_count=args.landmarks, metrics=turn_metrics,
+            assignment=args.assignment, workers=args.workers
+        )
+        recorder = None
+        if args.record_path:
+            recorder = recording.GameRecorder(args.record_path)
+        controller_class = client.AntGameController
+        log_listener = None
+        if args.use_async:
+            controller_class = aioclient.AsyncAntGameController
+            log_listener = aioclient.start_background_logging(
+                logging.getLogger()
+            )
+        controller = controller_class(
+            gameclient, gameai, renderer,
+            incremental_updates=not args.full_updates, metrics=turn_metrics,
+            recorder=recorder
+        )
         gameclient.login(args.game_id)
-        controller.start()
+        try:
+            controller.start()
+        finally:
+            gameai.close()
+            if renderer is not None:
+                renderer.close()
+            turn_metrics.close()
+            if recorder is not None:
+                recorder.close()
+            if log_listener is not None:
+                log_listener.stop()
+
+    def replay(self, args, turn_metrics):
+        result = recording.replay_game(
+            args.replay_path,
+            lambda: ai.JohnAI(
+                landmark_count=args.landmarks, metrics=turn_metrics,
+                assignment=args.assignment
+            ),
+            incremental_updates=not args.full_updates, metrics=turn_metrics
+        )
+        print('Replayed {0} turns; {1} with different moves'.format(
+            result.turns, len(result.mismatches)
+        ))
+        for turn, recorded, replayed in result.mismatches:
+            print('Turn {0}:\n  recorded {1}\n  replayed {2}'.format(
+                turn, recorded, replayed
+            ))
+        if not result.identical:
+            sys.exit(1)
 
 if __name__ == '__main__':
     AntRunApp().run(sys.argv[1:])
@@ -0,0 +1,252 @@
+import heapq
+import itertools
+import logging
+from operator import add
+
+
+class SpatialIndex(object):
+    """
+    Buckets the tile indexes of a width x height board, which wraps around
+    its edges, into square cells of bucket_size tiles a side.
+
+    Queries only look at the buckets near the point asked about, so they
+    take time proportional to the number of entries found rather than to
+    the number of entries in the index.
+    """
+
+    def __init__(self, width, height, bucket_size=8):
+        self.width = width
+        self.height = height
+        self.bucket_size = bucket_size
+        self.columns = -(-width // bucket_size)
+        self.rows = -(-height // bucket_size)
+        self._buckets = [set() for _ in range(self.columns * self.rows)]
+        self._size = 0
+        self.logger = logging.getLogger('ants.spatial.SpatialIndex')
+
+    def __len__(self):
+        return self._size
+
+    def __contains__(self, index):
+        return index in self._buckets[self._bucket(index)]
+
+    def _bucket(self, index):
+        size = self.bucket_size
+        return ((index // self.width) // size) * self.columns + \
+            (index % self.width) // size
+
+    def add(self, index):
+        bucket = self._buckets[self._bucket(index)]
+        if index not in bucket:
+            bucket.add(index)
+            self._size += 1
+
+    def discard(self, index):
+        bucket = self._buckets[self._bucket(index)]
+        if index in bucket:
+            bucket.remove(index)
+            self._size -= 1
+
+    def clear(self):
+        for bucket in self._buckets:
+            bucket.clear()
+        self._size = 0
+
+    def copy(self):
+        index = SpatialIndex(self.width, self.height, self.bucket_size)
+        index._buckets = [set(bucket) for bucket in self._buckets]
+        index._size = self._size
+        return index
+
+    def _offset(self, frm, to, length):
+        """
+        Returns the signed offset from frm to to along an axis of length
+        that wraps around, between -length // 2 and length // 2.
+        """
+        offset = (to - frm) % length
+        if offset > length // 2:
+            offset -= length
+        return offset
+
+    def within(self, index, radius):
+        """
+        Returns the indexes in the square of tiles at most radius steps away
+        from index along either axis, not including index itself.
+
+        They are ordered like the tiles of ai.surrounding_tiles(): by x
+        offset, then by y offset.
+        """
+        width = self.width
+        height = self.height
+        x = index % width
+        y = index // width
+        size = self.bucket_size
+        columns = self.columns
+        # The last row and column of buckets may be narrower than the
+        # others, so the window can reach one bucket further.
+        column_span = min((2 * radius) // size + 3, columns)
+        row_span = min((2 * radius) // size + 3, self.rows)
+        first_column = ((x - radius) % width) // size
+        first_row = ((y - radius) % height) // size
+        found = []
+        offset = self._offset
+        for row in range(first_row, first_row + row_span):
+            row_start = (row % self.rows) * columns
+            for column in range(first_column, first_column + column_span):
+                for i in self._buckets[row_start + column % columns]:
+                    dx = offset(x, i % width, width)
+                    dy = offset(y, i // width, height)
+                    if -radius <= dx <= radius and -radius <= dy <= radius \
+                            and i != index:
+                        found.append((dx, dy, i))
+        found.sort()
+        return [i for _, _, i in found]
+
+    def count_within(self, index, radius):
+        """
+        Returns the number of indexes within() would return.
+        """
+        return len(self.within(index, radius))
+
+    def nearest(self, index, k, accept=None):
+        """
+        Returns up to k indexes closest to index by straight line distance,
+        nearest first, skipping those for which accept returns False. Ties
+        are broken by the lower index.
+        """
+        width = self.width
+        height = self.height
+        x = index % width
+        y = index // width
+        size = self.bucket_size
+        center_column = x // size
+        center_row = y // size
+        offset = self._offset
+        best = []
+        visited = set()
+        max_ring = max(self.columns, self.rows)
+        for ring in range(max_ring + 1):
+            for row, column in self._ring(center_row, center_column, ring):
+                bucket_id = (row % self.rows) * self.columns + \
+                    column % self.columns
+                if bucket_id in visited:
+                    continue
+                visited.add(bucket_id)
+                for i in self._buckets[bucket_id]:
+                    if accept is not None and not accept(i):
+                        continue
+                    dx = offset(x, i % width, width)
+                    dy = offset(y, i // width, height)
+                    entry = (-(dx * dx + dy * dy), -i)
+                    if len(best) < k:
+                        heapq.heappush(best, entry)
+                    elif entry > best[0]:
+                        heapq.heapreplace(best, entry)
+            # Anything in the buckets of the next ring is at least this far
+            # away along one axis. The narrower last row and column of
+            # buckets can bring a ring one bucket closer across the edge.
+            bound = (ring - 1) * size + 1
+            if len(best) == k and bound > 0 and \
+                    -best[0][0] <= bound * bound:
+                break
+        return [-i for _, i in sorted(best, reverse=True)]
+
+    @staticmethod
+    def _ring(center_row, center_column, ring):
+        if ring == 0:
+            yield center_row, center_column
+            return
+        for column in range(center_column - ring, center_column + ring + 1):
+            yield center_row - ring, column
+            yield center_row + ring, column
+        for row in range(center_row - ring + 1, center_row + ring):
+            yield row, center_column - ring
+            yield row, center_column + ring
+
+
+class SummedAreaTable(object):
+    """
+    Counts the tile indexes of a width x height board, which wraps around
+    its edges, that fall in any rectangle of tiles in constant time.
+
+    Row y of the table holds, for every x, the number of indexes above row
+    y and left of column x. Building it takes time proportional to the
+    area of the board, so it is meant to be built once a turn and queried
+    many times.
+    """
+
+    def __init__(self, width, height, indexes):
+        self.width = width
+        self.height = height
+        self._indexes = set(indexes)
+        columns_by_row = dict()
+        for index in self._indexes:
+            columns_by_row.setdefault(index // width, []).append(
+                index % width
+            )
+        previous = [0] * (width + 1)
+        rows = [previous]
+        for y in range(height):
+            columns = columns_by_row.get(y)
+            if columns is not None:
+                row = bytearray(width)
+                for x in columns:
+                    row[x] = 1
+                previous = list(map(
+                    add, previous, itertools.accumulate(
+                        itertools.chain((0, ), row)
+                    )
+                ))
+            # Rows without indexes share the row above them.
+            rows.append(previous)
+        self._rows = rows
+
+    def __len__(self):
+        return len(self._indexes)
+
+    def _count(self, x0, y0, x1, y1):
+        """
+        Counts the indexes in columns x0 to x1 and rows y0 to y1, not
+        including x1 and y1, of a rectangle that does not wrap.
+        """
+        rows = self._rows
+        return rows[y1][x1] - rows[y0][x1] - rows[y1][x0] + rows[y0][x0]
+
+    def _spans(self, start, length, size):
+        """
+        Splits length tiles from start along an axis of size that wraps
+        around into (start, stop) spans that do not.
+        """
+        if length >= size:
+            return ((0, size), )
+        start %= size
+        stop = start + length
+        if stop <= size:
+            return ((start, stop), )
+        return ((start, size), (0, stop - size))
+
+    def count_rect(self, x, y, width, height):
+        """
+        Returns the number of indexes in the width x height rectangle of
+        tiles whose top left tile is at x, y.
+        """
+        total = 0
+        for y0, y1 in self._spans(y, height, self.height):
+            for x0, x1 in self._spans(x, width, self.width):
+                total += self._count(x0, y0, x1, y1)
+        return total
+
+    def count_within(self, index, radius):
+        """
+        Returns the number of indexes at most radius steps away from index
+        along either axis, not including index itself, as
+        SpatialIndex.count_within() does.
+        """
+        side = 2 * radius + 1
+        count = self.count_rect(
+            index % self.width - radius, index // self.width - radius,
+            side, side
+        )
+        if index in self._indexes:
+            count -= 1
+        return count
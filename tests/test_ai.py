@@ -0,0 +1,51 @@
+import unittest
+
+import ai
+import client
+import localserver
+
+
+def start_game(john, wall_density=0.1):
+    """
+    Starts a local game for john and returns its client and controller.
+    """
+    server = localserver.LocalGameServer(localserver.GameConfig(
+        width=24, height=24, wall_density=wall_density, lockstep=True, seed=3
+    ))
+    game_client = client.AntAIClient(
+        'test', 'local', session=localserver.LocalTransport(server)
+    )
+    game_client.login()
+    controller = client.AntGameController(game_client, john)
+    controller.initialize_gamestate(game_client.get_game_info())
+    john.initialize(controller.gamestate)
+    return game_client, controller
+
+
+class TestLandmarks(unittest.TestCase):
+    def test_prepared_once_walls_are_known(self):
+        john = ai.JohnAI(landmark_count=4)
+        game_client, controller = start_game(john, wall_density=0.3)
+        self.assertEqual(john.landmarks.landmarks, [])
+        controller.update_gamestate(game_client.get_game_info())
+        gameboard = controller.gamestate.get_gameboard()
+        self.assertTrue(gameboard.wall_version)
+        john.execute(controller.gamestate)
+        self.assertEqual(john.landmarks.wall_version, gameboard.wall_version)
+        self.assertTrue(john.landmarks.landmarks)
+
+
+class TestExploreObjectives(unittest.TestCase):
+    def test_priority_without_hill(self):
+        john = ai.JohnAI()
+        game_client, controller = start_game(john)
+        controller.update_gamestate(game_client.get_game_info())
+        gameboard = controller.gamestate.get_gameboard()
+        objective = ai.ExploreObjective(0, gameboard.coordinate_at(0))
+        with_hill = john.explore_objective_priority(objective)
+        ant = gameboard.friendly_ants[0]
+        self.assertEqual(gameboard.friendly_ant_hill.index, ant.index)
+        gameboard.friendly_ant_hill = None
+        self.assertEqual(
+            john.explore_objective_priority(objective), with_hill
+        )
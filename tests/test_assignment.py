@@ -0,0 +1,136 @@
+import itertools
+import random
+import unittest
+
+import assignment
+
+
+def best_cost(costs, column_count):
+    """
+    Returns the least total cost of assigning every row of costs, a list of
+    dicts, a different column, or None if that cannot be done.
+    """
+    best = None
+    for columns in itertools.permutations(range(column_count), len(costs)):
+        if all(j in row for row, j in zip(costs, columns)):
+            cost = sum(row[j] for row, j in zip(costs, columns))
+            if best is None or cost < best:
+                best = cost
+    return best
+
+
+def random_costs(rng, row_count, column_count, density=1.0):
+    return [
+        dict(
+            (j, rng.randint(0, 20)) for j in range(column_count)
+            if rng.random() < density
+        )
+        for _ in range(row_count)
+    ]
+
+
+class TestSolve(unittest.TestCase):
+
+    def assertOptimal(self, costs, columns):
+        column_count = len(costs[0])
+        assigned = [j for j in columns if j is not None]
+        self.assertEqual(len(assigned), len(set(assigned)))
+        self.assertEqual(len(assigned), min(len(costs), column_count))
+        if len(costs) <= column_count:
+            rows = costs
+        else:
+            # The best assignment of every column a different row.
+            rows = [[row[j] for row in costs] for j in range(column_count)]
+        expected = best_cost(
+            [dict(enumerate(row)) for row in rows], len(rows[0])
+        )
+        total = sum(
+            costs[i][j] for i, j in enumerate(columns) if j is not None
+        )
+        self.assertEqual(total, expected)
+
+    def test_empty(self):
+        self.assertEqual(assignment.solve([]), [])
+
+    def test_random(self):
+        rng = random.Random(1)
+        for _ in range(300):
+            row_count = rng.randint(1, 6)
+            column_count = rng.randint(1, 6)
+            costs = [
+                [rng.randint(0, 20) for _ in range(column_count)]
+                for _ in range(row_count)
+            ]
+            self.assertOptimal(costs, assignment.solve(costs))
+
+    def test_random_few_rows(self):
+        # Few enough rows for solve() to drop the columns no row needs.
+        rng = random.Random(2)
+        for _ in range(100):
+            row_count = rng.randint(1, 2)
+            column_count = rng.randint(row_count * row_count + 1, 7)
+            costs = [
+                [rng.randint(0, 20) for _ in range(column_count)]
+                for _ in range(row_count)
+            ]
+            self.assertOptimal(costs, assignment.solve(costs))
+
+    def test_past_deadline(self):
+        self.assertIsNone(assignment.solve([[1, 2], [3, 4]], deadline=0))
+
+
+class TestSolveSparse(unittest.TestCase):
+
+    def test_random(self):
+        rng = random.Random(3)
+        for _ in range(500):
+            row_count = rng.randint(1, 5)
+            column_count = rng.randint(1, 6)
+            costs = random_costs(rng, row_count, column_count, 0.6)
+            columns = assignment.solve_sparse(costs, column_count)
+            assigned = [j for j in columns if j is not None]
+            self.assertEqual(len(assigned), len(set(assigned)))
+            for row, j in zip(costs, columns):
+                self.assertTrue(j is None or j in row)
+            expected = best_cost(costs, column_count)
+            if expected is not None:
+                self.assertNotIn(None, columns)
+                self.assertEqual(
+                    sum(row[j] for row, j in zip(costs, columns)), expected
+                )
+
+    def test_past_deadline(self):
+        costs = [{0: 1}, {0: 2, 1: 3}]
+        self.assertIsNone(assignment.solve_sparse(costs, 2, deadline=0))
+
+
+class TestSolveGreedily(unittest.TestCase):
+
+    def test_rows_take_cheapest_column_left(self):
+        costs = [[1, 2, 9], [1, 5, 3], [0, 0, 0], [4, 4, 4]]
+        self.assertEqual(assignment.solve_greedily(costs), [0, 2, 1, None])
+
+    def test_sparse_rows(self):
+        costs = [{2: 1, 0: 5}, {2: 0}, {0: 1}]
+        self.assertEqual(assignment.solve_greedily(costs), [2, None, 0])
+
+
+class TestTorusDistances(unittest.TestCase):
+
+    def test_wraps(self):
+        width, height = 7, 4
+        rng = random.Random(4)
+        goals = [rng.randrange(width * height) for _ in range(5)]
+        indexes = list(range(width * height))
+        matrix = assignment.torus_distances(goals, indexes, width, height)
+        for goal, row in zip(goals, matrix):
+            for index, distance in zip(indexes, row):
+                dx = abs(goal % width - index % width)
+                dy = abs(goal // width - index // width)
+                dx = min(dx, width - dx)
+                dy = min(dy, height - dy)
+                self.assertAlmostEqual(distance, (dx * dx + dy * dy) ** 0.5)
+
+
+if __name__ == '__main__':
+    unittest.main()
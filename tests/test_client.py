@@ -0,0 +1,157 @@
+import unittest
+
+import requests
+
+import aioclient
+import client
+import localserver
+import metrics
+
+
+class TimingOutTransport(localserver.LocalTransport):
+    """
+    A LocalTransport whose requests of the kinds in failures, a dict of
+    URL fragments to sets of turns, time out on those turns.
+    """
+
+    def __init__(self, server, failures):
+        super().__init__(server)
+        self.failures = failures
+        self.timeouts = 0
+
+    def _request(self, method, url, data):
+        game = next(iter(self.server.games.values()), None)
+        for fragment, turns in self.failures.items():
+            if game is not None and fragment in url and game.turn in turns:
+                self.timeouts += 1
+                raise requests.Timeout('Stub timeout')
+        return super()._request(method, url, data)
+
+
+class IdleAI(object):
+    def initialize(self, gamestate):
+        pass
+
+    def execute(self, gamestate, deadline=None):
+        return []
+
+
+class GamestateOnlyAI(object):
+    """
+    An AI written before execute() took a deadline.
+    """
+
+    def __init__(self):
+        self.turns = []
+
+    def initialize(self, gamestate):
+        pass
+
+    def execute(self, gamestate):
+        self.turns.append(gamestate.turn_number)
+        return []
+
+
+class ListExporter(object):
+    def __init__(self):
+        self.records = []
+
+    def export(self, record):
+        self.records.append(record)
+
+    def close(self):
+        pass
+
+
+def make_controller(controller_class, failures, ai=None):
+    server = localserver.LocalGameServer(localserver.GameConfig(
+        width=16, height=16, turn_length_ms=30, lockstep=True, max_turns=10,
+        seed=1
+    ))
+    transport = TimingOutTransport(server, failures)
+    game_client = client.AntAIClient('test', 'local', session=transport)
+    game_client.RETRY_BACKOFF = 0.001
+    game_client.login()
+    turn_metrics = metrics.TurnMetrics(ListExporter())
+    if ai is None:
+        ai = IdleAI()
+    controller = controller_class(game_client, ai, metrics=turn_metrics)
+    return controller, transport
+
+
+def game_info(turn, walls):
+    return {
+        'Width': 8, 'Height': 8, 'FogOfWar': 4, 'Turn': turn,
+        'TotalFood': 0, 'FriendlyAnts': [], 'EnemyAnts': [],
+        'VisibleFood': [], 'Hill': {'X': 0, 'Y': 0, 'Owner': 'test'},
+        'EnemyHills': [], 'IsGameOver': False,
+        'Walls': [{'X': x, 'Y': y} for x, y in walls],
+    }
+
+
+class TestIncrementalWalls(unittest.TestCase):
+
+    def test_reordered_walls(self):
+        controller = client.AntGameController(
+            client.AntAIClient('test', 'local'), IdleAI()
+        )
+        walls = [(1, 1), (2, 2), (3, 3), (4, 4)]
+        controller.initialize_gamestate(game_info(0, []))
+        controller.update_gamestate(game_info(1, walls))
+        # As long as the first, but reordered, with a new wall in the middle
+        # and the same walls at both ends.
+        reordered = [(1, 1), (3, 3), (5, 5), (4, 4)]
+        controller.update_gamestate(game_info(2, reordered))
+        gameboard = controller.gamestate.get_gameboard()
+        for x, y in walls + reordered:
+            self.assertFalse(gameboard.tile_at(x, y).traversable, (x, y))
+        self.assertTrue(gameboard.tile_at(6, 6).traversable)
+
+
+class TestControllerTimeouts(unittest.TestCase):
+
+    FAILURES = {'status': {3}, 'update': {6}}
+
+    def assertSurvived(self, controller, transport):
+        self.assertTrue(controller.gamestate.game_over)
+        self.assertGreater(transport.timeouts, 0)
+        self.assertGreaterEqual(controller.missed_turns, 2)
+        missed = sum(
+            record['counts'].get('missed_turns', 0)
+            for record in controller.metrics.exporter.records
+        )
+        self.assertEqual(missed, controller.missed_turns)
+
+    def test_controller_survives_timeouts(self):
+        controller, transport = make_controller(
+            client.AntGameController, self.FAILURES
+        )
+        controller.start()
+        self.assertSurvived(controller, transport)
+
+    def test_async_controller_survives_timeouts(self):
+        controller, transport = make_controller(
+            aioclient.AsyncAntGameController, self.FAILURES
+        )
+        controller.start()
+        self.assertSurvived(controller, transport)
+
+
+class TestAIContract(unittest.TestCase):
+
+    def test_gamestate_only_ai(self):
+        for controller_class in (
+                client.AntGameController, aioclient.AsyncAntGameController):
+            ai = GamestateOnlyAI()
+            controller, _ = make_controller(controller_class, {}, ai)
+            controller.start()
+            self.assertTrue(controller.gamestate.game_over)
+            self.assertEqual(len(ai.turns), 9)
+
+    def test_takes_deadline(self):
+        self.assertTrue(client.takes_deadline(IdleAI().execute))
+        self.assertFalse(client.takes_deadline(GamestateOnlyAI().execute))
+
+
+if __name__ == '__main__':
+    unittest.main()
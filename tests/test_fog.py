@@ -0,0 +1,77 @@
+import random
+import unittest
+
+from fog import FogMemory
+
+
+def neighbors(index, width, height):
+    x = index % width
+    y = index // width
+    return (
+        (x + 1) % width + y * width, (x - 1) % width + y * width,
+        x + (y + 1) % height * width, x + (y - 1) % height * width
+    )
+
+
+class TestFogMemory(unittest.TestCase):
+
+    def test_frontier_matches_neighbor_scan(self):
+        rng = random.Random(1)
+        for _ in range(200):
+            # Odd widths and heights, and boards too small for every
+            # neighbor to be a different tile.
+            width = rng.randint(1, 15)
+            height = rng.randint(1, 15)
+            size = width * height
+            stale_turns = rng.randint(1, 4)
+            memory = FogMemory(width, height, stale_turns)
+            walls = bytes(rng.random() < 0.2 for _ in range(size))
+            seen = []
+            last_seen = [-1] * size
+            for turn in range(rng.randint(1, 6)):
+                visible = set(
+                    i for i in range(size) if rng.random() < 0.4
+                )
+                if rng.random() < 0.3:
+                    memory = memory.copy()
+                memory.update(
+                    turn, bytes(i in visible for i in range(size)),
+                    walls if turn == 0 else None
+                )
+                seen.append(visible)
+                for i in visible:
+                    last_seen[i] = turn
+                recent = set().union(*seen[-stale_turns:])
+                frontier = [
+                    i for i in range(size)
+                    if i in recent and not walls[i] and any(
+                        j not in recent and not walls[j]
+                        for j in neighbors(i, width, height)
+                    )
+                ]
+                self.assertEqual(list(memory.frontier_indexes()), frontier)
+                self.assertEqual(list(memory.last_seen), last_seen)
+                for i in range(size):
+                    self.assertEqual(memory.on_frontier(i), i in frontier)
+
+    def test_frontier_cells(self):
+        rng = random.Random(2)
+        for _ in range(50):
+            width = rng.randint(1, 15)
+            height = rng.randint(1, 15)
+            size = width * height
+            cell_size = rng.randint(1, 4)
+            memory = FogMemory(width, height)
+            memory.update(0, bytes(rng.random() < 0.5 for _ in range(size)))
+            frontier = list(memory.frontier_indexes())
+            expected = dict()
+            for i in frontier:
+                x, y = i % width, i // width
+                cell = (y // cell_size) * -(-width // cell_size) + \
+                    x // cell_size
+                expected.setdefault(cell, i)
+            self.assertEqual(memory.frontier_cells(cell_size), expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
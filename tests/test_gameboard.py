@@ -0,0 +1,27 @@
+import unittest
+
+import gameboard
+
+
+class TestNeighborIndexes(unittest.TestCase):
+
+    def test_wraps_with_larger_buffer(self):
+        # Shared memory is rounded up to whole pages, so the buffer a board
+        # is backed by may be longer than the board.
+        width, height = 5, 3
+        board = gameboard.Gameboard(width, height)
+        shared = gameboard.Gameboard.with_tile_types(
+            width, height, bytearray(board.tile_type_bytes()) + bytes(4096)
+        )
+        for index in range(width * height):
+            x, y = index % width, index // width
+            expected = [
+                y * width + (x + 1) % width, y * width + (x - 1) % width,
+                (y + 1) % height * width + x, (y - 1) % height * width + x
+            ]
+            self.assertEqual(shared.neighbor_indexes(index), expected)
+            self.assertEqual(board.neighbor_indexes(index), expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
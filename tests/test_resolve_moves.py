@@ -0,0 +1,42 @@
+import unittest
+
+import ai
+
+
+def plan(ant_id, frm, steps, path_length):
+    return ai.MovePlan(ant_id, frm, steps, [None] * path_length)
+
+
+class TestResolveMoves(unittest.TestCase):
+
+    def test_first_steps(self):
+        plans = [plan(1, 0, [1], 1), plan(2, 5, [6], 1)]
+        self.assertEqual(ai.resolve_moves(plans, {0, 5}), {1: 1, 2: 6})
+
+    def test_contention(self):
+        # The ant with fewer steps left gets the tile.
+        plans = [plan(1, 0, [2, 3], 4), plan(2, 1, [2, 4], 2)]
+        self.assertEqual(ai.resolve_moves(plans, {0, 1}), {1: 3, 2: 2})
+
+    def test_occupant_staying(self):
+        plans = [plan(1, 0, [1, 2], 1)]
+        self.assertEqual(ai.resolve_moves(plans, {0, 1}), {1: 2})
+
+    def test_swap(self):
+        plans = [plan(1, 0, [1], 1), plan(2, 1, [0, 3], 2)]
+        self.assertEqual(ai.resolve_moves(plans, {0, 1}), {1: 1, 2: 3})
+
+    def test_swap_and_contention(self):
+        # Ants 1 and 2 want to swap tiles, and ant 3 wants ant 2's tile as
+        # well. Ant 2 gives way to ant 1 once, taking its next step, rather
+        # than once for each of the two tiles of the swap.
+        plans = [
+            plan(1, 0, [1], 1), plan(2, 1, [0, 3], 2), plan(3, 2, [1, 4], 3)
+        ]
+        self.assertEqual(
+            ai.resolve_moves(plans, {0, 1, 2}), {1: 1, 2: 3, 3: 4}
+        )
+
+
+if __name__ == '__main__':
+    unittest.main()
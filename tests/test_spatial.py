@@ -0,0 +1,125 @@
+import random
+import unittest
+
+from spatial import SpatialIndex, SummedAreaTable
+
+
+def offset(frm, to, length):
+    offset = (to - frm) % length
+    if offset > length // 2:
+        offset -= length
+    return offset
+
+
+def within(indexes, index, radius, width, height):
+    """
+    Returns the indexes at most radius steps away from index along either
+    axis, not including index itself, ordered by x offset, then y offset.
+    """
+    x = index % width
+    y = index // width
+    found = []
+    for i in indexes:
+        dx = offset(x, i % width, width)
+        dy = offset(y, i // width, height)
+        if abs(dx) <= radius and abs(dy) <= radius and i != index:
+            found.append((dx, dy, i))
+    return [i for _, _, i in sorted(found)]
+
+
+def random_board(rng):
+    # Odd sizes, and others that are not a multiple of the bucket size,
+    # leave the last row and column of buckets narrower than the others.
+    width = rng.randint(1, 31)
+    height = rng.randint(1, 31)
+    size = width * height
+    indexes = set(rng.sample(range(size), rng.randint(0, size)))
+    return width, height, indexes
+
+
+class TestSpatialIndex(unittest.TestCase):
+
+    def test_within(self):
+        rng = random.Random(1)
+        for _ in range(300):
+            width, height, indexes = random_board(rng)
+            spatial = SpatialIndex(width, height, rng.choice((1, 3, 8)))
+            for i in indexes:
+                spatial.add(i)
+            if indexes:
+                discarded = rng.choice(sorted(indexes))
+                spatial.discard(discarded)
+                indexes.discard(discarded)
+            self.assertEqual(len(spatial), len(indexes))
+            for _ in range(5):
+                index = rng.randrange(width * height)
+                # Up to windows wider than the whole board.
+                radius = rng.randint(0, max(width, height))
+                expected = within(indexes, index, radius, width, height)
+                self.assertEqual(spatial.within(index, radius), expected)
+                self.assertEqual(
+                    spatial.count_within(index, radius), len(expected)
+                )
+
+    def test_nearest(self):
+        rng = random.Random(2)
+        for _ in range(300):
+            width, height, indexes = random_board(rng)
+            spatial = SpatialIndex(width, height, rng.choice((1, 3, 8)))
+            for i in indexes:
+                spatial.add(i)
+            index = rng.randrange(width * height)
+            k = rng.randint(1, 10)
+            accept = None
+            if rng.random() < 0.5:
+                def accept(i):
+                    return i % 3 != 0
+            x = index % width
+            y = index // width
+            expected = sorted(
+                (i for i in indexes if accept is None or accept(i)),
+                key=lambda i: (
+                    offset(x, i % width, width) ** 2 +
+                    offset(y, i // width, height) ** 2, i
+                )
+            )[:k]
+            self.assertEqual(spatial.nearest(index, k, accept), expected)
+
+
+class TestSummedAreaTable(unittest.TestCase):
+
+    def test_count_within(self):
+        rng = random.Random(3)
+        for _ in range(300):
+            width, height, indexes = random_board(rng)
+            table = SummedAreaTable(width, height, indexes)
+            self.assertEqual(len(table), len(indexes))
+            for _ in range(5):
+                index = rng.randrange(width * height)
+                radius = rng.randint(0, max(width, height))
+                self.assertEqual(
+                    table.count_within(index, radius),
+                    len(within(indexes, index, radius, width, height))
+                )
+
+    def test_count_rect(self):
+        rng = random.Random(4)
+        for _ in range(300):
+            width, height, indexes = random_board(rng)
+            table = SummedAreaTable(width, height, indexes)
+            x = rng.randint(-width, 2 * width)
+            y = rng.randint(-height, 2 * height)
+            rect_width = rng.randint(0, width)
+            rect_height = rng.randint(0, height)
+            expected = sum(
+                1 for i in indexes
+                if (i % width - x) % width < rect_width and
+                (i // width - y) % height < rect_height
+            )
+            self.assertEqual(
+                table.count_rect(x, y, rect_width, rect_height), expected
+            )
+
+
+if __name__ == '__main__':
+    unittest.main()
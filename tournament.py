@@ -0,0 +1,354 @@
+#!/usr/bin/env python3
+"""
+Plays headless self-play games between variants of JohnAI.
+
+Every variant overrides some of JohnAI.DEFAULT_WEIGHTS and plays a number of
+games against an opponent: an unmodified JohnAI, or the local server's
+random bots. Games run in-process against localserver.LocalGame in lockstep,
+so no turn is ever waited for, and are spread across a process pool.
+
+Example:
+
+    ./tournament.py --games 20 --sweep food_distance=50,100,200 \\
+        --variant defensive:defender_counts=3,5,8
+"""
+
+import argparse
+import concurrent.futures
+import itertools
+import json
+import logging
+import os
+import sys
+import time
+
+import ai
+import client
+import localserver
+
+
+class Variant(object):
+    """
+    A named set of JohnAI weight overrides.
+    """
+
+    def __init__(self, name, weights=None):
+        self.name = name
+        self.weights = weights or dict()
+
+    @classmethod
+    def parse(cls, text):
+        """
+        Parses NAME:KEY=VALUE[;KEY=VALUE...]. Values are numbers;
+        commas make tuples, as in defender_counts=1,3,5.
+        """
+        name, _, settings = text.partition(':')
+        weights = dict()
+        for setting in settings.split(';'):
+            if not setting:
+                continue
+            key, _, value = setting.partition('=')
+            weights[key] = parse_weight(key, value)
+        return cls(name, weights)
+
+
+def parse_weight(key, value):
+    if key not in ai.JohnAI.DEFAULT_WEIGHTS:
+        raise ValueError('Unknown weight: {0}'.format(key))
+    values = tuple(float(v) if '.' in v else int(v) for v in value.split(','))
+    if isinstance(ai.JohnAI.DEFAULT_WEIGHTS[key], tuple):
+        return values
+    if len(values) != 1:
+        raise ValueError('{0} takes a single value'.format(key))
+    return values[0]
+
+
+def sweep_variants(sweeps):
+    """
+    Returns a Variant for every combination of the values in sweeps, a list
+    of KEY=V1,V2,... strings. Tuple weights are separated with '/', as in
+    defender_counts=1/3/5,2/4/6.
+    """
+    if not sweeps:
+        return []
+    axes = []
+    for sweep in sweeps:
+        key, _, values = sweep.partition('=')
+        axes.append([
+            (key, parse_weight(key, value.replace('/', ',')))
+            for value in values.split(',')
+        ])
+    variants = []
+    for combination in itertools.product(*axes):
+        name = ' '.join(
+            '{0}={1}'.format(key, value) for key, value in combination
+        )
+        variants.append(Variant(name, dict(combination)))
+    return variants
+
+
+class TournamentPlayer(object):
+    """
+    One side of a tournament game: a client, controller and AI, plus the
+    time its AI spent on every turn.
+    """
+
+    def __init__(self, name, gameai, server):
+        session = localserver.LocalTransport(server)
+        self.client = client.AntAIClient(name, 'local', session=session)
+        self.ai = gameai
+        self.controller = client.AntGameController(self.client, gameai)
+        self.turn_times = []
+
+    def initialize(self):
+        self.controller.initialize_gamestate(self.client.get_game_info())
+        self.ai.initialize(self.controller.gamestate)
+
+    def update(self):
+        """
+        Updates the gamestate; returns False once the game is over.
+        """
+        self.controller.update_gamestate(self.client.get_game_info())
+        return not self.controller.gamestate.game_over
+
+    def play_turn(self):
+        start = time.perf_counter()
+        movelist = self.ai.execute(self.controller.gamestate)
+        self.turn_times.append(time.perf_counter() - start)
+        self.client.submit_move_list(movelist)
+
+
+def play_game(config, weights, opponent_weights, variant_first):
+    """
+    Plays one game between a JohnAI with weights and an opponent, and
+    returns a dict with its outcome.
+
+    If opponent_weights is None, the opponent is the local server's random
+    bot. variant_first picks which side gets the first hill.
+    """
+    server = localserver.LocalGameServer(config)
+    variant = TournamentPlayer('variant', ai.JohnAI(weights=weights), server)
+    players = [variant]
+    if opponent_weights is not None:
+        opponent = TournamentPlayer(
+            'opponent', ai.JohnAI(weights=opponent_weights), server
+        )
+        players.append(opponent)
+        if not variant_first:
+            players.reverse()
+    players[0].client.login()
+    for player in players[1:]:
+        player.client.login(players[0].client.game_id)
+    game = server.games[players[0].client.game_id]
+    for player in players:
+        player.initialize()
+    while True:
+        if not all([player.update() for player in players]):
+            break
+        for player in players:
+            player.play_turn()
+    winner = game.winner
+    if winner is not None and winner != 'variant':
+        winner = 'opponent'
+    return {
+        'winner': winner,
+        'turns': game.turn,
+        'turn_times': variant.turn_times,
+    }
+
+
+def _play_game(task):
+    # Runs in a worker process, where nothing should be logged below errors.
+    logging.getLogger('ants').setLevel(logging.ERROR)
+    variant_name, config, weights, opponent_weights, variant_first = task
+    return variant_name, play_game(
+        config, weights, opponent_weights, variant_first
+    )
+
+
+class Tournament(object):
+    """
+    Plays games for every variant and collects their results.
+    """
+
+    def __init__(self, variants, games, config, opponent_weights=None,
+                 workers=None):
+        self.variants = variants
+        self.games = games
+        self.config = config
+        self.opponent_weights = opponent_weights
+        self.workers = workers
+        self.results = dict((v.name, []) for v in variants)
+        self.logger = logging.getLogger('ants.tournament.Tournament')
+
+    def tasks(self):
+        for variant in self.variants:
+            for game_number in range(self.games):
+                # Every variant plays the same maps, from both sides.
+                config = localserver.GameConfig(**vars(self.config))
+                if config.seed is not None:
+                    config.seed += game_number // 2
+                yield (
+                    variant.name, config, variant.weights,
+                    self.opponent_weights, game_number % 2 == 0
+                )
+
+    def run(self):
+        tasks = list(self.tasks())
+        start = time.monotonic()
+        if self.workers == 1:
+            outcomes = map(_play_game, tasks)
+        else:
+            executor = concurrent.futures.ProcessPoolExecutor(self.workers)
+            outcomes = executor.map(_play_game, tasks, chunksize=1)
+        try:
+            for variant_name, result in outcomes:
+                self.results[variant_name].append(result)
+                self.logger.info(
+                    '%s: winner %s after %d turns', variant_name,
+                    result['winner'], result['turns']
+                )
+        finally:
+            if self.workers != 1:
+                executor.shutdown()
+        self.elapsed = time.monotonic() - start
+
+    def summary(self):
+        """
+        Returns a list with a dict of statistics for every variant.
+        """
+        summary = []
+        for variant in self.variants:
+            results = self.results[variant.name]
+            turn_times = sorted(itertools.chain.from_iterable(
+                r['turn_times'] for r in results
+            ))
+            winners = [r['winner'] for r in results]
+            summary.append({
+                'variant': variant.name,
+                'weights': variant.weights,
+                'games': len(results),
+                'wins': winners.count('variant'),
+                'losses': winners.count('opponent'),
+                'draws': winners.count(None),
+                'win_rate': winners.count('variant') / max(len(results), 1),
+                'mean_turns': (
+                    sum(r['turns'] for r in results) / max(len(results), 1)
+                ),
+                'mean_turn_ms': (
+                    1000 * sum(turn_times) / max(len(turn_times), 1)
+                ),
+                'p99_turn_ms': 1000 * percentile(turn_times, 0.99),
+                'max_turn_ms': 1000 * percentile(turn_times, 1),
+            })
+        return summary
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0
+    index = min(int(len(sorted_values) * fraction), len(sorted_values) - 1)
+    return sorted_values[index]
+
+
+def format_summary(summary):
+    columns = (
+        ('variant', '{0}'), ('games', '{0}'), ('wins', '{0}'),
+        ('losses', '{0}'), ('draws', '{0}'), ('win_rate', '{0:.1%}'),
+        ('mean_turns', '{0:.0f}'), ('mean_turn_ms', '{0:.2f}'),
+        ('p99_turn_ms', '{0:.2f}'), ('max_turn_ms', '{0:.2f}'),
+    )
+    rows = [[name for name, _ in columns]]
+    for stats in summary:
+        rows.append([fmt.format(stats[name]) for name, fmt in columns])
+    widths = [max(len(row[i]) for row in rows) for i in range(len(columns))]
+    return '\n'.join(
+        '  '.join(cell.ljust(width) for cell, width in zip(row, widths))
+        for row in rows
+    )
+
+
+def main(argv):
+    a = argparse.ArgumentParser(
+        description='Plays headless games between variants of JohnAI.'
+    )
+    a.add_argument(
+        '--variant', dest='variants', action='append', default=[],
+        metavar='NAME:KEY=VALUE[;KEY=VALUE...]',
+        help=('A variant overriding some of the AI\'s weights. May be '
+              'given several times.')
+    )
+    a.add_argument(
+        '--sweep', dest='sweeps', action='append', default=[],
+        metavar='KEY=V1,V2,...',
+        help=('Adds a variant for every combination of the swept weight '
+              'values. May be given several times.')
+    )
+    a.add_argument(
+        '--games', type=int, default=10,
+        help='The number of games every variant plays. Defaults to '
+             '%(default)s.'
+    )
+    a.add_argument(
+        '--opponent', choices=('baseline', 'bots'), default='baseline',
+        help=('Play against an AI with the default weights, or against '
+              'the local server\'s random bots. Defaults to %(default)s.')
+    )
+    a.add_argument(
+        '--no-baseline', dest='baseline', action='store_false', default=True,
+        help='Do not include the default weights as a variant.'
+    )
+    a.add_argument(
+        '--workers', type=int, default=os.cpu_count(),
+        help='The number of processes to play games in. Defaults to the '
+             'number of CPUs.'
+    )
+    a.add_argument(
+        '--json', dest='json_path', default=None,
+        help='Also writes the summary to this file as JSON.'
+    )
+    a.add_argument(
+        '--log-level', dest='log_level', default='error',
+        choices=('debug', 'info', 'warning', 'error', 'critical')
+    )
+    game_settings = a.add_argument_group('game settings')
+    localserver.add_game_config_arguments(game_settings)
+    a.set_defaults(max_turns=200, seed=0)
+    args = a.parse_args(argv)
+    logging.basicConfig()
+    log_level = getattr(logging, args.log_level.upper())
+    logging.getLogger('ants').setLevel(log_level)
+
+    variants = []
+    if args.baseline:
+        variants.append(Variant('baseline'))
+    variants.extend(Variant.parse(v) for v in args.variants)
+    variants.extend(sweep_variants(args.sweeps))
+    if not variants:
+        a.error('No variants to play')
+
+    config = localserver.game_config_from_args(args)
+    # Turns end as soon as both sides have moved, never on the clock.
+    config.lockstep = True
+    config.turn_length_ms = 24 * 60 * 60 * 1000
+    opponent_weights = None
+    if args.opponent == 'baseline':
+        opponent_weights = dict()
+        config.fill_with_bots = False
+    tournament = Tournament(
+        variants, args.games, config, opponent_weights, args.workers
+    )
+    tournament.run()
+    summary = tournament.summary()
+    print(format_summary(summary))
+    game_count = sum(stats['games'] for stats in summary)
+    print('{0} games in {1:.1f}s ({2:.0f} games per hour)'.format(
+        game_count, tournament.elapsed,
+        3600 * game_count / max(tournament.elapsed, 1e-9)
+    ))
+    if args.json_path:
+        with open(args.json_path, 'w') as f:
+            json.dump(summary, f, indent=2)
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
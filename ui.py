@@ -1,3 +1,7 @@
+import logging
+import sys
+import threading
+
 import gameboard
 
 
@@ -37,36 +41,128 @@ class GameTextRenderer(object):
             if p == 'self':
                 continue
             setattr(self, p, properties[p])
-        self.overlay = lambda tile, gamestate: None
+        self.overlay = None
+        tile_chars = (
+            visible_tile, invisible_tile, wall, friendly_hill, enemy_hill,
+            friendly_ant, enemy_ant, food
+        )
+        # Boards are drawn a byte per tile when every tile character is a
+        # single ASCII character.
+        self._byte_chars = all(
+            len(c) == 1 and ord(c) < 128 for c in tile_chars
+        )
+        if self._byte_chars:
+            self._visible_table = self._type_table(visible_tile)
+            self._invisible_table = self._type_table(invisible_tile)
+
+    def _type_table(self, basic_tile):
+        table = bytearray(range(256))
+        table[gameboard.TileType.basic.value] = ord(basic_tile)
+        table[gameboard.TileType.wall.value] = ord(self.wall)
+        # Hills are redrawn with the character of their owner.
+        table[gameboard.TileType.ant_hill.value] = ord(self.enemy_hill)
+        return bytes(table)
 
     def display(self, gamestate):
         print('\n\n' + self.render(gamestate))
 
     def register_overlay(self, overlay):
+        """
+        Sets the overlay drawn over the board: a mapping of Coordinates to
+        the characters to draw there, or a function called with every tile
+        and the gamestate that returns a character or None.
+        """
         self.overlay = overlay
 
     def render(self, gamestate):
-        board = self.top_left_corner + \
-            (self.horizontal_border * gamestate.get_gameboard().width) + \
-            self.bottom_left_corner + '\n'
-        for y in range(0, gamestate.get_gameboard().height):
-            board += self.vertical_border
-            for x in range(0, gamestate.get_gameboard().width):
-                board += self.render_tile(
-                    gamestate.get_gameboard().tiles[x][y], gamestate
-                )
-            board += self.vertical_border + '\n'
-        board += self.bottom_left_corner + \
-            self.horizontal_border * gamestate.get_gameboard().width + \
-            self.bottom_left_corner
+        width = gamestate.get_gameboard().width
+        lines = [
+            self.top_left_corner + self.horizontal_border * width +
+            self.top_right_corner
+        ]
+        lines.extend(
+            self.vertical_border + row + self.vertical_border
+            for row in self.render_rows(gamestate)
+        )
+        lines.append(
+            self.bottom_left_corner + self.horizontal_border * width +
+            self.bottom_right_corner
+        )
         if gamestate.game_over:
-            board += '\n' + 'GAME OVER'
-        return board
+            lines.append('GAME OVER')
+        return '\n'.join(lines)
+
+    def render_rows(self, gamestate):
+        """
+        Returns the rows of the board, without borders, as a list of
+        strings.
+        """
+        gb = gamestate.get_gameboard()
+        width = gb.width
+        if not self._byte_chars:
+            return [
+                ''.join(
+                    self.render_tile(gb.tile_at(x, y), gamestate)
+                    for x in range(width)
+                )
+                for y in range(gb.height)
+            ]
+        frame = self._render_frame(gb)
+        overlay = self.overlay
+        if overlay is None:
+            board = frame.decode('ascii')
+        else:
+            chars = list(frame.decode('ascii'))
+            if callable(overlay):
+                for index in range(len(chars)):
+                    char = overlay(gb.tile_at_index(index), gamestate)
+                    if char is not None:
+                        chars[index] = char
+            else:
+                index_of = gb.index_of
+                for coordinate, char in overlay.items():
+                    chars[index_of(coordinate)] = char
+            board = ''.join(chars)
+        return [
+            board[row_start:row_start + width]
+            for row_start in range(0, len(board), width)
+        ]
+
+    def _render_frame(self, gb):
+        """
+        Returns a bytearray with the character of every tile, as
+        render_tile() would draw it without an overlay.
+        """
+        frame = gb.translate_tile_types(self._invisible_table)
+        visible = gb.translate_tile_types(self._visible_table)
+        for start, stop in gb.visible_ranges():
+            frame[start:stop] = visible[start:stop]
+        friendly_hill = ord(self.friendly_hill)
+        for index in gb.hill_indexes():
+            if gb.tile_is_friendly(gb.tile_at_index(index)):
+                frame[index] = friendly_hill
+        # Entities are only drawn on open, visible tiles.
+        basic = gameboard.TileType.basic
+        entity_chars = (
+            (gb.friendly_ants, ord(self.friendly_ant)),
+            (gb.enemy_ants, ord(self.enemy_ant)),
+            (gb.food, ord(self.food)),
+        )
+        for tiles, char in entity_chars:
+            for tile in tiles:
+                if tile.type == basic and gb.tile_is_visible(tile):
+                    frame[tile.index] = char
+        return frame
 
     def render_tile(self, tile, gamestate):
-        char = self.overlay(tile, gamestate)
-        if char is not None:
-            return char
+        overlay = self.overlay
+        if overlay is not None:
+            if callable(overlay):
+                char = overlay(tile, gamestate)
+            else:
+                char = overlay.get(tile.coordinate)
+            if char is not None:
+                return char
 
         char = self.visible_tile
         if tile.type == gameboard.TileType.wall:
@@ -86,3 +182,150 @@ class GameTextRenderer(object):
         elif isinstance(tile.get_entity(), gameboard.Food):
             char = self.food
         return char
+
+
+class BackgroundRenderer(object):
+    """
+    Displays frames with another renderer on a thread of its own.
+
+    display() takes a snapshot of the gamestate and returns right away. If
+    the thread is still busy with an earlier frame, only the newest frame
+    waiting for it is kept; the others are dropped.
+    """
+
+    def __init__(self, renderer):
+        self.renderer = renderer
+        self.frames_displayed = 0
+        self.frames_dropped = 0
+        self._overlay = None
+        self._pending = None
+        self._closed = False
+        self._condition = threading.Condition()
+        self._thread = threading.Thread(
+            target=self._run, name='BackgroundRenderer', daemon=True
+        )
+        self._thread.start()
+        self.logger = logging.getLogger('ants.ui.BackgroundRenderer')
+
+    def register_overlay(self, overlay):
+        """
+        Sets the overlay of the following frames. The overlay must not be
+        changed afterwards.
+        """
+        self._overlay = overlay
+
+    def display(self, gamestate):
+        frame = (gamestate.snapshot(), self._overlay)
+        with self._condition:
+            if self._pending is not None:
+                self.frames_dropped += 1
+            self._pending = frame
+            self._condition.notify()
+
+    def close(self):
+        """
+        Displays the frame still waiting, if any, and stops the thread.
+        """
+        with self._condition:
+            if self._closed:
+                return
+            self._closed = True
+            self._condition.notify()
+        self._thread.join()
+        self.logger.info(
+            'Displayed %d frames, dropped %d', self.frames_displayed,
+            self.frames_dropped
+        )
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while self._pending is None and not self._closed:
+                    self._condition.wait()
+                if self._pending is None:
+                    return
+                gamestate, overlay = self._pending
+                self._pending = None
+            self.renderer.register_overlay(overlay)
+            try:
+                self.renderer.display(gamestate)
+            except Exception:
+                self.logger.exception('Failed to display a frame')
+            self.frames_displayed += 1
+
+
+class AnsiGameRenderer(GameTextRenderer):
+    """
+    Redraws the board in place on an ANSI terminal.
+
+    The previous frame is kept, and only the cells that changed since then
+    are written, each run of them after a cursor move. Takes the same
+    characters as GameTextRenderer, and the stream to write to.
+    """
+    CLEAR_SCREEN = '\x1b[2J'
+    # Changed cells closer together than this are rewritten along with the
+    # cells between them, which is shorter than moving the cursor.
+    MIN_GAP = 6
+
+    def __init__(self, stream=None, **kwargs):
+        super().__init__(**kwargs)
+        self.stream = stream or sys.stdout
+        self._previous_lines = None
+
+    def display(self, gamestate):
+        lines = self.render(gamestate).split('\n')
+        self.stream.write(self.frame_update(lines))
+        self.stream.flush()
+
+    def reset(self):
+        """
+        Makes the next frame redraw the whole screen.
+        """
+        self._previous_lines = None
+
+    def frame_update(self, lines):
+        """
+        Returns the terminal output that turns the previous frame into
+        lines, and keeps lines as the previous frame.
+        """
+        previous_lines = self._previous_lines
+        self._previous_lines = lines
+        if previous_lines is None or len(previous_lines) != len(lines):
+            return (
+                self.CLEAR_SCREEN + self._move_to(0, 0) + '\n'.join(lines) +
+                '\n'
+            )
+        output = []
+        for row, (previous, line) in enumerate(zip(previous_lines, lines)):
+            if previous == line:
+                continue
+            if len(previous) != len(line):
+                output.append(self._move_to(row, 0) + line + '\x1b[K')
+                continue
+            for start, stop in self._changed_runs(previous, line):
+                output.append(self._move_to(row, start) + line[start:stop])
+        output.append(self._move_to(len(lines), 0))
+        return ''.join(output)
+
+    def _changed_runs(self, previous, line):
+        """
+        Yields (start, stop) column ranges covering the characters in which
+        line differs from previous, a line of the same length.
+        """
+        start = None
+        stop = None
+        for column, (old, new) in enumerate(zip(previous, line)):
+            if old == new:
+                continue
+            if start is None:
+                start = column
+            elif column - stop >= self.MIN_GAP:
+                yield start, stop
+                start = column
+            stop = column + 1
+        if start is not None:
+            yield start, stop
+
+    @staticmethod
+    def _move_to(row, column):
+        return '\x1b[{0};{1}H'.format(row + 1, column + 1)
@@ -0,0 +1,117 @@
+from array import array
+from collections import Counter
+import copy
+import logging
+
+import gridutils
+
+
+class VisibilityMap(object):
+    """
+    Tracks which tiles of a width x height board can be seen by a set of
+    viewers, each of which sees a filled circle of radius view_distance.
+
+    Every tile stores the number of viewers that can see it. Updating the
+    map only touches the tiles around viewers that moved, appeared or
+    disappeared since the previous update.
+    """
+
+    def __init__(self, width, height, view_distance):
+        self.width = width
+        self.height = height
+        self.view_distance = view_distance
+        self._row_spans = gridutils.get_circle_row_spans(view_distance)
+        self._counts = array('I', (0, )) * (width * height)
+        self._ones = int.from_bytes(b'\x01' * (width * height), 'little')
+        self._viewers = Counter()
+        self.logger = logging.getLogger('ants.visibility.VisibilityMap')
+
+    def update(self, viewer_indexes):
+        """
+        Sets the viewers to the tiles at viewer_indexes.
+        """
+        viewers = Counter(viewer_indexes)
+        previous_viewers = self._viewers
+        stamped = 0
+        for index, count in previous_viewers.items():
+            delta = viewers.get(index, 0) - count
+            if delta != 0:
+                self._stamp(index, delta)
+                stamped += 1
+        for index, count in viewers.items():
+            if index not in previous_viewers:
+                self._stamp(index, count)
+                stamped += 1
+        self._viewers = viewers
+        self.logger.debug('Restamped %d viewer positions', stamped)
+
+    def copy(self):
+        visibility = copy.copy(self)
+        visibility._counts = self._counts[:]
+        visibility._viewers = Counter(self._viewers)
+        return visibility
+
+    def is_visible(self, index):
+        return self._counts[index] > 0
+
+    def visible_bytes(self):
+        """
+        Returns a bytes object with a byte for every tile, 1 if it is
+        visible and 0 otherwise.
+        """
+        counts = self._counts
+        raw = counts.tobytes()
+        step = counts.itemsize
+        # A tile is visible if any byte of its count is set. Those bytes are
+        # ORed together, then the bits of every byte onto its lowest bit.
+        lanes = 0
+        for offset in range(step):
+            lanes |= int.from_bytes(raw[offset::step], 'little')
+        lanes |= lanes >> 4
+        lanes |= lanes >> 2
+        lanes |= lanes >> 1
+        return (lanes & self._ones).to_bytes(len(counts), 'little')
+
+    def visible_ranges(self):
+        """
+        Yields (start, stop) ranges of tile indexes which together cover
+        every visible tile. Ranges may overlap.
+        """
+        width = self.width
+        height = self.height
+        for index in self._viewers:
+            center_x = index % width
+            center_y = index // width
+            for y_offset, x_offset_min, x_offset_max in self._row_spans:
+                row_start = ((center_y + y_offset) % height) * width
+                if x_offset_max - x_offset_min + 1 >= width:
+                    yield row_start, row_start + width
+                    continue
+                x_min = (center_x + x_offset_min) % width
+                x_max = (center_x + x_offset_max) % width
+                if x_min <= x_max:
+                    yield row_start + x_min, row_start + x_max + 1
+                else:
+                    yield row_start + x_min, row_start + width
+                    yield row_start, row_start + x_max + 1
+
+    def _stamp(self, index, delta):
+        """
+        Adds delta to the viewer count of every tile in the circle centered
+        on index, wrapping around the edges of the board.
+        """
+        counts = self._counts
+        width = self.width
+        height = self.height
+        center_x = index % width
+        center_y = index // width
+        for y_offset, x_offset_min, x_offset_max in self._row_spans:
+            row_start = ((center_y + y_offset) % height) * width
+            x_min = center_x + x_offset_min
+            x_max = center_x + x_offset_max
+            if 0 <= x_min and x_max < width:
+                for i in range(row_start + x_min, row_start + x_max + 1):
+                    counts[i] += delta
+            else:
+                for x in range(x_min, x_max + 1):
+                    counts[row_start + x % width] += delta